@@ -1,24 +1,31 @@
-from fastapi import APIRouter, HTTPException, Header, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Header, UploadFile, File, Query
 from typing import List, Optional
 from models import (
     Service, ServiceCreate, ServiceUpdate,
     GalleryItem, GalleryItemCreate, GalleryItemUpdate,
-    LoginRequest, LoginResponse, ContactForm
+    LoginRequest, LoginResponse, ContactForm, ServiceReorder, BatchDelete
 )
-from auth import verify_token, create_access_token, verify_password, hash_password
-from datetime import datetime
-import base64
-import uuid
-import os
-from pathlib import Path
-from dotenv import load_dotenv
-
-# Load environment variables
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+from auth import authenticate, revoke_token, create_access_token, verify_password
+from config import get_settings
+import analytics
+import cache
+import export
+import outbox
+from image_variants import attach_variants, schedule_variants
+from pagination import CONTACT_SORT, encode_cursor, after_cursor, contact_filter, combine
+from search import query_terms, highlight_pattern, highlights
+from serialization import SERVICE_PROJECTION, GALLERY_PROJECTION, CONTACT_PROJECTION, json_response
+from datetime import date, datetime
+from fastapi.responses import StreamingResponse
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, ExecutionTimeout, PyMongoError
+import asyncio
+import logging
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
+logger = logging.getLogger(__name__)
+
 # These will be set by server.py
 db = None
 
@@ -26,19 +33,33 @@ def set_db(database):
     global db
     db = database
 
-# Admin credentials from environment
-ADMIN_EMAIL = os.environ['ADMIN_EMAIL']
-ADMIN_PASSWORD_HASH = hash_password(os.environ['ADMIN_PASSWORD'])
+def _page_limit(limit: Optional[int], default: int) -> int:
+    """Requested page size, or `default`; at most contacts_max_page_size"""
+    maximum = get_settings().contacts_max_page_size
+    if limit is None:
+        return min(default, maximum)
+    if limit > maximum:
+        raise HTTPException(status_code=422, detail=f"limit must be at most {maximum}")
+    return limit
+
+def _check_batch_size(count: int, what: str):
+    """413 when a batch endpoint gets more than max_batch_size entries"""
+    max_batch_size = get_settings().max_batch_size
+    if count > max_batch_size:
+        raise HTTPException(status_code=413, detail=f"At most {max_batch_size} {what} per batch")
 
 async def verify_admin_token(authorization: Optional[str] = Header(None)):
-    """Verify admin token from Authorization header"""
+    """Dependency verifying the admin token from the Authorization header
+
+    Tokens already verified by this worker are served from an LRU cache.
+    """
     if not authorization or not authorization.startswith('Bearer '):
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    token = authorization.replace('Bearer ', '')
-    payload = verify_token(token)
+    token = authorization[len('Bearer '):]
+    payload = await authenticate(token)
     
-    if not payload or payload.get('email') != ADMIN_EMAIL:
+    if not payload or payload.get('email') != get_settings().admin_email:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     
     return payload
@@ -48,10 +69,11 @@ async def verify_admin_token(authorization: Optional[str] = Header(None)):
 @router.post("/login", response_model=LoginResponse)
 async def login(request: LoginRequest):
     """Admin login endpoint"""
-    if request.email != ADMIN_EMAIL:
+    settings = get_settings()
+    if request.email != settings.admin_email:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if not verify_password(request.password, ADMIN_PASSWORD_HASH):
+    if not verify_password(request.password, settings.admin_password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_access_token(data={"email": request.email, "role": "admin"})
@@ -59,142 +81,351 @@ async def login(request: LoginRequest):
     return LoginResponse(token=token, email=request.email)
 
 @router.get("/verify")
-async def verify_admin(authorization: Optional[str] = Header(None)):
+async def verify_admin(admin: dict = Depends(verify_admin_token)):
     """Verify if token is valid"""
-    await verify_admin_token(authorization)
-    return {"valid": True, "email": ADMIN_EMAIL}
+    return {"valid": True, "email": get_settings().admin_email}
+
+@router.post("/logout")
+async def logout(admin: dict = Depends(verify_admin_token)):
+    """Revoke the current token in every worker"""
+    await revoke_token(admin)
+    return {"message": "Logged out"}
 
 # ==================== SERVICE ROUTES ====================
 
 @router.get("/services", response_model=List[Service])
-async def get_services(authorization: Optional[str] = Header(None)):
+async def get_services(admin: dict = Depends(verify_admin_token)):
     """Get all services"""
-    await verify_admin_token(authorization)
-    services = await db.services.find({}, {'_id': 0}).sort("order", 1).to_list(100)
-    return [Service(**service) for service in services]
+    services = await db.services.find({}, SERVICE_PROJECTION).sort("order", 1).to_list(100)
+    return json_response(await attach_variants(services, "services"))
 
 @router.post("/services", response_model=Service)
-async def create_service(service: ServiceCreate, authorization: Optional[str] = Header(None)):
+async def create_service(service: ServiceCreate, admin: dict = Depends(verify_admin_token)):
     """Create new service"""
-    await verify_admin_token(authorization)
-    
     service_dict = service.dict()
     service_obj = Service(**service_dict)
     
-    await db.services.insert_one(service_obj.dict())
-    return service_obj
+    await db.services.insert_one(service_obj.dict(exclude={"image_variants"}))
+    await cache.invalidate("services")
+    return (await attach_variants([service_obj.dict()], "services"))[0]
 
-@router.put("/services/{service_id}", response_model=Service)
-async def update_service(service_id: str, service: ServiceUpdate, authorization: Optional[str] = Header(None)):
-    """Update service"""
-    await verify_admin_token(authorization)
+@router.put("/services/reorder")
+async def reorder_services(reorder: ServiceReorder, admin: dict = Depends(verify_admin_token)):
+    """Apply a new display order to services in one bulk write"""
+    if len(set(reorder.ids)) != len(reorder.ids):
+        raise HTTPException(status_code=400, detail="Duplicate service ids")
+    if not reorder.ids:
+        return {"matched": 0, "modified": 0}
     
-    existing = await db.services.find_one({"id": service_id})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Service not found")
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne({"id": service_id}, {"$set": {"order": position, "updated_at": now}})
+        for position, service_id in enumerate(reorder.ids, start=1)
+    ]
+    result = await db.services.bulk_write(operations, ordered=False)
+    await cache.invalidate("services")
     
+    return {"matched": result.matched_count, "modified": result.modified_count}
+
+@router.put("/services/{service_id}", response_model=Service)
+async def update_service(service_id: str, service: ServiceUpdate, admin: dict = Depends(verify_admin_token)):
+    """Update service"""
     update_data = {k: v for k, v in service.dict().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow()
     
-    await db.services.update_one({"id": service_id}, {"$set": update_data})
+    updated = await db.services.find_one_and_update(
+        {"id": service_id}, {"$set": update_data},
+        projection={'_id': 0}, return_document=ReturnDocument.AFTER
+    )
+    if not updated:
+        raise HTTPException(status_code=404, detail="Service not found")
     
-    updated = await db.services.find_one({"id": service_id})
-    return Service(**updated)
+    await cache.invalidate("services")
+    return Service(**(await attach_variants([updated], "services"))[0])
 
 @router.delete("/services/{service_id}")
-async def delete_service(service_id: str, authorization: Optional[str] = Header(None)):
+async def delete_service(service_id: str, admin: dict = Depends(verify_admin_token)):
     """Delete service"""
-    await verify_admin_token(authorization)
-    
     result = await db.services.delete_one({"id": service_id})
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Service not found")
     
+    await cache.invalidate("services")
     return {"message": "Service deleted successfully"}
 
 # ==================== GALLERY ROUTES ====================
 
 @router.get("/gallery", response_model=List[GalleryItem])
-async def get_gallery(authorization: Optional[str] = Header(None)):
+async def get_gallery(admin: dict = Depends(verify_admin_token)):
     """Get all gallery items"""
-    await verify_admin_token(authorization)
-    items = await db.gallery.find({}, {'_id': 0}).sort("created_at", -1).to_list(100)
-    return [GalleryItem(**item) for item in items]
+    items = await db.gallery.find({}, GALLERY_PROJECTION).sort("created_at", -1).to_list(100)
+    return json_response(await attach_variants(items, "gallery"))
 
 @router.post("/gallery", response_model=GalleryItem)
-async def create_gallery_item(item: GalleryItemCreate, authorization: Optional[str] = Header(None)):
+async def create_gallery_item(item: GalleryItemCreate, admin: dict = Depends(verify_admin_token)):
     """Create new gallery item"""
-    await verify_admin_token(authorization)
-    
     item_dict = item.dict()
     gallery_obj = GalleryItem(**item_dict)
     
-    await db.gallery.insert_one(gallery_obj.dict())
-    return gallery_obj
+    await db.gallery.insert_one(gallery_obj.dict(exclude={"image_variants"}))
+    await cache.invalidate("gallery")
+    return (await attach_variants([gallery_obj.dict()], "gallery"))[0]
 
 @router.put("/gallery/{item_id}", response_model=GalleryItem)
-async def update_gallery_item(item_id: str, item: GalleryItemUpdate, authorization: Optional[str] = Header(None)):
+async def update_gallery_item(item_id: str, item: GalleryItemUpdate, admin: dict = Depends(verify_admin_token)):
     """Update gallery item"""
-    await verify_admin_token(authorization)
-    
-    existing = await db.gallery.find_one({"id": item_id})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Gallery item not found")
-    
     update_data = {k: v for k, v in item.dict().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow()
     
-    await db.gallery.update_one({"id": item_id}, {"$set": update_data})
+    updated = await db.gallery.find_one_and_update(
+        {"id": item_id}, {"$set": update_data},
+        projection={'_id': 0}, return_document=ReturnDocument.AFTER
+    )
+    if not updated:
+        raise HTTPException(status_code=404, detail="Gallery item not found")
     
-    updated = await db.gallery.find_one({"id": item_id})
-    return GalleryItem(**updated)
+    await cache.invalidate("gallery")
+    return GalleryItem(**(await attach_variants([updated], "gallery"))[0])
 
 @router.delete("/gallery/{item_id}")
-async def delete_gallery_item(item_id: str, authorization: Optional[str] = Header(None)):
+async def delete_gallery_item(item_id: str, admin: dict = Depends(verify_admin_token)):
     """Delete gallery item"""
-    await verify_admin_token(authorization)
-    
     result = await db.gallery.delete_one({"id": item_id})
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Gallery item not found")
     
+    await cache.invalidate("gallery")
     return {"message": "Gallery item deleted successfully"}
 
+@router.post("/gallery/batch")
+async def create_gallery_items(items: List[GalleryItemCreate], admin: dict = Depends(verify_admin_token)):
+    """Create many gallery items in one insert_many, with a result per item"""
+    _check_batch_size(len(items), "items")
+    
+    gallery_objs = [GalleryItem(**item.dict()) for item in items]
+    errors = {}
+    if gallery_objs:
+        try:
+            await db.gallery.insert_many(
+                [obj.dict(exclude={"image_variants"}) for obj in gallery_objs], ordered=False
+            )
+        except BulkWriteError as e:
+            errors = {error["index"]: error.get("errmsg", "Write error") for error in e.details.get("writeErrors", [])}
+        await cache.invalidate("gallery")
+    
+    results = []
+    for index, item in enumerate(await attach_variants([obj.dict() for obj in gallery_objs], "gallery")):
+        if index in errors:
+            results.append({"index": index, "ok": False, "error": errors[index]})
+        else:
+            results.append({"index": index, "ok": True, "item": item})
+    
+    return {"created": len(gallery_objs) - len(errors), "results": results}
+
+@router.post("/gallery/batch-delete")
+async def delete_gallery_items(batch: BatchDelete, admin: dict = Depends(verify_admin_token)):
+    """Delete many gallery items in one delete_many, with a result per id"""
+    _check_batch_size(len(batch.ids), "ids")
+    
+    existing = await db.gallery.find({"id": {"$in": batch.ids}}, {"_id": 0, "id": 1}).to_list(None)
+    existing_ids = {item["id"] for item in existing}
+    
+    deleted = 0
+    if existing_ids:
+        result = await db.gallery.delete_many({"id": {"$in": list(existing_ids)}})
+        deleted = result.deleted_count
+        await cache.invalidate("gallery")
+    
+    results = [{"id": item_id, "deleted": item_id in existing_ids} for item_id in batch.ids]
+    return {"deleted": deleted, "results": results}
+
 # ==================== CONTACT FORMS ====================
 
 @router.get("/contacts", response_model=List[ContactForm])
-async def get_contacts(authorization: Optional[str] = Header(None)):
-    """Get all contact form submissions"""
-    await verify_admin_token(authorization)
-    contacts = await db.contacts.find({}, {'_id': 0}).sort("created_at", -1).to_list(100)
-    return [ContactForm(**contact) for contact in contacts]
+async def get_contacts(
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    subject: Optional[str] = None,
+    postalCode: Optional[str] = None,
+    admin: dict = Depends(verify_admin_token)
+):
+    """Get one page of contact form submissions, newest first
+
+    Pass the X-Next-Cursor header of a response as `cursor` to get the next page.
+    """
+    limit = _page_limit(limit, get_settings().contacts_page_size)
+    query = contact_filter(date_from, date_to, subject, postalCode)
+    try:
+        page_query = combine(query, after_cursor(cursor)) if cursor else query
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    contacts = await db.contacts.find(page_query, CONTACT_PROJECTION).sort(CONTACT_SORT).limit(limit).to_list(limit)
+    
+    if query:
+        total = await db.contacts.count_documents(query)
+    else:
+        total = await db.contacts.estimated_document_count()
+    headers = {"X-Total-Count": str(total)}
+    if len(contacts) == limit:
+        last = contacts[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last["created_at"], last["id"])
+    
+    return json_response(contacts, headers=headers)
+
+@router.get("/contacts/search")
+async def search_contacts(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: Optional[int] = Query(None, ge=1),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    subject: Optional[str] = None,
+    postalCode: Optional[str] = None,
+    admin: dict = Depends(verify_admin_token)
+):
+    """Full-text search over name, email, subject and message, best matches first
+
+    Supports "exact phrases" and -excluded words. Each result carries its `score`
+    and `highlights`: character ranges [start, end) of the matches per field.
+    """
+    settings = get_settings()
+    limit = _page_limit(limit, settings.contact_search_limit)
+    query = combine({"$text": {"$search": q}}, contact_filter(date_from, date_to, subject, postalCode))
+    score = {"$meta": "textScore"}
+    try:
+        contacts = await db.contacts.find(query, {**CONTACT_PROJECTION, "score": score}) \
+            .sort([("score", score), ("created_at", -1)]) \
+            .limit(limit) \
+            .max_time_ms(settings.contact_search_max_time_ms) \
+            .to_list(limit)
+    except ExecutionTimeout:
+        raise HTTPException(status_code=504, detail="Search took too long, please narrow it down")
+    
+    pattern = highlight_pattern(query_terms(q))
+    for contact in contacts:
+        contact["highlights"] = highlights(contact, pattern)
+    return json_response(contacts)
+
+@router.get("/contacts/export")
+async def export_contacts(
+    format: str = Query(export.CSV, pattern="^(csv|ndjson)$"),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    subject: Optional[str] = None,
+    postalCode: Optional[str] = None,
+    admin: dict = Depends(verify_admin_token)
+):
+    """Stream every matching contact submission as CSV or NDJSON, oldest first
+
+    Rows are read from a batched cursor and sent as they are encoded, so memory
+    stays flat whatever the size of the export.
+    """
+    batch_size = get_settings().contacts_export_batch_size
+    query = contact_filter(date_from, date_to, subject, postalCode)
+    fields = [field for field in CONTACT_PROJECTION if field != "_id"]
+    cursor = db.contacts.find(query, CONTACT_PROJECTION) \
+        .sort([(key, 1) for key, _ in CONTACT_SORT]) \
+        .batch_size(batch_size)
+    
+    filename = f"contacts-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    return StreamingResponse(
+        export.stream(cursor, fields, format, batch_size),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 @router.delete("/contacts/{contact_id}")
-async def delete_contact(contact_id: str, authorization: Optional[str] = Header(None)):
+async def delete_contact(contact_id: str, admin: dict = Depends(verify_admin_token)):
     """Delete contact form submission"""
-    await verify_admin_token(authorization)
-    
-    result = await db.contacts.delete_one({"id": contact_id})
+    deleted = await db.contacts.find_one_and_delete(
+        {"id": contact_id}, projection={"_id": 0, "created_at": 1, "postalCode": 1, "subject": 1}
+    )
     
-    if result.deleted_count == 0:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Contact not found")
     
+    # The delete stands either way; the backfill command can recount
+    try:
+        await analytics.record_contact(deleted, amount=-1)
+    except PyMongoError as e:
+        logger.error(f"Failed to update contact rollups: {str(e)}")
+    
     return {"message": "Contact deleted successfully"}
 
+# ==================== ANALYTICS ====================
+
+@router.get("/analytics")
+async def get_analytics(
+    period: str = Query("day", pattern="^(day|week|month)$"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    admin: dict = Depends(verify_admin_token)
+):
+    """Leads per day, week or month with region and subject breakdowns, read from the rollups
+
+    Defaults to the last 30 days, 12 weeks or 12 months.
+    """
+    default_from, default_to = analytics.default_range(period, analytics.local_day(datetime.utcnow()))
+    return await analytics.read_rollups(period, date_from or default_from, date_to or default_to)
+
+# ==================== EMAIL OUTBOX ====================
+
+@router.get("/outbox")
+async def get_outbox(admin: dict = Depends(verify_admin_token)):
+    """Get email outbox queue depth and recent failures"""
+    return await outbox.stats()
+
+@router.post("/outbox/{job_id}/retry")
+async def retry_outbox_job(job_id: str, admin: dict = Depends(verify_admin_token)):
+    """Requeue a dead-lettered email"""
+    if not await outbox.retry(job_id):
+        raise HTTPException(status_code=404, detail="Dead outbox job not found")
+    
+    return {"message": "Email requeued"}
+
 # ==================== IMAGE UPLOAD ====================
 
+async def _store_upload(file: UploadFile) -> str:
+    """Save one upload and start its variants, raising HTTPException on failure"""
+    from file_upload import save_upload_file, UploadTooLargeError, UnsupportedFileTypeError
+    
+    try:
+        # Stream file to disk and get its content-addressed URL
+        file_url = await save_upload_file(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedFileTypeError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
+    
+    # Resized WebP/AVIF copies are rendered in the background
+    schedule_variants(file_url)
+    return file_url
+
 @router.post("/upload-image")
-async def upload_image(file: UploadFile = File(...), authorization: Optional[str] = Header(None)):
+async def upload_image(file: UploadFile = File(...), admin: dict = Depends(verify_admin_token)):
     """Upload image and return URL"""
-    await verify_admin_token(authorization)
+    file_url = await _store_upload(file)
+    return {"url": file_url, "filename": file.filename}
+
+@router.post("/upload-images")
+async def upload_images(files: List[UploadFile] = File(...), admin: dict = Depends(verify_admin_token)):
+    """Upload many images concurrently, with a result per file"""
+    _check_batch_size(len(files), "files")
     
-    from file_upload import save_upload_file
+    slots = asyncio.Semaphore(get_settings().upload_concurrency)
     
-    try:
-        # Save file and get URL
-        file_url = save_upload_file(file)
-        return {"url": file_url, "filename": file.filename}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
\ No newline at end of file
+    async def store(file: UploadFile) -> dict:
+        async with slots:
+            try:
+                return {"filename": file.filename, "ok": True, "url": await _store_upload(file)}
+            except HTTPException as e:
+                return {"filename": file.filename, "ok": False, "status": e.status_code, "error": e.detail}
+    
+    results = await asyncio.gather(*(store(file) for file in files))
+    return {"uploaded": sum(1 for result in results if result["ok"]), "results": results}
\ No newline at end of file
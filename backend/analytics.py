@@ -0,0 +1,205 @@
+import logging
+import re
+import unicodedata
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+from zoneinfo import ZoneInfo
+
+from pymongo import ReplaceOne, UpdateOne
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS_COLLECTION = "contact_rollups"
+PERIODS = ("day", "week", "month")
+
+# Longest subject label kept; subjects are free text
+SUBJECT_KEY_LENGTH = 40
+UNKNOWN = "inconnu"
+
+# Belgian postal code ranges -> province (Brussels counted on its own)
+POSTAL_REGIONS = (
+    (1000, 1299, "bruxelles"),
+    (1300, 1499, "brabant-wallon"),
+    (1500, 1999, "brabant-flamand"),
+    (2000, 2999, "anvers"),
+    (3000, 3499, "brabant-flamand"),
+    (3500, 3999, "limbourg"),
+    (4000, 4999, "liege"),
+    (5000, 5999, "namur"),
+    (6000, 6599, "hainaut"),
+    (6600, 6999, "luxembourg"),
+    (7000, 7999, "hainaut"),
+    (8000, 8999, "flandre-occidentale"),
+    (9000, 9999, "flandre-orientale"),
+)
+
+# These will be set by server.py
+db = None
+
+def set_db(database):
+    global db
+    db = database
+
+
+def postal_region(postal_code: Optional[str]) -> str:
+    """Province of a Belgian postal code, `inconnu` when it is not one"""
+    digits = re.sub(r'\D', '', postal_code or '')
+    if len(digits) != 4:
+        return UNKNOWN
+    code = int(digits)
+    for low, high, region in POSTAL_REGIONS:
+        if low <= code <= high:
+            return region
+    return UNKNOWN
+
+
+def subject_key(subject: Optional[str]) -> str:
+    """Subject folded to a stable label that is also a valid Mongo field name"""
+    folded = unicodedata.normalize('NFKD', subject or '').encode('ascii', 'ignore').decode().lower()
+    folded = re.sub(r'[^a-z0-9]+', ' ', folded).strip()
+    return folded[:SUBJECT_KEY_LENGTH].strip() or UNKNOWN
+
+
+def bucket_key(period: str, day: date) -> str:
+    """Sortable label of the day, ISO week or month containing `day`"""
+    if period == "day":
+        return day.isoformat()
+    if period == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return f"{day.year}-{day.month:02d}"
+
+
+def local_day(created_at: datetime) -> date:
+    # Stored datetimes are naive UTC
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    # Buckets follow the Belgian calendar day (analytics_timezone), not UTC
+    return created_at.astimezone(ZoneInfo(get_settings().analytics_timezone)).date()
+
+
+def contact_increments(contact: dict, amount: int = 1) -> Dict[str, Dict[str, int]]:
+    """Bucket id -> counter increments contributed by one contact"""
+    day = local_day(contact["created_at"])
+    counters = {
+        "total": amount,
+        f"by_region.{postal_region(contact.get('postalCode'))}": amount,
+        f"by_subject.{subject_key(contact.get('subject'))}": amount,
+    }
+    return {f"{period}:{bucket_key(period, day)}": counters for period in PERIODS}
+
+
+def _bucket_fields(bucket_id: str) -> dict:
+    period, key = bucket_id.split(":", 1)
+    return {"period": period, "key": key}
+
+
+async def record_contact(contact: dict, amount: int = 1):
+    """Count a submission in its day, week and month buckets, in one bulk write
+
+    Pass amount=-1 when a submission is deleted, so the rollups keep matching a rebuild.
+    """
+    requests = [
+        UpdateOne({"_id": bucket_id}, {"$inc": counters, "$setOnInsert": _bucket_fields(bucket_id)}, upsert=True)
+        for bucket_id, counters in contact_increments(contact, amount).items()
+    ]
+    await db[ROLLUPS_COLLECTION].bulk_write(requests, ordered=False)
+
+
+async def rebuild(batch_size: int = 5000, dry_run: bool = False) -> Dict[str, dict]:
+    """Recount every bucket from the contacts collection and return them by id
+
+    Contacts are read in batches along the (created_at, id) index and counted in
+    memory, then every bucket is replaced at once. A submission arriving between
+    the last batch and the write may be missed; run it again if that matters.
+    """
+    buckets: Dict[str, dict] = {}
+    last = None
+    projection = {"_id": 0, "id": 1, "created_at": 1, "postalCode": 1, "subject": 1}
+    while True:
+        query = {}
+        if last is not None:
+            query = {"$or": [
+                {"created_at": {"$gt": last["created_at"]}},
+                {"created_at": last["created_at"], "id": {"$gt": last["id"]}},
+            ]}
+        batch = await db.contacts.find(query, projection).sort([("created_at", 1), ("id", 1)]) \
+            .limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        for contact in batch:
+            for bucket_id, counters in contact_increments(contact).items():
+                bucket = buckets.setdefault(bucket_id, {**_bucket_fields(bucket_id), "total": 0, "by_region": {}, "by_subject": {}})
+                for field, amount in counters.items():
+                    if "." in field:
+                        group, name = field.split(".", 1)
+                        bucket[group][name] = bucket[group].get(name, 0) + amount
+                    else:
+                        bucket[field] += amount
+        last = batch[-1]
+        logger.info(f"Counted contacts up to {last['created_at'].isoformat()}")
+
+    if dry_run:
+        return buckets
+
+    requests = [ReplaceOne({"_id": bucket_id}, bucket, upsert=True) for bucket_id, bucket in buckets.items()]
+    for start in range(0, len(requests), batch_size):
+        await db[ROLLUPS_COLLECTION].bulk_write(requests[start:start + batch_size], ordered=False)
+    # Buckets whose contacts were all deleted
+    await db[ROLLUPS_COLLECTION].delete_many({"_id": {"$nin": list(buckets)}})
+    return buckets
+
+
+def default_range(period: str, today: date) -> tuple:
+    """30 days, 12 weeks or 12 months up to today"""
+    if period == "day":
+        return today - timedelta(days=29), today
+    if period == "week":
+        return today - timedelta(weeks=11), today
+    month = today.month - 11
+    return date(today.year + (month - 1) // 12, (month - 1) % 12 + 1, 1), today
+
+
+def _nonzero(counts: Dict[str, int]) -> Dict[str, int]:
+    # Deletions leave zero counters behind
+    return {name: count for name, count in counts.items() if count}
+
+
+def _merge(totals: Dict[str, int], counts: Dict[str, int]):
+    for name, count in counts.items():
+        totals[name] = totals.get(name, 0) + count
+
+
+def summarize(period: str, buckets: Iterable[dict]) -> dict:
+    """Response shape of the analytics endpoint: the series plus totals over it"""
+    series: List[dict] = []
+    by_region: Dict[str, int] = {}
+    by_subject: Dict[str, int] = {}
+    for bucket in buckets:
+        entry = {
+            "key": bucket["key"],
+            "total": bucket.get("total", 0),
+            "by_region": _nonzero(bucket.get("by_region", {})),
+            "by_subject": _nonzero(bucket.get("by_subject", {})),
+        }
+        series.append(entry)
+        _merge(by_region, entry["by_region"])
+        _merge(by_subject, entry["by_subject"])
+    return {
+        "period": period,
+        "total": sum(bucket["total"] for bucket in series),
+        "series": series,
+        "by_region": dict(sorted(by_region.items(), key=lambda item: -item[1])),
+        "by_subject": dict(sorted(by_subject.items(), key=lambda item: -item[1])),
+    }
+
+
+async def read_rollups(period: str, date_from: date, date_to: date) -> dict:
+    """Buckets of one period between two days, read from the rollups only"""
+    cursor = db[ROLLUPS_COLLECTION].find(
+        {"period": period, "key": {"$gte": bucket_key(period, date_from), "$lte": bucket_key(period, date_to)}},
+        {"_id": 0},
+    ).sort("key", 1)
+    return summarize(period, await cursor.to_list(None))
@@ -1,19 +1,27 @@
 import jwt
 import hashlib
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
-import os
-from pathlib import Path
-from dotenv import load_dotenv
 
-# Load environment variables
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+import cache
+import config
 
-SECRET_KEY = os.environ['JWT_SECRET_KEY']
 ALGORITHM = 'HS256'
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
 
+# Revoked token ids (jti), shared by all workers; entries expire with the token
+REVOKED_COLLECTION = "revoked_tokens"
+
+# These will be set by server.py
+db = None
+
+def set_db(database):
+    global db
+    db = database
+
 def hash_password(password: str) -> str:
     """Hash password using SHA256"""
     return hashlib.sha256(password.encode()).hexdigest()
@@ -31,15 +39,119 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.setdefault("jti", uuid.uuid4().hex)
+    encoded_jwt = jwt.encode(to_encode, config.get_settings().jwt_secret_key, algorithm=ALGORITHM)
     return encoded_jwt
 
 def verify_token(token: str) -> Optional[dict]:
     """Verify JWT token"""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, config.get_settings().jwt_secret_key, algorithms=[ALGORITHM])
         return payload
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
-        return None
\ No newline at end of file
+        return None
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of tokens whose signature was already verified
+
+    Each entry is dropped once the token's `exp` has passed.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def get(self, token: str) -> Optional[dict]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        payload, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return payload
+
+    def put(self, token: str, payload: dict):
+        self._entries[token] = (payload, payload.get('exp', 0))
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_token_cache: Optional[VerifiedTokenCache] = None
+
+def get_token_cache() -> VerifiedTokenCache:
+    """This worker's verified-token cache, sized from the settings on first use"""
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = VerifiedTokenCache(config.get_settings().token_cache_size)
+    return _token_cache
+
+def set_token_cache(token_cache: Optional[VerifiedTokenCache]):
+    """Replace the cache; None rebuilds it from the settings on next use"""
+    global _token_cache
+    _token_cache = token_cache
+
+def verify_token_cached(token: str) -> Optional[dict]:
+    """Verify JWT token, skipping the signature check for tokens seen before"""
+    token_cache = get_token_cache()
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = verify_token(token)
+        if payload is not None:
+            token_cache.put(token, payload)
+    return payload
+
+# ==================== REVOCATION ====================
+
+_revoked = set()
+_revoked_loaded = False
+
+def _revocations_changed():
+    global _revoked_loaded
+    _revoked_loaded = False
+
+# Another worker revoking a token bumps the shared version and lands here
+cache.subscribe(REVOKED_COLLECTION, _revocations_changed)
+
+async def load_revocations():
+    """Load the ids of revoked, not yet expired tokens"""
+    global _revoked, _revoked_loaded
+    # Flag first so a revocation arriving during the query triggers another reload
+    _revoked_loaded = True
+    cursor = db[REVOKED_COLLECTION].find({"exp": {"$gt": datetime.utcnow()}}, {"_id": 0, "jti": 1})
+    _revoked = {doc["jti"] async for doc in cursor}
+
+async def revoke_token(payload: dict):
+    """Revoke a verified token in every worker"""
+    jti = payload.get("jti")
+    if not jti:
+        return
+    await db[REVOKED_COLLECTION].update_one(
+        {"jti": jti},
+        {"$setOnInsert": {"jti": jti, "exp": datetime.utcfromtimestamp(payload["exp"]), "revoked_at": datetime.utcnow()}},
+        upsert=True,
+    )
+    _revoked.add(jti)
+    await cache.invalidate(REVOKED_COLLECTION)
+
+async def authenticate(token: str) -> Optional[dict]:
+    """Verify a token and check it has not been revoked"""
+    payload = verify_token_cached(token)
+    if payload is None:
+        return None
+    if not _revoked_loaded:
+        await load_revocations()
+    if payload.get("jti") in _revoked:
+        return None
+    return payload
@@ -0,0 +1,35 @@
+import argparse
+import asyncio
+import logging
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import analytics
+from config import get_settings
+
+settings = get_settings()
+client = AsyncIOMotorClient(settings.mongo_url, **settings.mongo_client_options())
+db = client[settings.db_name]
+analytics.set_db(db)
+
+
+async def main(args):
+    buckets = await analytics.rebuild(batch_size=args.batch_size, dry_run=args.dry_run)
+    months = sorted((b for b in buckets.values() if b["period"] == "month"), key=lambda b: b["key"])
+    for bucket in months:
+        print(f"  {bucket['key']}: {bucket['total']} contacts")
+    verb = "Would write" if args.dry_run else "Rebuilt"
+    print(f"{verb} {len(buckets)} buckets from {sum(b['total'] for b in months)} contacts")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the contact analytics rollups from the contacts collection")
+    parser.add_argument("--batch-size", type=int, default=5000, help="contacts read per query")
+    parser.add_argument("--dry-run", action="store_true", help="count without writing the rollups")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    try:
+        sys.exit(asyncio.run(main(args)))
+    finally:
+        client.close()
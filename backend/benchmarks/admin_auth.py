@@ -0,0 +1,34 @@
+"""Per-request cost of admin token verification, before and after the verified-token cache
+
+Run from backend/:  python -m benchmarks.admin_auth [--iterations 100000]
+"""
+import argparse
+import timeit
+
+import config
+from auth import create_access_token, verify_token, verify_token_cached, get_token_cache
+
+config.configure(config.Settings(
+    mongo_url="mongodb://localhost:27017", db_name="benchmark", admin_email="admin@example.com",
+    admin_password_hash="", jwt_secret_key="benchmark-secret",
+))
+
+
+def main(args):
+    token = create_access_token(data={"email": "admin@example.com", "role": "admin"})
+    get_token_cache().clear()
+    verify_token_cached(token)
+
+    results = {
+        "jwt.decode on every request (before)": timeit.timeit(lambda: verify_token(token), number=args.iterations),
+        "verified-token cache hit (after)": timeit.timeit(lambda: verify_token_cached(token), number=args.iterations),
+    }
+    print(f"{args.iterations} verifications")
+    for label, seconds in results.items():
+        print(f"  {label:<40} {seconds / args.iterations * 1e6:>8.2f} us/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100000)
+    main(parser.parse_args())
@@ -0,0 +1,395 @@
+"""Load test the whole backend with realistic request mixes
+
+Starts server.py under uvicorn in a subprocess, against a local Mongo (or an
+in-memory stand-in) and a fake Resend endpoint, drives a weighted workload and
+saves throughput and latency percentiles as JSON.
+
+Run from backend/:
+    python -m benchmarks.load run [--workload mixed] [--duration 30] [--concurrency 16] [--mongo-url mock]
+    python -m benchmarks.load compare before.json after.json [--threshold 10]
+
+--mongo-url mock (the default) needs mongomock-motor; pass a real URL such as
+mongodb://localhost:27017 for numbers that include the database. Each run uses
+a fresh database, and the same --seed replays the same request sequence.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+ADMIN_EMAIL = "bench@example.com"
+ADMIN_PASSWORD = "bench-password"
+
+# Operation weights per workload
+WORKLOADS = {
+    "homepage": {"homepage": 1},
+    "contact": {"contact": 1},
+    "admin": {"admin_crud": 3, "admin_contacts": 1, "upload": 1},
+    "mixed": {"homepage": 80, "contact": 8, "admin_crud": 6, "admin_contacts": 3, "upload": 3},
+}
+
+
+# ==================== FAKE RESEND ====================
+
+class FakeResend(BaseHTTPRequestHandler):
+    """Accepts every email after `latency` seconds, like the Resend API would"""
+
+    latency = 0.0
+    received = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("content-length", 0)))
+        time.sleep(self.latency)
+        with self.lock:
+            FakeResend.received += 1
+            body = json.dumps({"id": f"bench-{FakeResend.received}"}).encode()
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_resend(latency: float) -> ThreadingHTTPServer:
+    FakeResend.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeResend)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ==================== SERVER ====================
+
+def serve(args):
+    """Entry point of the server subprocess"""
+    if args.mongo_url == "mock":
+        import mongomock_motor
+        import motor.motor_asyncio
+        motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+    import uvicorn
+    import server
+    uvicorn.run(server.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, resend_url: str, port: int, uploads_dir: str, log) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "MONGO_URL": "mongodb://localhost:27017" if args.mongo_url == "mock" else args.mongo_url,
+        "DB_NAME": f"bench_{uuid.uuid4().hex[:8]}",
+        "ADMIN_EMAIL": ADMIN_EMAIL,
+        "ADMIN_PASSWORD": ADMIN_PASSWORD,
+        "JWT_SECRET_KEY": "bench-secret",
+        "RESEND_API_KEY": "re_bench",
+        "RESEND_API_URL": resend_url,
+        # Every request comes from one address; the limiter would otherwise reject most contact submits
+        "CONTACT_IP_BURST": "1000000",
+        "CONTACT_EMAIL_BURST": "1000000",
+        # Uploaded benchmark images stay out of the repository's uploads directory
+        "UPLOADS_DIR": uploads_dir,
+        # Seeded documents point at example.com; the mirror job would fetch them mid-run
+        "IMAGE_MIRROR_POLL_INTERVAL": "0",
+    }
+    command = [sys.executable, "-m", "benchmarks.load", "serve", "--port", str(port), "--mongo-url", args.mongo_url]
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if (await client.get("/health/ready")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not become ready")
+
+
+# ==================== WORKLOAD ====================
+
+def random_png(rng: random.Random) -> bytes:
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (64, 48), rng.randbytes(64 * 48 * 3)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class Workload:
+    """Issues one operation at a time and records the latency of each request"""
+
+    def __init__(self, client: httpx.AsyncClient, token: str, rng: random.Random):
+        self.client = client
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.rng = rng
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    async def request(self, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            raise
+        self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+    async def homepage(self):
+        await self.request("GET /api/site", "GET", "/api/site", headers={"Accept-Encoding": "br, gzip"})
+
+    async def contact(self):
+        await self.request("POST /api/contact", "POST", "/api/contact", json={
+            "name": f"Client {self.rng.randrange(10**6)}",
+            "email": f"client{self.rng.randrange(10**6)}@example.be",
+            "phone": "+32 470 00 00 00",
+            "postalCode": self.rng.choice(["1000", "1200", "4000", "5000", "6000", "9000"]),
+            "subject": self.rng.choice(["Débarras", "Vide maison", "Demande de devis"]),
+            "message": f"Bonjour, pourriez-vous passer la semaine prochaine ? ref {uuid.UUID(int=self.rng.getrandbits(128))}",
+        })
+
+    async def admin_crud(self):
+        created = await self.request("POST /api/admin/services", "POST", "/api/admin/services", headers=self.headers, json={
+            "title": "Service de test", "description": "Créé par le benchmark", "image": "https://example.com/a.jpg",
+            "order": self.rng.randrange(100),
+        })
+        if created.status_code != 200:
+            return
+        service_id = created.json()["id"]
+        await self.request("PUT /api/admin/services/{id}", "PUT", f"/api/admin/services/{service_id}",
+                           headers=self.headers, json={"title": "Service modifié"})
+        await self.request("GET /api/admin/services", "GET", "/api/admin/services", headers=self.headers)
+        await self.request("DELETE /api/admin/services/{id}", "DELETE", f"/api/admin/services/{service_id}",
+                           headers=self.headers)
+
+    async def admin_contacts(self):
+        await self.request("GET /api/admin/contacts", "GET", "/api/admin/contacts", headers=self.headers)
+
+    async def upload(self):
+        await self.request("POST /api/admin/upload-image", "POST", "/api/admin/upload-image", headers=self.headers,
+                           files={"file": ("bench.png", random_png(self.rng), "image/png")})
+
+
+async def seed(client: httpx.AsyncClient, token: str, services: int, gallery: int):
+    headers = {"Authorization": f"Bearer {token}"}
+    for i in range(services):
+        response = await client.post("/api/admin/services", headers=headers, json={
+            "title": f"Service {i}", "description": "Débarras et vide maison " * 8,
+            "image": f"https://example.com/service-{i}.jpg", "order": i,
+        })
+        response.raise_for_status()
+    items = [{"title": f"Réalisation {i}", "category": "debarras", "image": f"https://example.com/gallery-{i}.jpg"}
+             for i in range(gallery)]
+    if items:
+        (await client.post("/api/admin/gallery/batch", headers=headers, json=items)).raise_for_status()
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile"""
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput": len(values) / elapsed,
+        "mean_ms": sum(values) / len(values) * 1000,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": values[-1] * 1000,
+    }
+
+
+async def drive(args, base_url: str, process: subprocess.Popen) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        await wait_until_ready(client, process)
+        login = await client.post("/api/admin/login", json={"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD})
+        login.raise_for_status()
+        token = login.json()["token"]
+        await seed(client, token, args.services, args.gallery)
+
+        weights = WORKLOADS[args.workload]
+        names, cumulative = list(weights), list(weights.values())
+        workers = [Workload(client, token, random.Random(args.seed + i)) for i in range(args.concurrency)]
+
+        async def run_worker(worker: Workload, deadline: float, count: int):
+            for _ in range(count):
+                if time.perf_counter() >= deadline:
+                    return
+                operation = worker.rng.choices(names, weights=cumulative)[0]
+                try:
+                    await getattr(worker, operation)()
+                except httpx.HTTPError:
+                    pass
+
+        # Warm-up: fills caches and connection pools, not recorded
+        await asyncio.gather(*(run_worker(worker, float("inf"), args.warmup) for worker in workers))
+        for worker in workers:
+            worker.latencies.clear()
+            worker.errors.clear()
+
+        budget = args.requests // args.concurrency if args.requests else sys.maxsize
+        deadline = time.perf_counter() + (args.duration if not args.requests else float("inf"))
+        start = time.perf_counter()
+        await asyncio.gather(*(run_worker(worker, deadline, budget) for worker in workers))
+        elapsed = time.perf_counter() - start
+
+    latencies: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    for worker in workers:
+        for name, values in worker.latencies.items():
+            latencies.setdefault(name, []).extend(values)
+        for name, count in worker.errors.items():
+            errors[name] = errors.get(name, 0) + count
+
+    everything = [value for values in latencies.values() for value in values]
+    return {
+        "elapsed_s": elapsed,
+        "total": summarize(everything, sum(errors.values()), elapsed),
+        "requests": {name: summarize(values, errors.get(name, 0), elapsed) for name, values in sorted(latencies.items())},
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(result: dict):
+    print(f"{result['meta']['workload']} workload, {result['meta']['concurrency']} concurrent clients, "
+          f"{result['elapsed_s']:.1f}s, commit {result['meta']['commit']}")
+    print(f"  {'request':<34} {'count':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, stats in list(result["requests"].items()) + [("TOTAL", result["total"])]:
+        print(f"  {name:<34} {stats['requests']:>7} {stats['errors']:>5} {stats['throughput']:>8.1f} "
+              f"{stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f}")
+
+
+def run(args):
+    resend = start_fake_resend(args.resend_latency / 1000)
+    port = free_port()
+    RESULTS_DIR.mkdir(exist_ok=True)
+    uploads_dir = tempfile.mkdtemp(prefix="bench-uploads-")
+    # Server logs stay at their production level but go to a file rather than the report
+    with open(RESULTS_DIR / "server.log", "w") as log:
+        process = start_server(args, f"http://127.0.0.1:{resend.server_address[1]}", port, uploads_dir, log)
+        try:
+            result = asyncio.run(drive(args, f"http://127.0.0.1:{port}", process))
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+            resend.shutdown()
+            shutil.rmtree(uploads_dir, ignore_errors=True)
+
+    result["meta"] = {
+        "commit": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "mongo": "mock" if args.mongo_url == "mock" else "mongod",
+        "emails_sent": FakeResend.received,
+        **{key: value for key, value in vars(args).items() if key not in ("func", "mongo_url", "output")},
+    }
+    print_report(result)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{result['meta']['commit']}-{args.workload}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(f"\nSaved {output}")
+
+
+# ==================== COMPARE ====================
+
+def compare(args):
+    """Print the change of every metric between two result files; exit 1 on a regression"""
+    before = json.loads(Path(args.before).read_text())
+    after = json.loads(Path(args.after).read_text())
+    print(f"{before['meta']['commit']} -> {after['meta']['commit']} ({after['meta']['workload']} workload)")
+    print(f"  {'request':<34} {'metric':<10} {'before':>10} {'after':>10} {'change':>9}")
+
+    regressions = 0
+    rows = [(name, before["requests"][name], stats) for name, stats in after["requests"].items()
+            if name in before["requests"]]
+    rows.append(("TOTAL", before["total"], after["total"]))
+    for name, old, new in rows:
+        for metric, higher_is_better in (("throughput", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False)):
+            change = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            worse = -change if higher_is_better else change
+            flag = "  REGRESSION" if worse > args.threshold else ""
+            regressions += bool(flag)
+            print(f"  {name:<34} {metric:<10} {old[metric]:>10.2f} {new[metric]:>10.2f} {change:>+8.1f}%{flag}")
+    if regressions:
+        print(f"\n{regressions} metric(s) worse by more than {args.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(required=True)
+
+    run_parser = commands.add_parser("run", help="run a workload and save the results")
+    run_parser.add_argument("--workload", choices=sorted(WORKLOADS), default="mixed")
+    run_parser.add_argument("--duration", type=float, default=30, help="seconds to run (ignored with --requests)")
+    run_parser.add_argument("--requests", type=int, default=0, help="operations to run instead of a duration")
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--warmup", type=int, default=5, help="unrecorded operations per client first")
+    run_parser.add_argument("--services", type=int, default=8)
+    run_parser.add_argument("--gallery", type=int, default=24)
+    run_parser.add_argument("--resend-latency", type=float, default=150, help="fake Resend response time in ms")
+    run_parser.add_argument("--mongo-url", default="mock")
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--output", help="defaults to benchmarks/results/<commit>-<workload>.json")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="compare two saved results")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=10, help="percent change counted as a regression")
+    compare_parser.set_defaults(func=compare)
+
+    serve_parser = commands.add_parser("serve", help=argparse.SUPPRESS)
+    serve_parser.add_argument("--port", type=int, required=True)
+    serve_parser.add_argument("--mongo-url", default="mock")
+    serve_parser.set_defaults(func=serve)
+
+    arguments = parser.parse_args()
+    arguments.func(arguments)
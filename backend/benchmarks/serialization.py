@@ -0,0 +1,73 @@
+"""Per-item cost of the old and new admin list serialization paths
+
+Old: build ContactForm(**doc) per document, validate them again through
+response_model=List[ContactForm] and encode with jsonable_encoder + JSONResponse.
+New: encode the projected Mongo documents directly with orjson.
+
+Run from backend/:  python -m benchmarks.serialization
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from models import ContactForm
+from serialization import json_response
+
+RESPONSE_FIELD = create_response_field(name="Response_get_contacts", type_=List[ContactForm], mode="serialization")
+
+
+def make_docs(count: int) -> List[dict]:
+    now = datetime.utcnow()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Client {i}",
+            "email": f"client{i}@example.com",
+            "phone": "+32 470 00 00 00",
+            "postalCode": "1000",
+            "subject": "Demande de devis",
+            "message": "Bonjour, je souhaite vider une maison de trois chambres. " * 4,
+            "created_at": now - timedelta(minutes=i),
+        }
+        for i in range(count)
+    ]
+
+
+async def old_path(docs):
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=[ContactForm(**doc) for doc in docs])
+    return JSONResponse(content).body
+
+
+async def new_path(docs):
+    return json_response(docs).body
+
+
+async def measure(path, docs, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await path(docs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def main(args):
+    print(f"{'items':>7} {'old us/item':>12} {'new us/item':>12} {'speedup':>8}")
+    for count in (100, 1000, 10000):
+        docs = make_docs(count)
+        old = await measure(old_path, docs, args.repeat)
+        new = await measure(new_path, docs, args.repeat)
+        print(f"{count:>7} {old / count * 1e6:>12.2f} {new / count * 1e6:>12.2f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
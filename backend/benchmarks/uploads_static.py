@@ -0,0 +1,81 @@
+"""Compare the plain StaticFiles mount with UploadsStaticFiles
+
+Run from backend/:  python -m benchmarks.uploads_static [--requests 2000]
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.staticfiles import StaticFiles
+
+from static_files import UploadsStaticFiles
+
+
+def make_files(directory: str, count: int, size: int):
+    names = []
+    for i in range(count):
+        data = os.urandom(size)
+        name = f"{hashlib.sha256(data).hexdigest()}.jpg"
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(data)
+        names.append(name)
+    return names
+
+
+async def run(app, names, requests: int, concurrency: int, headers_for):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        validators = {}
+        for name in names:
+            response = await client.get(f"/api/uploads/{name}")
+            validators[name] = response.headers
+
+        slots = asyncio.Semaphore(concurrency)
+        statuses = {}
+
+        async def one(i):
+            name = names[i % len(names)]
+            async with slots:
+                response = await client.get(f"/api/uploads/{name}", headers=headers_for(validators[name]))
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                return len(response.content)
+
+        start = time.perf_counter()
+        sizes = await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, sum(sizes), statuses
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        names = make_files(directory, args.files, args.size)
+        apps = {
+            "StaticFiles": Starlette(routes=[Mount("/api/uploads", StaticFiles(directory=directory))]),
+            "UploadsStaticFiles": Starlette(routes=[Mount("/api/uploads", UploadsStaticFiles(directory=directory))]),
+        }
+        scenarios = {
+            "full fetch": lambda h: {},
+            "revalidate (If-None-Match)": lambda h: {"if-none-match": h["etag"]},
+            "range (first 64 KiB)": lambda h: {"range": "bytes=0-65535"},
+        }
+        print(f"{args.requests} requests, {args.files} files of {args.size} bytes, concurrency {args.concurrency}")
+        for scenario, headers_for in scenarios.items():
+            print(f"\n{scenario}")
+            for label, app in apps.items():
+                rate, transferred, statuses = await run(app, names, args.requests, args.concurrency, headers_for)
+                print(f"  {label:<20} {rate:>9.0f} req/s  {transferred / 1e6:>8.1f} MB  statuses={statuses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--size", type=int, default=256 * 1024)
+    parser.add_argument("--concurrency", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,257 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Request, Response
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from config import get_settings
+from serialization import dumps
+
+try:
+    import brotli
+except ImportError:
+    # Precompressed entries are then served with gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Collection holding one version counter per cached payload, shared by all workers
+VERSIONS_COLLECTION = "cache_versions"
+
+# Encodings applied once per rebuild to precompressed entries, best first
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# These will be set by server.py
+db = None
+
+def set_db(database):
+    global db
+    db = database
+
+
+class CacheEntry:
+    """Serialized payload together with its validators and any precompressed encodings"""
+
+    def __init__(self, body: bytes, version: Tuple[int, ...], updated_at: datetime,
+                 encodings: Optional[Dict[str, bytes]] = None):
+        self.body = body
+        self.version = version
+        self.etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        self.updated_at = updated_at.replace(microsecond=0)
+        self.last_modified = format_datetime(self.updated_at, usegmt=True)
+        # Content-Encoding -> body, best first
+        self.encodings = encodings or {}
+
+    def encoded_etag(self, encoding: str) -> str:
+        # Each encoding is a different byte sequence, so it needs its own strong validator
+        return f'{self.etag[:-1]}-{encoding}"'
+
+
+def compress(body: bytes) -> Dict[str, bytes]:
+    """Brotli and gzip encodings of a body, best first; runs once per rebuild"""
+    encodings = {}
+    if brotli is not None:
+        encodings["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    encodings["gzip"] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return encodings
+
+
+def accepted_encodings(header: str) -> set:
+    """Content codings an Accept-Encoding header allows (q=0 excluded)"""
+    accepted = set()
+    for part in header.split(','):
+        token, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+
+_loaders: Dict[str, Callable[[], Awaitable]] = {}
+# Name -> version counters its payload depends on (its own first)
+_sources: Dict[str, Tuple[str, ...]] = {}
+_precompressed: set = set()
+_entries: Dict[str, CacheEntry] = {}
+_versions: Dict[str, int] = {}
+_updated_at: Dict[str, datetime] = {}
+_locks: Dict[str, asyncio.Lock] = {}
+_subscribers: Dict[str, List[Callable[[], None]]] = {}
+_sync_task: Optional[asyncio.Task] = None
+
+
+def register(name: str, loader: Callable[[], Awaitable], depends_on: Sequence[str] = (),
+             precompress: bool = False):
+    """Register the coroutine that builds the payload cached under `name`
+
+    The payload is rebuilt when its own version or that of any name in
+    `depends_on` changes. With `precompress`, gzip and brotli encodings are
+    built along with it.
+    """
+    _loaders[name] = loader
+    _sources[name] = (name, *depends_on)
+    if precompress:
+        _precompressed.add(name)
+    _locks[name] = asyncio.Lock()
+
+
+def _current_version(name: str) -> Tuple[int, ...]:
+    return tuple(_versions.get(source, 0) for source in _sources[name])
+
+
+def _last_update(name: str) -> Optional[datetime]:
+    times = [_updated_at[source] for source in _sources[name] if source in _updated_at]
+    return max(times) if times else None
+
+
+def subscribe(name: str, callback: Callable[[], None]):
+    """Call `callback` whenever the version of `name` changes, in this or another worker"""
+    _subscribers.setdefault(name, []).append(callback)
+
+
+def serialize(payload) -> bytes:
+    """Encode a payload exactly once, the way the JSON response would"""
+    return dumps(payload)
+
+
+def _apply_version(doc: dict):
+    name = doc['_id']
+    version = doc.get('version', 0)
+    if _versions.get(name) != version:
+        _versions[name] = version
+        _updated_at[name] = (doc.get('updated_at') or datetime.utcnow()).replace(tzinfo=timezone.utc)
+        _entries.pop(name, None)
+        for callback in _subscribers.get(name, ()):
+            callback()
+
+
+async def get(name: str) -> CacheEntry:
+    """Return the cached entry for `name`, rebuilding it if another worker or an admin write bumped its version"""
+    entry = _entries.get(name)
+    if entry is not None and entry.version == _current_version(name):
+        return entry
+
+    async with _locks[name]:
+        version = _current_version(name)
+        entry = _entries.get(name)
+        if entry is not None and entry.version == version:
+            return entry
+
+        payload = await _loaders[name]()
+        body = serialize(payload)
+        # Compressing at the highest levels takes a few ms; keep it off the event loop
+        encodings = await asyncio.to_thread(compress, body) if name in _precompressed else None
+        updated_at = _last_update(name) or datetime.now(timezone.utc)
+        entry = CacheEntry(body, version, updated_at, encodings)
+        # Only keep it if nothing was invalidated while we were loading
+        if version == _current_version(name):
+            _entries[name] = entry
+        return entry
+
+
+async def invalidate(*names: str):
+    """Bump the shared version counter so every worker drops its copy"""
+    for name in names:
+        doc = await db[VERSIONS_COLLECTION].find_one_and_update(
+            {"_id": name},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        _apply_version(doc)
+
+
+async def sync_versions():
+    """Pull every version counter from Mongo"""
+    async for doc in db[VERSIONS_COLLECTION].find({}):
+        _apply_version(doc)
+
+
+async def _watch_versions():
+    async with db[VERSIONS_COLLECTION].watch(full_document='updateLookup') as stream:
+        logger.info("Cache sync using change stream")
+        async for change in stream:
+            if change.get('fullDocument'):
+                _apply_version(change['fullDocument'])
+
+
+async def _sync_loop():
+    try:
+        await _watch_versions()
+        return
+    except asyncio.CancelledError:
+        raise
+    except (PyMongoError, NotImplementedError, AttributeError) as e:
+        logger.info(f"Change streams unavailable ({e}), polling cache versions every "
+                    f"{get_settings().cache_sync_interval}s")
+
+    while True:
+        await asyncio.sleep(get_settings().cache_sync_interval)
+        try:
+            await sync_versions()
+        except PyMongoError as e:
+            logger.warning(f"Cache version sync failed: {str(e)}")
+
+
+async def start():
+    """Load the current versions and keep them in sync in the background"""
+    global _sync_task
+    try:
+        await sync_versions()
+    except PyMongoError as e:
+        logger.warning(f"Initial cache version sync failed: {str(e)}")
+    _sync_task = asyncio.create_task(_sync_loop())
+
+
+async def stop():
+    global _sync_task
+    if _sync_task is not None:
+        _sync_task.cancel()
+        try:
+            await _sync_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _sync_task = None
+
+
+def _not_modified(request: Request, etag: str, entry: CacheEntry) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(if_modified_since) >= entry.updated_at
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cached_response(request: Request, entry: CacheEntry) -> Response:
+    """Build a 200 or 304 response for a cached entry, precompressed when the client accepts it"""
+    body, etag = entry.body, entry.etag
+    headers = {
+        "Last-Modified": entry.last_modified,
+        "Cache-Control": "no-cache",
+    }
+    if entry.encodings:
+        headers["Vary"] = "Accept-Encoding"
+        accepted = accepted_encodings(request.headers.get('accept-encoding', ''))
+        for encoding, encoded in entry.encodings.items():
+            if encoding in accepted:
+                body, etag = encoded, entry.encoded_etag(encoding)
+                headers["Content-Encoding"] = encoding
+                break
+    headers["ETag"] = etag
+    if _not_modified(request, etag, entry):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,244 @@
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Loaded once, before Settings.from_env reads the environment
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Connection settings, credentials and tuning shared by the app, its workers and the CLIs"""
+
+    mongo_url: str
+    db_name: str
+    admin_email: str
+    admin_password_hash: str
+    jwt_secret_key: str
+    resend_api_key: str = ''
+    # Point at a local stand-in of the Resend API for tests and local development
+    resend_api_url: str = ''
+    contact_email: str = 'info@belkgroup.be'
+    # Mongo connection pool: minPoolSize connections are kept open (and opened at startup)
+    mongo_max_pool_size: int = 50
+    mongo_min_pool_size: int = 5
+    mongo_max_idle_time_ms: int = 300000
+    mongo_connect_timeout_ms: int = 5000
+    mongo_server_selection_timeout_ms: int = 5000
+    mongo_socket_timeout_ms: int = 20000
+    # Wire compression, e.g. "zstd,zlib"; worth it when Mongo is across a network, not on localhost
+    mongo_compressors: str = ''
+    # Readiness checks fail when Mongo does not answer a ping within this time
+    health_timeout_seconds: float = 2.0
+
+    # Admin contact listing page size
+    contacts_page_size: int = 100
+    contacts_max_page_size: int = 500
+    # Contact search: results per query, and a bound on how long a very broad query may run
+    contact_search_limit: int = 50
+    contact_search_max_time_ms: int = 2000
+    # Contact export: documents fetched and encoded per chunk
+    contacts_export_batch_size: int = 1000
+    # Admin batch endpoints
+    max_batch_size: int = 200
+    upload_concurrency: int = 4
+
+    # "memory" keeps rate-limit buckets per worker; "mongo" shares them between all workers
+    rate_limit_backend: str = 'memory'
+    # Contact submissions: burst size and sustained rate (tokens per hour) per client IP and per email
+    contact_ip_burst: int = 5
+    contact_ip_per_hour: float = 20.0
+    contact_email_burst: int = 3
+    contact_email_per_hour: float = 10.0
+    # Identical name/email/message within this window is acknowledged but not stored again
+    duplicate_window_seconds: int = 3600
+    # Number of reverse proxies in front of the app that append to X-Forwarded-For (0 = trust none)
+    trusted_proxy_hops: int = 0
+    # Upper bound on keys held by the in-memory rate-limit backend
+    rate_limit_max_keys: int = 10000
+
+    # "local" keeps uploads on this pod's disk; "s3" stores them in an S3-compatible bucket shared by all replicas
+    storage_backend: str = 'local'
+    # Local uploads, and the directory the /api/uploads mount serves them from
+    uploads_dir: Path = ROOT_DIR / 'uploads'
+    s3_bucket: str = ''
+    # Key prefix of uploads inside the bucket
+    s3_prefix: str = 'uploads/'
+    # Point at MinIO or a local stand-in; credentials come from the usual AWS_* variables
+    s3_endpoint_url: Optional[str] = None
+    s3_region: Optional[str] = None
+    # Public base URL of the bucket behind a CDN; without it clients get presigned URLs
+    s3_public_url: str = ''
+    s3_presign_seconds: int = 3600
+    # Uploads larger than this are sent as a multipart upload while they stream in; S3 needs at least 5 MiB
+    s3_part_size: int = 8 * 1024 * 1024
+
+    # Digest mode: batch non-urgent notifications into one email per window or count
+    email_digest_mode: bool = False
+    digest_window_seconds: float = 900.0
+    digest_max_items: int = 20
+    # Submissions whose subject contains one of these are always sent immediately
+    urgent_keywords: Tuple[str, ...] = ('urgent', 'urgence')
+    # Emails in flight at once; callers beyond this wait for a free slot
+    email_concurrency: int = 4
+    email_timeout: float = 15.0
+    email_connect_timeout: float = 5.0
+    # Idle connections to the API are kept open this long for the next email
+    email_keepalive_seconds: float = 60.0
+    # Outbox worker; a job left in "processing" longer than the lease (crashed worker) is picked up again
+    outbox_concurrency: int = 4
+    outbox_max_attempts: int = 6
+    outbox_backoff_seconds: float = 30.0
+    outbox_backoff_max_seconds: float = 3600.0
+    outbox_poll_interval: float = 5.0
+    outbox_lease_seconds: float = 120.0
+
+    # Largest accepted upload
+    max_upload_bytes: int = 10 * 1024 * 1024
+    # Processes rendering image variants
+    image_workers: int = 2
+    # How often the upload garbage collector runs; 0 disables it
+    upload_gc_interval: float = 6 * 3600.0
+    # Unreferenced files younger than this are kept: an upload is stored before the form using it is saved
+    upload_gc_grace_seconds: float = 24 * 3600.0
+    upload_gc_batch_size: int = 500
+    upload_gc_lease_seconds: float = 1800.0
+    # How often the mirror job looks for new external images; 0 disables it
+    image_mirror_poll_interval: float = 300.0
+    # How often a mirrored image is checked against its source
+    image_mirror_refresh_seconds: float = 24 * 3600.0
+    image_mirror_retry_seconds: float = 300.0
+    image_mirror_concurrency: int = 4
+    # A pass still holding the lease after this long (crashed worker) no longer blocks the others
+    image_mirror_lease_seconds: float = 600.0
+    image_mirror_timeout: float = 30.0
+    # Hosts to mirror; empty mirrors every external host
+    image_mirror_hosts: Tuple[str, ...] = ()
+    # Sources (and redirect targets) resolving to private, loopback or link-local addresses are refused unless set
+    image_mirror_allow_private: bool = False
+    image_mirror_max_redirects: int = 5
+
+    # Polling interval of the cache when change streams are unavailable (standalone mongod)
+    cache_sync_interval: float = 2.0
+    # Verified admin tokens kept per worker
+    token_cache_size: int = 256
+    # Analytics buckets follow this calendar day, not UTC
+    analytics_timezone: str = 'Europe/Brussels'
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        from auth import hash_password
+
+        return cls(
+            mongo_url=os.environ['MONGO_URL'],
+            db_name=os.environ['DB_NAME'],
+            admin_email=os.environ['ADMIN_EMAIL'],
+            admin_password_hash=hash_password(os.environ['ADMIN_PASSWORD']),
+            jwt_secret_key=os.environ['JWT_SECRET_KEY'],
+            resend_api_key=os.environ.get('RESEND_API_KEY', ''),
+            resend_api_url=os.environ.get('RESEND_API_URL', ''),
+            contact_email=os.environ.get('CONTACT_EMAIL', 'info@belkgroup.be'),
+            mongo_max_pool_size=int(os.environ.get('MONGO_MAX_POOL_SIZE', '50')),
+            mongo_min_pool_size=int(os.environ.get('MONGO_MIN_POOL_SIZE', '5')),
+            mongo_max_idle_time_ms=int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000')),
+            mongo_connect_timeout_ms=int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000')),
+            mongo_server_selection_timeout_ms=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+            mongo_socket_timeout_ms=int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '20000')),
+            mongo_compressors=os.environ.get('MONGO_COMPRESSORS', ''),
+            health_timeout_seconds=float(os.environ.get('HEALTH_TIMEOUT_SECONDS', '2')),
+            contacts_page_size=int(os.environ.get('CONTACTS_PAGE_SIZE', '100')),
+            contacts_max_page_size=int(os.environ.get('CONTACTS_MAX_PAGE_SIZE', '500')),
+            contact_search_limit=int(os.environ.get('CONTACT_SEARCH_LIMIT', '50')),
+            contact_search_max_time_ms=int(os.environ.get('CONTACT_SEARCH_MAX_TIME_MS', '2000')),
+            contacts_export_batch_size=int(os.environ.get('CONTACTS_EXPORT_BATCH_SIZE', '1000')),
+            max_batch_size=int(os.environ.get('MAX_BATCH_SIZE', '200')),
+            upload_concurrency=int(os.environ.get('UPLOAD_CONCURRENCY', '4')),
+            rate_limit_backend=os.environ.get('RATE_LIMIT_BACKEND', 'memory').lower(),
+            contact_ip_burst=int(os.environ.get('CONTACT_IP_BURST', '5')),
+            contact_ip_per_hour=float(os.environ.get('CONTACT_IP_PER_HOUR', '20')),
+            contact_email_burst=int(os.environ.get('CONTACT_EMAIL_BURST', '3')),
+            contact_email_per_hour=float(os.environ.get('CONTACT_EMAIL_PER_HOUR', '10')),
+            duplicate_window_seconds=int(os.environ.get('DUPLICATE_WINDOW_SECONDS', '3600')),
+            trusted_proxy_hops=int(os.environ.get('TRUSTED_PROXY_HOPS', '0')),
+            rate_limit_max_keys=int(os.environ.get('RATE_LIMIT_MAX_KEYS', '10000')),
+            storage_backend=os.environ.get('STORAGE_BACKEND', 'local').lower(),
+            uploads_dir=Path(os.environ.get('UPLOADS_DIR', str(ROOT_DIR / 'uploads'))),
+            s3_bucket=os.environ.get('S3_BUCKET', ''),
+            s3_prefix=os.environ.get('S3_PREFIX', 'uploads/'),
+            s3_endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None,
+            s3_region=os.environ.get('S3_REGION') or None,
+            s3_public_url=os.environ.get('S3_PUBLIC_URL', '').rstrip('/'),
+            s3_presign_seconds=int(os.environ.get('S3_PRESIGN_SECONDS', '3600')),
+            s3_part_size=int(os.environ.get('S3_PART_SIZE', str(8 * 1024 * 1024))),
+            email_digest_mode=os.environ.get('EMAIL_DIGEST_MODE', '').lower() in ('1', 'true', 'yes'),
+            digest_window_seconds=float(os.environ.get('DIGEST_WINDOW_SECONDS', '900')),
+            digest_max_items=int(os.environ.get('DIGEST_MAX_ITEMS', '20')),
+            urgent_keywords=tuple(k.strip().lower() for k in os.environ.get('URGENT_KEYWORDS', 'urgent,urgence').split(',')
+                                  if k.strip()),
+            email_concurrency=int(os.environ.get('EMAIL_CONCURRENCY', '4')),
+            email_timeout=float(os.environ.get('EMAIL_TIMEOUT', '15')),
+            email_connect_timeout=float(os.environ.get('EMAIL_CONNECT_TIMEOUT', '5')),
+            email_keepalive_seconds=float(os.environ.get('EMAIL_KEEPALIVE_SECONDS', '60')),
+            outbox_concurrency=int(os.environ.get('OUTBOX_CONCURRENCY', '4')),
+            outbox_max_attempts=int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '6')),
+            outbox_backoff_seconds=float(os.environ.get('OUTBOX_BACKOFF_SECONDS', '30')),
+            outbox_backoff_max_seconds=float(os.environ.get('OUTBOX_BACKOFF_MAX_SECONDS', '3600')),
+            outbox_poll_interval=float(os.environ.get('OUTBOX_POLL_INTERVAL', '5')),
+            outbox_lease_seconds=float(os.environ.get('OUTBOX_LEASE_SECONDS', '120')),
+            max_upload_bytes=int(os.environ.get('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024))),
+            image_workers=int(os.environ.get('IMAGE_WORKERS', '2')),
+            upload_gc_interval=float(os.environ.get('UPLOAD_GC_INTERVAL', str(6 * 3600))),
+            upload_gc_grace_seconds=float(os.environ.get('UPLOAD_GC_GRACE_SECONDS', str(24 * 3600))),
+            upload_gc_batch_size=int(os.environ.get('UPLOAD_GC_BATCH_SIZE', '500')),
+            upload_gc_lease_seconds=float(os.environ.get('UPLOAD_GC_LEASE_SECONDS', '1800')),
+            image_mirror_poll_interval=float(os.environ.get('IMAGE_MIRROR_POLL_INTERVAL', '300')),
+            image_mirror_refresh_seconds=float(os.environ.get('IMAGE_MIRROR_REFRESH_SECONDS', str(24 * 3600))),
+            image_mirror_retry_seconds=float(os.environ.get('IMAGE_MIRROR_RETRY_SECONDS', '300')),
+            image_mirror_concurrency=int(os.environ.get('IMAGE_MIRROR_CONCURRENCY', '4')),
+            image_mirror_lease_seconds=float(os.environ.get('IMAGE_MIRROR_LEASE_SECONDS', '600')),
+            image_mirror_timeout=float(os.environ.get('IMAGE_MIRROR_TIMEOUT', '30')),
+            image_mirror_hosts=tuple(h.strip().lower() for h in os.environ.get('IMAGE_MIRROR_HOSTS', '').split(',')
+                                     if h.strip()),
+            image_mirror_allow_private=os.environ.get('IMAGE_MIRROR_ALLOW_PRIVATE', '').lower() in ('1', 'true', 'yes'),
+            image_mirror_max_redirects=int(os.environ.get('IMAGE_MIRROR_MAX_REDIRECTS', '5')),
+            cache_sync_interval=float(os.environ.get('CACHE_SYNC_INTERVAL', '2')),
+            token_cache_size=int(os.environ.get('TOKEN_CACHE_SIZE', '256')),
+            analytics_timezone=os.environ.get('ANALYTICS_TIMEZONE', 'Europe/Brussels'),
+        )
+
+    def mongo_client_options(self) -> dict:
+        """Keyword arguments for AsyncIOMotorClient"""
+        options = {
+            "maxPoolSize": self.mongo_max_pool_size,
+            "minPoolSize": self.mongo_min_pool_size,
+            "maxIdleTimeMS": self.mongo_max_idle_time_ms,
+            "connectTimeoutMS": self.mongo_connect_timeout_ms,
+            "serverSelectionTimeoutMS": self.mongo_server_selection_timeout_ms,
+            "socketTimeoutMS": self.mongo_socket_timeout_ms,
+            "appname": "belkgroup-backend",
+        }
+        compressors: List[str] = [c.strip() for c in self.mongo_compressors.split(',') if c.strip()]
+        if compressors:
+            options["compressors"] = compressors
+        return options
+
+
+_settings: Optional[Settings] = None
+
+
+def get_settings() -> Settings:
+    """Settings in use, read from the environment on first access"""
+    global _settings
+    if _settings is None:
+        _settings = Settings.from_env()
+    return _settings
+
+
+def configure(settings: Settings):
+    """Use explicit settings instead of the environment (set by create_app)"""
+    global _settings
+    _settings = settings
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+import httpx
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+RESEND_API_URL = "https://api.resend.com"
+
+
+class EmailError(Exception):
+    """Raised when an email could not be handed to Resend"""
+
+
+class Transport(ABC):
+    """Hands a rendered email to a provider; returns the provider's message id"""
+
+    @abstractmethod
+    async def send(self, params: Dict) -> Optional[str]:
+        """Send one email built from Resend-style `params`; raise EmailError on failure"""
+
+    async def aclose(self):
+        pass
+
+
+class ResendTransport(Transport):
+    """Resend's HTTP API over one shared keep-alive client
+
+    The client is opened on first use, in the event loop that sends.
+    """
+
+    def __init__(self, api_key: str, api_url: str = RESEND_API_URL, concurrency: Optional[int] = None):
+        self.api_key = api_key
+        self.api_url = api_url.rstrip('/')
+        self.concurrency = concurrency or get_settings().email_concurrency
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _open(self) -> httpx.AsyncClient:
+        if self._client is None:
+            settings = get_settings()
+            self._client = httpx.AsyncClient(
+                base_url=self.api_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=httpx.Timeout(settings.email_timeout, connect=settings.email_connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency,
+                    keepalive_expiry=settings.email_keepalive_seconds,
+                ),
+            )
+            self._slots = asyncio.Semaphore(self.concurrency)
+        return self._client
+
+    async def send(self, params: Dict) -> Optional[str]:
+        client = self._open()
+        async with self._slots:
+            try:
+                response = await client.post("/emails", json=params)
+            except httpx.HTTPError as e:
+                raise EmailError(str(e) or type(e).__name__) from e
+        if response.is_error:
+            raise EmailError(f"HTTP {response.status_code}: {_error_message(response)}")
+        try:
+            body = response.json()
+        except ValueError as e:
+            raise EmailError(f"HTTP {response.status_code}: unreadable response {response.text[:200]!r}") from e
+        if not isinstance(body, dict):
+            raise EmailError(f"HTTP {response.status_code}: unexpected response {response.text[:200]!r}")
+        return body.get("id")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _error_message(response: httpx.Response) -> str:
+    try:
+        return response.json().get("message") or response.reason_phrase
+    except ValueError:
+        return response.text[:200] or response.reason_phrase
+
+
+_transport: Optional[Transport] = None
+
+
+def get_transport() -> Optional[Transport]:
+    """The configured transport, or None when emails are not set up"""
+    return _transport
+
+
+def set_transport(transport: Optional[Transport]):
+    """Replace the transport, e.g. with a stand-in in tests"""
+    global _transport
+    _transport = transport
+
+
+async def close():
+    """Close the transport's connections; called on shutdown"""
+    global _transport
+    if _transport is not None:
+        await _transport.aclose()
+        _transport = None
@@ -0,0 +1,80 @@
+import csv
+import io
+import re
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Sequence
+
+from serialization import dumps
+
+# Export formats -> media type
+CSV = "csv"
+NDJSON = "ndjson"
+MEDIA_TYPES = {
+    CSV: "text/csv; charset=utf-8",
+    NDJSON: "application/x-ndjson",
+}
+
+# Characters a spreadsheet would read as the start of a formula
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+# Phone numbers and plain numbers start with "+" or "-" but are never formulas
+_PHONE_OR_NUMBER = re.compile(r"^[+-]?[\d\s().-]+$")
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    text = str(value)
+    # A message like "=HYPERLINK(...)" must stay text when the file is opened in a spreadsheet
+    if not text.startswith(_FORMULA_PREFIXES) or (text[0] in "+-" and _PHONE_OR_NUMBER.match(text)):
+        return text
+    return "'" + text
+
+
+def csv_encoder(fields: Sequence[str]) -> Callable[[List[dict]], bytes]:
+    """Encoder turning a batch of documents into CSV rows; the first batch gets the header"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+
+    def encode(docs: List[dict]) -> bytes:
+        for doc in docs:
+            writer.writerow([_cell(doc.get(field)) for field in fields])
+        chunk = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    return encode
+
+
+def ndjson_encoder(fields: Sequence[str]) -> Callable[[List[dict]], bytes]:
+    """Encoder turning a batch of documents into one JSON object per line"""
+    def encode(docs: List[dict]) -> bytes:
+        return b"".join(dumps({field: doc.get(field) for field in fields}) + b"\n" for doc in docs)
+
+    return encode
+
+
+ENCODERS: Dict[str, Callable[[Sequence[str]], Callable[[List[dict]], bytes]]] = {
+    CSV: csv_encoder,
+    NDJSON: ndjson_encoder,
+}
+
+
+async def stream(cursor, fields: Sequence[str], fmt: str, batch_size: int) -> AsyncIterator[bytes]:
+    """Encode a Mongo cursor chunk by chunk, holding at most one batch in memory
+
+    The cursor should be opened with the same `batch_size`, so each chunk costs
+    one round trip and the event loop serves other requests in between.
+    """
+    encode = ENCODERS[fmt](fields)
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield encode(batch)
+            batch = []
+    # Also flushes the CSV header of an empty export
+    yield encode(batch)
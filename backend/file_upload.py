@@ -1,34 +1,93 @@
-import os
-import shutil
-from pathlib import Path
+import asyncio
+import hashlib
+import time
+from typing import AsyncIterator, Tuple
 from fastapi import UploadFile
-import uuid
 
-# Directory to store uploaded images
-UPLOADS_DIR = Path("/app/backend/uploads")
-UPLOADS_DIR.mkdir(exist_ok=True)
+import metrics
+import storage
+from config import get_settings
 
-# Static files will be served from this URL path
+# Static files will be served from this URL path, whatever the storage backend
 STATIC_URL = "/api/uploads"
 
-def save_upload_file(upload_file: UploadFile) -> str:
-    """Save uploaded file and return the file path"""
-    # Generate unique filename
-    file_extension = upload_file.filename.split('.')[-1]
-    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-    file_path = UPLOADS_DIR / unique_filename
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(upload_file.file, buffer)
-    
+# Uploads are copied in chunks of this size, off the event loop
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds max_upload_bytes"""
+
+
+class UnsupportedFileTypeError(Exception):
+    """Raised when an upload is not a recognised image format"""
+
+
+def detect_image_extension(head: bytes) -> str:
+    """Return the file extension for an image from its first bytes"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return "jpg"
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return "png"
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return "gif"
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return "webp"
+    if head[4:8] == b'ftyp' and head[8:12] in (b'avif', b'avis'):
+        return "avif"
+    raise UnsupportedFileTypeError("Unsupported image format")
+
+
+async def store_chunks(chunks: AsyncIterator[bytes]) -> Tuple[str, int]:
+    """Stream image bytes to the storage backend under their content hash; returns (URL path, size)
+
+    Identical files map to the same name, so storing a photo twice keeps one copy.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    extension = None
+    max_bytes = get_settings().max_upload_bytes
+
+    async with storage.open_writer() as writer:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            if extension is None:
+                extension = detect_image_extension(chunk)
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(f"File exceeds {max_bytes} bytes")
+            await asyncio.to_thread(digest.update, chunk)
+            await writer.write(chunk)
+
+        if extension is None:
+            raise UnsupportedFileTypeError("Empty file")
+
+        filename = f"{digest.hexdigest()}.{extension}"
+        await writer.commit(filename)
+
+    return f"{STATIC_URL}/{filename}", size
+
+
+async def _read_upload(upload_file: UploadFile) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await upload_file.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def save_upload_file(upload_file: UploadFile) -> str:
+    """Stream an upload to storage under its content hash and return the URL path"""
+    start = time.perf_counter()
+    try:
+        url, size = await store_chunks(_read_upload(upload_file))
+    except BaseException:
+        metrics.upload_seconds.observe(time.perf_counter() - start, "rejected")
+        raise
+
+    metrics.upload_seconds.observe(time.perf_counter() - start, "stored")
+    metrics.upload_bytes.observe(size)
+
     # Return URL path
-    return f"{STATIC_URL}/{unique_filename}"
-
-def delete_upload_file(file_url: str):
-    """Delete uploaded file"""
-    if file_url and file_url.startswith(STATIC_URL):
-        filename = file_url.replace(STATIC_URL + "/", "")
-        file_path = UPLOADS_DIR / filename
-        if file_path.exists():
-            file_path.unlink()
\ No newline at end of file
+    return url
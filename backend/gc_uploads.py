@@ -0,0 +1,38 @@
+import argparse
+import asyncio
+import logging
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import upload_gc
+from config import get_settings
+
+settings = get_settings()
+client = AsyncIOMotorClient(settings.mongo_url, **settings.mongo_client_options())
+db = client[settings.db_name]
+upload_gc.set_db(db)
+
+
+async def main(args):
+    report = await upload_gc.collect(grace_seconds=args.grace_seconds, batch_size=args.batch_size, dry_run=args.dry_run)
+    verb = "Would delete" if args.dry_run else "Deleted"
+    print(f"{report['referenced']} uploads referenced, {report['kept_recent']} unreferenced but recent")
+    print(f"{verb} {report[upload_gc.ORIGINAL]} uploads, {report[upload_gc.VARIANT]} variants, "
+          f"{report[upload_gc.COMPRESSED]} precompressed copies and "
+          f"{report[upload_gc.TEMPORARY]} temporary files: {report['bytes'] / 1024 / 1024:.1f} MiB")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete uploaded images no service or gallery item references")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be deleted")
+    parser.add_argument("--grace-seconds", type=float, default=settings.upload_gc_grace_seconds,
+                        help="keep unreferenced files younger than this")
+    parser.add_argument("--batch-size", type=int, default=settings.upload_gc_batch_size,
+                        help="files re-checked and deleted per batch")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    try:
+        sys.exit(asyncio.run(main(args)))
+    finally:
+        client.close()
@@ -0,0 +1,305 @@
+import asyncio
+import ipaddress
+import logging
+import socket
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from pymongo import UpdateOne
+
+import cache
+import leases
+import metrics
+import seeding
+from config import get_settings
+from file_upload import CHUNK_SIZE, store_chunks, UploadTooLargeError, UnsupportedFileTypeError
+from image_variants import IMAGE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Source URL -> local copy, with the validators used to re-fetch it conditionally
+MIRRORS_COLLECTION = "image_mirrors"
+LEASE_NAME = "image_mirror"
+
+# Fetch outcomes
+FETCHED = "fetched"
+NOT_MODIFIED = "not_modified"
+FAILED = "failed"
+
+# These will be set by server.py
+db = None
+
+def set_db(database):
+    global db
+    db = database
+
+
+_wakeup: Optional[asyncio.Event] = None
+_task: Optional[asyncio.Task] = None
+
+
+class UnsafeSourceError(Exception):
+    """Raised for a source or redirect target the mirror must not fetch"""
+
+
+def is_external(url: Optional[str]) -> bool:
+    """Whether `url` points at a host the mirror should copy from"""
+    if not url or not url.startswith(("http://", "https://")):
+        return False
+    hosts = get_settings().image_mirror_hosts
+    return not hosts or (urlsplit(url).hostname or "").lower() in hosts
+
+
+async def _resolve(host: str, port: int) -> set:
+    """Every address `host` resolves to"""
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return {info[4][0] for info in infos}
+
+
+async def check_source(url: str):
+    """Raise UnsafeSourceError unless `url` may be fetched
+
+    The host must be allowed by `is_external`, and, unless private addresses are
+    allowed, resolve only to public ones: image URLs are typed in by admins, and
+    the server must not be talked into fetching from its own network.
+    """
+    if not is_external(url):
+        raise UnsafeSourceError(f"Host not allowed: {url}")
+    if get_settings().image_mirror_allow_private:
+        return
+    parts = urlsplit(url)
+    try:
+        addresses = await _resolve(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+    except OSError as e:
+        raise UnsafeSourceError(f"Cannot resolve {parts.hostname}: {str(e)}")
+    for address in addresses:
+        if not ipaddress.ip_address(address.split('%')[0]).is_global:
+            raise UnsafeSourceError(f"{parts.hostname} resolves to non-public address {address}")
+
+
+def retry_delay(failures: int) -> float:
+    """Seconds before a source that failed `failures` times in a row is tried again"""
+    settings = get_settings()
+    return min(settings.image_mirror_retry_seconds * (2 ** (failures - 1)), settings.image_mirror_refresh_seconds)
+
+
+async def local_urls(urls: Iterable[str]) -> Dict[str, str]:
+    """Source URL -> local URL for the given URLs that have been mirrored"""
+    urls = [url for url in set(urls) if is_external(url)]
+    if not urls:
+        return {}
+    cursor = db[MIRRORS_COLLECTION].find({"_id": {"$in": urls}, "local_url": {"$ne": None}}, {"local_url": 1})
+    return {doc["_id"]: doc["local_url"] async for doc in cursor}
+
+
+async def _image_urls() -> set:
+    """Every image URL a document points at, external or local"""
+    urls = set()
+    for collection, fields in IMAGE_FIELDS.items():
+        for field in fields:
+            urls.update(url for url in await db[collection].distinct(field) if url)
+    return urls
+
+
+@asynccontextmanager
+async def _open(client: httpx.AsyncClient, url: str, headers: dict) -> AsyncIterator[httpx.Response]:
+    """Stream a GET of `url`, checking it and every redirect target with check_source"""
+    request = client.build_request("GET", url, headers=headers)
+    for _ in range(get_settings().image_mirror_max_redirects + 1):
+        await check_source(str(request.url))
+        response = await client.send(request, stream=True, follow_redirects=False)
+        if not response.next_request:
+            break
+        await response.aclose()
+        request = response.next_request
+    else:
+        raise httpx.TooManyRedirects(f"Too many redirects from {url}", request=request)
+    try:
+        yield response
+    finally:
+        await response.aclose()
+
+
+async def _fetch(client: httpx.AsyncClient, url: str, record: dict, now: datetime) -> dict:
+    """Fetch one source, conditionally if it was mirrored before; returns the fields to store"""
+    headers = {}
+    if record.get("local_url"):
+        if record.get("etag"):
+            headers["If-None-Match"] = record["etag"]
+        if record.get("last_modified"):
+            headers["If-Modified-Since"] = record["last_modified"]
+    try:
+        async with _open(client, url, headers) as response:
+            if response.status_code == 304 and record.get("local_url"):
+                metrics.image_mirror_fetches.inc(NOT_MODIFIED)
+                return {"checked_at": now, "next_check_at": now + timedelta(seconds=get_settings().image_mirror_refresh_seconds),
+                        "failures": 0, "error": None}
+            response.raise_for_status()
+            local_url, size = await store_chunks(response.aiter_bytes(CHUNK_SIZE))
+            fields = {
+                "local_url": local_url,
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+                "size": size,
+            }
+    except (httpx.HTTPError, UnsafeSourceError, UploadTooLargeError, UnsupportedFileTypeError) as e:
+        failures = record.get("failures", 0) + 1
+        error = f"HTTP {e.response.status_code}" if isinstance(e, httpx.HTTPStatusError) else str(e) or type(e).__name__
+        metrics.image_mirror_fetches.inc(FAILED)
+        logger.warning(f"Could not mirror {url} (attempt {failures}): {error}")
+        return {"checked_at": now, "next_check_at": now + timedelta(seconds=retry_delay(failures)),
+                "failures": failures, "error": error}
+
+    metrics.image_mirror_fetches.inc(FETCHED)
+    return {**fields, "fetched_at": now, "checked_at": now,
+            "next_check_at": now + timedelta(seconds=get_settings().image_mirror_refresh_seconds), "failures": 0, "error": None}
+
+
+async def _rewrite(replacements: Dict[str, str], now: datetime) -> Dict[str, int]:
+    """Point documents at their local copies; returns modified documents per collection
+
+    Each update matches the old value, so an admin edit made meanwhile is not overwritten.
+    Seeded documents that were unedited keep a valid seed checksum.
+    """
+    modified = {}
+    for collection, fields in IMAGE_FIELDS.items():
+        query = {"$or": [{field: {"$in": list(replacements)}} for field in fields]}
+        requests = []
+        async for doc in db[collection].find(query, {"_id": 0}):
+            changes = {field: replacements[doc[field]] for field in fields if doc.get(field) in replacements}
+            update = {**changes, "updated_at": now}
+            if seeding.SEED_CHECKSUM in doc:
+                fields_before = seeding.stored_fields(doc)
+                if seeding.checksum(fields_before) == doc[seeding.SEED_CHECKSUM]:
+                    update[seeding.SEED_CHECKSUM] = seeding.checksum({**fields_before, **changes})
+            match = {"id": doc["id"], **{field: doc[field] for field in changes}}
+            requests.append(UpdateOne(match, {"$set": update}))
+        if requests:
+            result = await db[collection].bulk_write(requests, ordered=False)
+            modified[collection] = result.modified_count
+    return modified
+
+
+async def mirror_once(client: Optional[httpx.AsyncClient] = None, force: bool = False,
+                      dry_run: bool = False) -> Dict[str, int]:
+    """Mirror new external images, re-check due ones and rewrite the documents
+
+    New sources are fetched outright; known ones are re-checked with their ETag and
+    Last-Modified validators once `next_check_at` has passed (or always with `force`).
+    Sources no document uses any more are dropped instead of re-checked.
+    Returns counts per fetch outcome plus documents rewritten and sources pruned.
+    """
+    now = datetime.utcnow()
+    in_use = await _image_urls()
+    referenced = {url for url in in_use if is_external(url)}
+    query = {} if force else {"$or": [{"_id": {"$in": list(referenced)}}, {"next_check_at": {"$lte": now}}]}
+    records = {doc["_id"]: doc async for doc in db[MIRRORS_COLLECTION].find(query)}
+    # Sources whose documents were deleted or given another image; their copies are left to the upload GC
+    unused = [url for url, record in records.items() if url not in in_use and record.get("local_url") not in in_use]
+    for url in unused:
+        del records[url]
+    due = [url for url in referenced | set(records)
+           if force or url not in records or records[url].get("next_check_at", now) <= now]
+    # A document pointing at a source mirrored earlier (re-seeded, pasted again) needs no fetch to be rewritten
+    replacements = {url: record["local_url"] for url, record in records.items()
+                    if url in referenced and record.get("local_url")}
+    counts: Dict[str, int] = {"pruned": len(unused)}
+    if dry_run:
+        counts["due"] = len(due)
+        for url in sorted(due):
+            logger.info(f"Would fetch {url}")
+        return counts
+
+    if unused:
+        await db[MIRRORS_COLLECTION].delete_many({"_id": {"$in": unused}})
+
+    settings = get_settings()
+    own_client = client is None
+    if own_client:
+        # Redirects are followed by _open, which checks each target
+        client = httpx.AsyncClient(timeout=settings.image_mirror_timeout,
+                                   limits=httpx.Limits(max_connections=settings.image_mirror_concurrency))
+    slots = asyncio.Semaphore(settings.image_mirror_concurrency)
+
+    async def run(url: str):
+        async with slots:
+            return url, await _fetch(client, url, records.get(url, {}), now)
+
+    try:
+        results = await asyncio.gather(*(run(url) for url in due))
+    finally:
+        if own_client:
+            await client.aclose()
+
+    requests = []
+    for url, fields in results:
+        outcome = FAILED if fields.get("error") else FETCHED if "fetched_at" in fields else NOT_MODIFIED
+        counts[outcome] = counts.get(outcome, 0) + 1
+        previous = records.get(url, {}).get("local_url")
+        if fields.get("local_url"):
+            replacements[url] = fields["local_url"]
+            # The source changed upstream; documents still showing the old copy follow it
+            if previous and previous != fields["local_url"]:
+                replacements[previous] = fields["local_url"]
+        requests.append(UpdateOne({"_id": url}, {"$set": fields, "$setOnInsert": {"created_at": now}}, upsert=True))
+    if requests:
+        await db[MIRRORS_COLLECTION].bulk_write(requests, ordered=False)
+
+    modified = await _rewrite(replacements, now) if replacements else {}
+    counts["rewritten"] = sum(modified.values())
+    changed = [collection for collection, count in modified.items() if count]
+    if changed:
+        await cache.invalidate(*changed)
+    return counts
+
+
+async def _run():
+    while True:
+        _wakeup.clear()
+        try:
+            # Only one worker of the deployment mirrors at a time
+            holder = await leases.acquire(LEASE_NAME, get_settings().image_mirror_lease_seconds)
+            if holder is not None:
+                try:
+                    counts = await mirror_once()
+                finally:
+                    await leases.release(LEASE_NAME, holder)
+                if any(counts.get(key) for key in (FETCHED, FAILED, "rewritten", "pruned")):
+                    logger.info(f"Image mirror pass: {counts}")
+        except Exception as e:
+            # Mongo, network or storage errors; the next pass tries again
+            logger.warning(f"Image mirror pass failed: {str(e)}")
+        try:
+            await asyncio.wait_for(_wakeup.wait(), get_settings().image_mirror_poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _wake():
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def start():
+    """Start the background job, which also wakes when services or gallery change"""
+    global _wakeup, _task
+    if get_settings().image_mirror_poll_interval <= 0:
+        return
+    _wakeup = asyncio.Event()
+    for name in IMAGE_FIELDS:
+        cache.subscribe(name, _wake)
+    _task = asyncio.create_task(_run())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
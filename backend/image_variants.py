@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image, ImageOps, features
+
+import cache
+import storage
+from config import get_settings
+from file_upload import STATIC_URL
+
+logger = logging.getLogger(__name__)
+
+# Widths generated for every uploaded image; never larger than the original
+VARIANT_WIDTHS = (320, 640, 1280)
+# Most efficient format first; formats the local Pillow build cannot encode are skipped
+VARIANT_FORMATS = tuple(fmt for fmt in ("avif", "webp") if features.check(fmt))
+VARIANT_QUALITY = {"avif": 55, "webp": 75}
+ORIGINAL_EXTENSIONS = ("jpg", "jpeg", "png", "gif", "webp", "avif")
+
+# Storage prefix of variants; also their directory with the local backend
+VARIANTS_PREFIX = "variants/"
+VARIANTS_URL = f"{STATIC_URL}/variants"
+
+# Image fields per collection that get a variant map in responses
+IMAGE_FIELDS = {
+    "services": ("image",),
+    "gallery": ("image", "image_before", "image_after"),
+}
+
+# Upload name -> width of the source image, recorded when its variants are rendered
+IMAGES_COLLECTION = "upload_images"
+
+# Stems without an original are remembered this long, so unknown variant URLs cost no storage lookups
+MISSING_ORIGINAL_SECONDS = 300
+MISSING_ORIGINAL_MAX = 10000
+
+VARIANT_NAME = re.compile(r'^(?P<stem>[A-Za-z0-9_-]+)-(?P<width>\d+)\.(?P<fmt>[a-z]+)$')
+
+# These will be set by server.py
+db = None
+
+def set_db(database):
+    global db
+    db = database
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pending: Dict[str, asyncio.Future] = {}
+_background: set = set()
+_missing_originals: "OrderedDict[str, float]" = OrderedDict()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=get_settings().image_workers)
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _render(source_path: str, target_path: str, width: int, fmt: str):
+    """Resize one image and encode it; runs in the process pool"""
+    with Image.open(source_path) as original:
+        # Phone photos are often stored sideways with an EXIF rotation flag
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if image.mode in ("LA", "PA") or "transparency" in image.info else "RGB")
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), Image.LANCZOS)
+        temp_path = f"{target_path}.{os.getpid()}.tmp"
+        image.save(temp_path, format=fmt.upper(), quality=VARIANT_QUALITY[fmt])
+    os.replace(temp_path, target_path)
+
+
+def _source_width(source_path: str) -> int:
+    """Displayed width of an image, after its EXIF rotation"""
+    with Image.open(source_path) as image:
+        # Orientations 5-8 turn the image by 90 degrees
+        rotated = image.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+        return image.height if rotated else image.width
+
+
+def widths_for(source_width: Optional[int]) -> Tuple[int, ...]:
+    """Variant widths worth rendering and advertising for a source; all of them while it is unknown"""
+    if source_width is None:
+        return VARIANT_WIDTHS
+    return tuple(width for width in VARIANT_WIDTHS if width <= source_width)
+
+
+def _render_all(source_path: str, target_dir: str, stem: str, full_size: bool = True) -> Tuple[List[str], int]:
+    """Render every width/format combination that does not exist yet; returns the new file names and source width
+
+    Widths above the source are skipped rather than upscaled.
+    """
+    source_width = _source_width(source_path)
+    rendered = []
+    for width in widths_for(source_width):
+        for fmt in VARIANT_FORMATS:
+            target = Path(target_dir) / f"{stem}-{width}.{fmt}"
+            if not target.exists():
+                _render(source_path, str(target), width, fmt)
+                rendered.append(target.name)
+
+    # Full-size re-encodes, served in place of the original to clients that accept them
+    if full_size and Path(source_path).suffix.lower() in (".jpg", ".jpeg", ".png", ".gif"):
+        original_size = os.path.getsize(source_path)
+        for fmt in VARIANT_FORMATS:
+            target = Path(target_dir) / f"{stem}.{fmt}"
+            if target.exists():
+                continue
+            _render(source_path, str(target), source_width, fmt)
+            if target.stat().st_size >= original_size:
+                target.unlink()
+            else:
+                rendered.append(target.name)
+    return rendered, source_width
+
+
+def local_filename(url: Optional[str]) -> Optional[str]:
+    """Name of the upload a URL points at, None for external URLs"""
+    # Older documents store /uploads/<name> instead of /api/uploads/<name>
+    for prefix in (STATIC_URL + "/", "/uploads/"):
+        if url and url.startswith(prefix):
+            filename = url[len(prefix):]
+            if "/" not in filename:
+                return filename
+    return None
+
+
+async def _find_original(stem: str) -> Tuple[Optional[str], Optional[int]]:
+    """Name and recorded source width of the upload a variant stem belongs to; (None, None) if there is none
+
+    Uploads rendered before are found by their record; older ones by probing
+    the storage once per extension, with misses remembered for a while.
+    """
+    record = await db[IMAGES_COLLECTION].find_one({"_id": {"$regex": f"^{re.escape(stem)}\\."}}, {"width": 1})
+    if record is not None:
+        return record["_id"], record.get("width")
+
+    now = time.monotonic()
+    missing_until = _missing_originals.get(stem)
+    if missing_until is not None and missing_until > now:
+        return None, None
+
+    backend = storage.get_backend()
+    for extension in ORIGINAL_EXTENSIONS:
+        if await backend.exists(f"{stem}.{extension}"):
+            _missing_originals.pop(stem, None)
+            return f"{stem}.{extension}", None
+
+    _missing_originals[stem] = now + MISSING_ORIGINAL_SECONDS
+    _missing_originals.move_to_end(stem)
+    while len(_missing_originals) > MISSING_ORIGINAL_MAX:
+        _missing_originals.popitem(last=False)
+    return None, None
+
+
+async def _render_into_storage(source_name: str, render, *args) -> List[str]:
+    """Run a render function in the pool on a local copy of an upload and store what it produced"""
+    backend = storage.get_backend()
+    async with backend.local_copy(source_name) as source, backend.scratch_dir(VARIANTS_PREFIX) as target_dir:
+        rendered, source_width = await asyncio.get_running_loop().run_in_executor(
+            _get_pool(), render, str(source), str(target_dir), *args)
+        for name in rendered:
+            await backend.publish(target_dir / name, VARIANTS_PREFIX + name)
+    await _record_width(source_name, source_width)
+    return rendered
+
+
+def _render_one(source_path: str, target_dir: str, target_name: str, width: int, fmt: str) -> Tuple[List[str], int]:
+    source_width = _source_width(source_path)
+    if width not in widths_for(source_width):
+        return [], source_width
+    _render(source_path, str(Path(target_dir) / target_name), width, fmt)
+    return [target_name], source_width
+
+
+async def _record_width(filename: str, width: int):
+    result = await db[IMAGES_COLLECTION].update_one({"_id": filename}, {"$set": {"width": width}}, upsert=True)
+    if not (result.upserted_id or result.modified_count):
+        return
+    # Payloads built before the width was known advertise every width
+    urls = [prefix + filename for prefix in (STATIC_URL + "/", "/uploads/")]
+    stale = [collection for collection, fields in IMAGE_FIELDS.items()
+             if await db[collection].find_one({"$or": [{field: {"$in": urls}} for field in fields]}, {"_id": 1})]
+    if stale:
+        await cache.invalidate(*stale)
+
+
+async def source_widths(urls: Iterable[Optional[str]]) -> Dict[str, int]:
+    """Upload name -> source width for the uploads the URLs point at, where it is known"""
+    names = list({name for name in map(local_filename, urls) if name})
+    if not names:
+        return {}
+    cursor = db[IMAGES_COLLECTION].find({"_id": {"$in": names}}, {"width": 1})
+    return {doc["_id"]: doc["width"] async for doc in cursor}
+
+
+def schedule_variants(url: str):
+    """Generate all variants of a freshly uploaded image in the background"""
+    filename = local_filename(url)
+    if not filename:
+        return
+    stem = Path(filename).stem
+    # Re-encoded originals are only served by the local static mount
+    full_size = storage.get_backend().serves_locally
+
+    async def run():
+        try:
+            await _render_into_storage(filename, _render_all, stem, full_size)
+        except Exception as e:
+            logger.error(f"Failed to generate variants for {filename}: {str(e)}")
+
+    task = asyncio.create_task(run())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def ensure_variant(name: str):
+    """Make sure a variant is stored, rendering it first if it does not exist
+
+    Raises FileNotFoundError if the name is not a valid variant of an existing upload,
+    including widths larger than the upload itself.
+    """
+    match = VARIANT_NAME.match(name)
+    if not match or int(match["width"]) not in VARIANT_WIDTHS or match["fmt"] not in VARIANT_FORMATS:
+        raise FileNotFoundError(name)
+    width = int(match["width"])
+
+    future = _pending.get(name)
+    if future is None:
+        source, source_width = await _find_original(match["stem"])
+        if source is None or (source_width is not None and width not in widths_for(source_width)):
+            raise FileNotFoundError(name)
+        if await storage.get_backend().exists(VARIANTS_PREFIX + name):
+            return
+
+        # Images uploaded before variants existed are rendered on first request
+        future = _pending.get(name)
+        if future is None:
+            future = asyncio.ensure_future(_render_into_storage(source, _render_one, name, width, match["fmt"]))
+            _pending[name] = future
+            future.add_done_callback(lambda _: _pending.pop(name, None))
+    # Empty when the width turned out to be larger than the source
+    if not await asyncio.shield(future):
+        raise FileNotFoundError(name)
+
+
+def variant_map(url: Optional[str], source_width: Optional[int] = None) -> Optional[Dict[str, Dict[str, str]]]:
+    """Map format -> width -> URL for a local upload, None for external images
+
+    Only widths up to `source_width` are listed, so srcset descriptors match the
+    files; None when the source is narrower than every variant.
+    """
+    filename = local_filename(url)
+    widths = widths_for(source_width)
+    if not filename or not VARIANT_FORMATS or not widths:
+        return None
+    stem = Path(filename).stem
+    return {
+        fmt: {str(width): f"{VARIANTS_URL}/{stem}-{width}.{fmt}" for width in widths}
+        for fmt in VARIANT_FORMATS
+    }
+
+
+async def attach_variants(docs: List[dict], collection: str) -> List[dict]:
+    """Add the image_variants map to service or gallery documents, with one lookup of source widths"""
+    fields = IMAGE_FIELDS[collection]
+    widths = await source_widths(doc.get(field) for doc in docs for field in fields)
+    for doc in docs:
+        variants = {}
+        for field in fields:
+            mapping = variant_map(doc.get(field), widths.get(local_filename(doc.get(field))))
+            if mapping:
+                variants[field] = mapping
+        doc["image_variants"] = variants
+    return docs
@@ -0,0 +1,131 @@
+import logging
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+from search import CONTACT_TEXT_FIELDS, TEXT_LANGUAGE
+
+logger = logging.getLogger(__name__)
+
+# Declared indexes per collection: name -> (keys, options)
+INDEXES: Dict[str, Dict[str, tuple]] = {
+    "services": {
+        "id_unique": ([("id", ASCENDING)], {"unique": True}),
+        "order": ([("order", ASCENDING)], {}),
+        # Stable key of documents created by init_services.py
+        "seed_key_unique": ([("seed_key", ASCENDING)], {"unique": True, "sparse": True}),
+    },
+    "gallery": {
+        "id_unique": ([("id", ASCENDING)], {"unique": True}),
+        "created_at": ([("created_at", DESCENDING)], {}),
+        "seed_key_unique": ([("seed_key", ASCENDING)], {"unique": True, "sparse": True}),
+    },
+    "contacts": {
+        "id_unique": ([("id", ASCENDING)], {"unique": True}),
+        # Serves both the created_at sort and keyset pagination on (created_at, id)
+        "created_at_id": ([("created_at", DESCENDING), ("id", DESCENDING)], {}),
+        # Full-text search in the admin dashboard
+        "text_search": (
+            [(field, TEXT) for field in CONTACT_TEXT_FIELDS],
+            {"weights": CONTACT_TEXT_FIELDS, "default_language": TEXT_LANGUAGE},
+        ),
+    },
+    "email_outbox": {
+        "id_unique": ([("id", ASCENDING)], {"unique": True}),
+        "status_next_attempt_at": ([("status", ASCENDING), ("next_attempt_at", ASCENDING)], {}),
+        "status_updated_at": ([("status", ASCENDING), ("updated_at", DESCENDING)], {}),
+        "digest_status_created_at": ([("digest", ASCENDING), ("status", ASCENDING), ("created_at", ASCENDING)], {}),
+        "batch_id": ([("batch_id", ASCENDING)], {"sparse": True}),
+    },
+    "contact_rollups": {
+        "period_key": ([("period", ASCENDING), ("key", ASCENDING)], {}),
+    },
+    "rate_limits": {
+        "expires_at_ttl": ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    },
+    "contact_fingerprints": {
+        "expires_at_ttl": ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    },
+    "image_mirrors": {
+        # Sources due for a conditional re-check
+        "next_check_at": ([("next_check_at", ASCENDING)], {}),
+    },
+    "revoked_tokens": {
+        "jti_unique": ([("jti", ASCENDING)], {"unique": True}),
+        # Revocations are only needed until the token would have expired anyway
+        "exp_ttl": ([("exp", ASCENDING)], {"expireAfterSeconds": 0}),
+    },
+}
+
+# Options compared when looking for drift
+COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression", "weights", "default_language")
+
+
+def _declared_spec(keys: List[tuple], options: dict) -> dict:
+    # Text fields are compared through their weights, since Mongo reports them as _fts/_ftsx
+    spec = {"key": [(field, direction) for field, direction in keys if direction != TEXT]}
+    spec.update({k: v for k, v in options.items() if k in COMPARED_OPTIONS})
+    return spec
+
+
+def _existing_spec(info: dict) -> dict:
+    spec = {"key": [(field, direction) for field, direction in info["key"] if field not in ("_fts", "_ftsx")]}
+    spec.update({k: v for k, v in info.items() if k in COMPARED_OPTIONS})
+    if spec.get("unique") is False:
+        del spec["unique"]
+    return spec
+
+
+async def index_drift(db) -> Dict[str, Dict[str, List[str]]]:
+    """Compare the indexes in Mongo against INDEXES
+
+    Returns, per collection, the index names that are missing, that exist with a
+    different definition, and that exist without being declared.
+    """
+    report = {}
+    for collection, declared in INDEXES.items():
+        existing = await db[collection].index_information()
+        existing.pop("_id_", None)
+
+        missing, changed = [], []
+        for name, (keys, options) in declared.items():
+            if name not in existing:
+                missing.append(name)
+            elif _existing_spec(existing[name]) != _declared_spec(keys, options):
+                changed.append(name)
+        extra = [name for name in existing if name not in declared]
+
+        report[collection] = {"missing": missing, "changed": changed, "extra": extra}
+    return report
+
+
+def has_drift(report: Dict[str, Dict[str, List[str]]]) -> bool:
+    return any(names for entry in report.values() for names in entry.values())
+
+
+async def ensure_indexes(db, rebuild_changed: bool = False, drop_extra: bool = False) -> Dict[str, Dict[str, List[str]]]:
+    """Create missing indexes and return the drift found before applying
+
+    Changed and undeclared indexes are only dropped when asked to, since that can
+    be expensive on a large collection; startup just reports them.
+    """
+    report = await index_drift(db)
+    for collection, entry in report.items():
+        declared = INDEXES[collection]
+
+        to_drop = list(entry["changed"]) if rebuild_changed else []
+        if drop_extra:
+            to_drop += entry["extra"]
+        for name in to_drop:
+            await db[collection].drop_index(name)
+
+        to_create = entry["missing"] + (entry["changed"] if rebuild_changed else [])
+        for name in to_create:
+            keys, options = declared[name]
+            try:
+                await db[collection].create_indexes([IndexModel(keys, name=name, **options)])
+                logger.info(f"Created index {collection}.{name}")
+            except OperationFailure as e:
+                logger.error(f"Could not create index {collection}.{name}: {str(e)}")
+    return report
@@ -0,0 +1,51 @@
+import argparse
+import asyncio
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from config import get_settings
+from indexes import ensure_indexes, index_drift, has_drift
+
+settings = get_settings()
+client = AsyncIOMotorClient(settings.mongo_url, **settings.mongo_client_options())
+db = client[settings.db_name]
+
+
+def print_report(report):
+    for collection, entry in report.items():
+        for state in ("missing", "changed", "extra"):
+            for name in entry[state]:
+                print(f"  {collection}.{name}: {state}")
+
+
+async def main(args):
+    if args.check:
+        report = await index_drift(db)
+        print("Index drift:" if has_drift(report) else "Indexes match the declared set")
+        print_report(report)
+        return 1 if has_drift(report) else 0
+
+    print("Applying indexes...")
+    report = await ensure_indexes(db, rebuild_changed=True, drop_extra=args.drop_extra)
+    print_report(report)
+
+    remaining = await index_drift(db)
+    if args.drop_extra:
+        drift = has_drift(remaining)
+    else:
+        drift = any(entry["missing"] or entry["changed"] for entry in remaining.values())
+    print("Index drift remains:" if drift else "Indexes are up to date")
+    if drift:
+        print_report(remaining)
+    return 1 if drift else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the MongoDB indexes declared in indexes.py")
+    parser.add_argument("--check", action="store_true", help="only report drift, exit 1 if any")
+    parser.add_argument("--drop-extra", action="store_true", help="also drop indexes that are not declared")
+    args = parser.parse_args()
+    try:
+        sys.exit(asyncio.run(main(args)))
+    finally:
+        client.close()
@@ -1,140 +1,60 @@
+import argparse
 import asyncio
+import sys
 from motor.motor_asyncio import AsyncIOMotorClient
-import os
-from dotenv import load_dotenv
 from pathlib import Path
-import uuid
-from datetime import datetime
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+import cache
+import image_mirror
+from config import get_settings
+from indexes import ensure_indexes
+from seeding import FIXTURES, FIXTURES_DIR, INSERT, UPDATE, ADOPT, DELETE, EDITED, seed_collection
 
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+settings = get_settings()
+client = AsyncIOMotorClient(settings.mongo_url, **settings.mongo_client_options())
+db = client[settings.db_name]
+cache.set_db(db)
+image_mirror.set_db(db)
 
-# Services with working image URLs
-services_data = [
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Débarras d'encombrants",
-        "description": "Nous enlevons rapidement tous vos objets encombrants : meubles, électroménagers, matelas, cartons. Service complet avec tri et évacuation professionnelle.",
-        "image": "https://images.pexels.com/photos/4246196/pexels-photo-4246196.jpeg?auto=compress&cs=tinysrgb&w=800",
-        "order": 1,
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Vide maison complet",
-        "description": "Succession, déménagement ou rénovation ? Nous vidons entièrement votre maison ou appartement avec soin et efficacité. Prise en charge totale de A à Z.",
-        "image": "https://images.pexels.com/photos/4246120/pexels-photo-4246120.jpeg?auto=compress&cs=tinysrgb&w=800",
-        "order": 2,
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Vide cave et grenier",
-        "description": "Libérez vos caves, greniers et garages encombrés. Notre équipe accède aux espaces difficiles et évacue tous vos encombrants en toute sécurité.",
-        "image": "https://images.pexels.com/photos/5025636/pexels-photo-5025636.jpeg?auto=compress&cs=tinysrgb&w=800",
-        "order": 3,
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Débarras de bureau",
-        "description": "Fermeture, déménagement ou réorganisation de bureaux ? Nous nous occupons du débarras professionnel de vos locaux commerciaux et administratifs.",
-        "image": "https://images.pexels.com/photos/3760072/pexels-photo-3760072.jpeg?auto=compress&cs=tinysrgb&w=800",
-        "order": 4,
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    }
-]
 
-# Gallery items with the user's provided images
-gallery_data = [
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Débarras hangar complet",
-        "description": "Avant/Après - Hangar vidé entièrement",
-        "category": "before-after",
-        "image": "https://customer-assets.emergentagent.com/job_debarras-maison-1/artifacts/f6qezot8_AA3.webp",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Débarras garage",
-        "description": "Avant/Après - Garage débarrassé",
-        "category": "before-after",
-        "image": "https://customer-assets.emergentagent.com/job_debarras-maison-1/artifacts/w82wr8bb_13.jpg",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Débarras atelier",
-        "description": "Avant/Après - Atelier entièrement vidé",
-        "category": "before-after",
-        "image": "https://customer-assets.emergentagent.com/job_debarras-maison-1/artifacts/ki46kgfw_debarras-garage-pessac.webp",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Vide appartement",
-        "description": "Avant/Après - Appartement vidé et nettoyé",
-        "category": "before-after",
-        "image": "https://customer-assets.emergentagent.com/job_debarras-maison-1/artifacts/amfvggpz_debarras-pessac.webp",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Vide maison",
-        "description": "Avant/Après - Maison complètement vidée",
-        "category": "before-after",
-        "image": "https://customer-assets.emergentagent.com/job_debarras-maison-1/artifacts/2bahhtus_avant-apres-1024x801.jpg",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    }
-]
+async def init_data(args):
+    print("Dry run, nothing will be written:" if args.dry_run else "Seeding services and gallery...")
+    if not args.dry_run:
+        # The seed_key indexes make the per-batch lookups cheap
+        await ensure_indexes(db)
+
+    changed = []
+    kept = 0
+    for collection, filename in FIXTURES.items():
+        counts = await seed_collection(
+            db, collection, Path(args.fixtures) / filename,
+            batch_size=args.batch_size, dry_run=args.dry_run, force=args.force, prune=args.prune,
+            resolve_urls=image_mirror.local_urls,
+        )
+        summary = ", ".join(f"{count} {action}" for action, count in sorted(counts.items())) or "empty fixture"
+        print(f"{collection}: {summary}")
+        if any(counts.get(action) for action in (INSERT, UPDATE, ADOPT, DELETE)):
+            changed.append(collection)
+        kept += counts.get(EDITED, 0)
+
+    if kept:
+        print(f"\n{kept} document(s) edited since they were seeded were left as they are (use --force to overwrite)")
+    if changed and not args.dry_run:
+        # Running servers rebuild their cached public payloads
+        await cache.invalidate(*changed)
+    print("\nData initialization complete!" if not args.dry_run else "\nDry run complete")
+    return 0
 
-async def init_data():
-    print("Initializing data in database...")
-    
-    # Clear existing services
-    await db.services.delete_many({})
-    print("Cleared existing services")
-    
-    # Insert new services
-    result = await db.services.insert_many(services_data)
-    print(f"Inserted {len(result.inserted_ids)} services")
-    
-    # Clear existing gallery items
-    await db.gallery.delete_many({})
-    print("Cleared existing gallery items")
-    
-    # Insert new gallery items
-    result = await db.gallery.insert_many(gallery_data)
-    print(f"Inserted {len(result.inserted_ids)} gallery items")
-    
-    # Verify services
-    services = await db.services.find().to_list(100)
-    print(f"\nServices in database:")
-    for service in services:
-        print(f"  - {service['title']} ({service['image'][:50]}...)")
-    
-    # Verify gallery
-    gallery = await db.gallery.find().to_list(100)
-    print(f"\nGallery items in database:")
-    for item in gallery:
-        print(f"  - {item['title']} ({item['category']})")
-    
-    print("\nData initialization complete!")
-    client.close()
 
 if __name__ == "__main__":
-    asyncio.run(init_data())
+    parser = argparse.ArgumentParser(description="Idempotently seed services and gallery items from NDJSON fixtures")
+    parser.add_argument("--dry-run", action="store_true", help="print the diff without writing")
+    parser.add_argument("--force", action="store_true", help="also overwrite documents edited since they were seeded")
+    parser.add_argument("--prune", action="store_true", help="delete seeded documents no longer in the fixtures")
+    parser.add_argument("--batch-size", type=int, default=500, help="fixture lines per bulk write")
+    parser.add_argument("--fixtures", default=str(FIXTURES_DIR), help="directory holding the fixture files")
+    args = parser.parse_args()
+    try:
+        sys.exit(asyncio.run(init_data(args)))
+    finally:
+        client.close()
@@ -0,0 +1,43 @@
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# One document per background job that must run on a single worker at a time
+LEASES_COLLECTION = "job_leases"
+
+# These will be set by server.py
+db = None
+
+def set_db(database):
+    global db
+    db = database
+
+
+async def acquire(name: str, seconds: float) -> Optional[str]:
+    """Take the lease of job `name` unless another worker holds it; returns the holder token, else None
+
+    The lease lapses on its own after `seconds`, so a crashed holder does not
+    block the job for good.
+    """
+    now = datetime.utcnow()
+    holder = uuid.uuid4().hex
+    try:
+        # Matches only a lapsed lease; a held one makes the upsert collide on _id
+        await db[LEASES_COLLECTION].update_one(
+            {"_id": name, "until": {"$lte": now}},
+            {"$set": {"until": now + timedelta(seconds=seconds), "holder": holder}},
+            upsert=True,
+        )
+        return holder
+    except DuplicateKeyError:
+        return None
+
+
+async def release(name: str, holder: str):
+    """Give the lease back, unless it lapsed and another worker has taken it since"""
+    await db[LEASES_COLLECTION].update_one({"_id": name, "holder": holder}, {"$set": {"until": datetime.utcnow()}})
@@ -0,0 +1,187 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Prometheus text exposition format, version 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (16384, 65536, 262144, 1048576, 2097152, 5242880, 10485760, 26214400)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Mongo listeners run on driver threads, so updates take a (nearly always uncontended) lock
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic count per label combination"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in values]
+
+
+class Histogram(_Metric):
+    """Observations counted into fixed buckets per label combination"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        lines = []
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def render() -> bytes:
+    """Every metric of this process in Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return ("\n".join(lines) + "\n").encode()
+
+
+# ==================== METRICS ====================
+
+http_request_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route"))
+http_requests = Counter(
+    "http_requests_total", "HTTP responses by route template and status", ("method", "route", "status"))
+mongo_command_seconds = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency", ("command",))
+mongo_command_failures = Counter(
+    "mongodb_command_failures_total", "MongoDB commands that failed", ("command",))
+email_send_seconds = Histogram(
+    "email_send_duration_seconds", "Resend API call latency", ("outcome",))
+email_send_failures = Counter(
+    "email_send_failures_total", "Emails Resend did not accept")
+upload_bytes = Histogram(
+    "upload_size_bytes", "Size of stored uploads", buckets=BYTES_BUCKETS)
+upload_seconds = Histogram(
+    "upload_duration_seconds", "Time to stream an upload to disk", ("outcome",))
+image_mirror_fetches = Counter(
+    "image_mirror_fetches_total", "External images fetched by the mirror job", ("outcome",))
+upload_gc_reclaimed_bytes = Counter(
+    "upload_gc_reclaimed_bytes_total", "Bytes freed by deleting unreferenced uploads")
+upload_gc_deleted_files = Counter(
+    "upload_gc_deleted_files_total", "Unreferenced upload files deleted", ("kind",))
+
+
+# ==================== COLLECTORS ====================
+
+class MetricsMiddleware:
+    """Times every HTTP request, labelled by the matched route template rather than the raw path"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            if route is not None:
+                template = route.path
+            elif scope.get("root_path", "").endswith("/api/uploads"):
+                template = "/api/uploads"
+            else:
+                # Unmatched paths share one label so scanners cannot blow up the series count
+                template = "unmatched"
+            method = scope["method"]
+            http_request_seconds.observe(time.perf_counter() - start, method, template)
+            http_requests.inc(method, template, status)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Pymongo command listener feeding the MongoDB histograms; pass it in event_listeners"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, event.command_name)
+        mongo_command_failures.inc(event.command_name)
@@ -0,0 +1,38 @@
+import argparse
+import asyncio
+import logging
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import cache
+import image_mirror
+from config import get_settings
+
+settings = get_settings()
+client = AsyncIOMotorClient(settings.mongo_url, **settings.mongo_client_options())
+db = client[settings.db_name]
+cache.set_db(db)
+image_mirror.set_db(db)
+
+
+async def main(args):
+    counts = await image_mirror.mirror_once(force=args.force, dry_run=args.dry_run)
+    if args.dry_run:
+        print(f"{counts.get('due', 0)} image(s) would be fetched, {counts['pruned']} unused source(s) dropped")
+        return 0
+    print(f"Fetched {counts.get(image_mirror.FETCHED, 0)}, unchanged {counts.get(image_mirror.NOT_MODIFIED, 0)}, "
+          f"failed {counts.get(image_mirror.FAILED, 0)}; rewrote {counts.get('rewritten', 0)} document(s), "
+          f"dropped {counts['pruned']} unused source(s)")
+    return 1 if counts.get(image_mirror.FAILED) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy externally hosted service and gallery images into the uploads store")
+    parser.add_argument("--force", action="store_true", help="re-check every mirrored image now, not only the due ones")
+    parser.add_argument("--dry-run", action="store_true", help="list the images that would be fetched")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    try:
+        sys.exit(asyncio.run(main(args)))
+    finally:
+        client.close()
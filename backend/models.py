@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 import uuid
 
@@ -17,6 +17,8 @@ class Service(BaseModel):
     order: int = 0
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Computed on read: image field -> format -> width -> URL; never stored
+    image_variants: Optional[Dict[str, Dict[str, Dict[str, str]]]] = None
 
 class ServiceCreate(BaseModel):
     title: str
@@ -30,6 +32,12 @@ class ServiceUpdate(BaseModel):
     image: Optional[str] = None
     order: Optional[int] = None
 
+class ServiceReorder(BaseModel):
+    ids: List[str]
+
+class BatchDelete(BaseModel):
+    ids: List[str]
+
 class GalleryItem(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     title: Optional[str] = None
@@ -40,6 +48,8 @@ class GalleryItem(BaseModel):
     image: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Computed on read: image field -> format -> width -> URL; never stored
+    image_variants: Optional[Dict[str, Dict[str, Dict[str, str]]]] = None
 
 class GalleryItemCreate(BaseModel):
     title: Optional[str] = None
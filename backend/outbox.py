@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+import email_transport
+from config import get_settings
+from email_service import deliver_contact_email, deliver_digest_email, is_urgent, EmailError
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "email_outbox"
+
+# Job states
+PENDING = "pending"
+PROCESSING = "processing"
+SENT = "sent"
+# Emails are not set up (no RESEND_API_KEY); the submission is only kept in Mongo
+SKIPPED = "skipped"
+DEAD = "dead"
+
+# These will be set by server.py
+db = None
+
+def set_db(database):
+    global db
+    db = database
+
+
+_wakeup: Optional[asyncio.Event] = None
+_worker_task: Optional[asyncio.Task] = None
+_digest_task: Optional[asyncio.Task] = None
+_in_flight: set = set()
+
+
+def backoff_delay(attempts: int) -> float:
+    """Seconds to wait before retrying a job that has failed `attempts` times"""
+    settings = get_settings()
+    return min(settings.outbox_backoff_seconds * (2 ** (attempts - 1)), settings.outbox_backoff_max_seconds)
+
+
+async def enqueue_contact_email(contact: Dict) -> str:
+    """Store a contact notification in the outbox and wake the worker
+
+    In digest mode non-urgent notifications wait for the next digest instead.
+    """
+    now = datetime.utcnow()
+    job = {
+        "id": str(uuid.uuid4()),
+        "kind": "contact",
+        "payload": contact,
+        "digest": get_settings().email_digest_mode and not is_urgent(contact),
+        "status": PENDING,
+        "attempts": 0,
+        "next_attempt_at": now,
+        "last_error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    await db[OUTBOX_COLLECTION].insert_one(job)
+    if _wakeup is not None and not job["digest"]:
+        _wakeup.set()
+    return job["id"]
+
+
+async def _claim() -> Optional[dict]:
+    now = datetime.utcnow()
+    return await db[OUTBOX_COLLECTION].find_one_and_update(
+        {"digest": {"$ne": True}, "$or": [
+            {"status": PENDING, "next_attempt_at": {"$lte": now}},
+            {"status": PROCESSING, "lease_until": {"$lt": now}},
+        ]},
+        {
+            "$set": {"status": PROCESSING, "lease_until": now + timedelta(seconds=get_settings().outbox_lease_seconds),
+                     "updated_at": now},
+            "$inc": {"attempts": 1},
+        },
+        sort=[("next_attempt_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _send(jobs: List[dict]) -> Optional[str]:
+    """Send one job, or several as a digest; returns the error, if any"""
+    try:
+        if len(jobs) == 1 and not jobs[0].get("digest"):
+            await deliver_contact_email(jobs[0]["payload"])
+        else:
+            await deliver_digest_email([job["payload"] for job in jobs])
+        return None
+    except EmailError as e:
+        return str(e)
+    except Exception as e:
+        logger.exception(f"Unexpected error sending outbox jobs {[job['id'] for job in jobs]}")
+        return f"{type(e).__name__}: {str(e)}"
+
+
+async def _process(jobs: List[dict]):
+    ids = [job["id"] for job in jobs]
+    # Without a transport there is nothing to retry; the job is closed, not failed
+    skipped = email_transport.get_transport() is None
+    error = None if skipped else await _send(jobs)
+
+    now = datetime.utcnow()
+    attempts = max(job["attempts"] for job in jobs)
+    if skipped:
+        logger.info(f"Outbox jobs {ids} skipped: RESEND_API_KEY not configured")
+        update = {"status": SKIPPED, "last_error": None}
+    elif error is None:
+        update = {"status": SENT, "sent_at": now, "last_error": None}
+    elif attempts >= get_settings().outbox_max_attempts:
+        logger.error(f"Outbox jobs {ids} dead after {attempts} attempts: {error}")
+        update = {"status": DEAD, "last_error": error}
+    else:
+        delay = backoff_delay(attempts)
+        logger.warning(f"Outbox jobs {ids} failed (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+        update = {"status": PENDING, "next_attempt_at": now + timedelta(seconds=delay), "last_error": error}
+    update["updated_at"] = now
+
+    await db[OUTBOX_COLLECTION].update_many(
+        {"id": {"$in": ids}}, {"$set": update, "$unset": {"lease_until": "", "batch_id": ""}}
+    )
+    if update["status"] == PENDING and _wakeup is not None:
+        asyncio.get_running_loop().call_later(delay, _wakeup.set)
+
+
+async def _flush_digest():
+    """Send waiting digest jobs once the oldest is digest_window_seconds old or enough have piled up"""
+    settings = get_settings()
+    max_items = settings.digest_max_items
+    now = datetime.utcnow()
+    ready = {"digest": True, "$or": [
+        {"status": PENDING, "next_attempt_at": {"$lte": now}},
+        {"status": PROCESSING, "lease_until": {"$lt": now}},
+    ]}
+    candidates = await db[OUTBOX_COLLECTION].find(
+        ready, {"_id": 0, "id": 1, "created_at": 1}
+    ).sort("created_at", 1).limit(max_items).to_list(max_items)
+    if not candidates:
+        return
+    window_start = now - timedelta(seconds=settings.digest_window_seconds)
+    if len(candidates) < max_items and candidates[0]["created_at"] > window_start:
+        return
+
+    # Claim under a batch id so concurrent workers never send the same job twice
+    batch_id = str(uuid.uuid4())
+    await db[OUTBOX_COLLECTION].update_many(
+        {**ready, "id": {"$in": [job["id"] for job in candidates]}},
+        {
+            "$set": {"status": PROCESSING, "batch_id": batch_id,
+                     "lease_until": now + timedelta(seconds=settings.outbox_lease_seconds), "updated_at": now},
+            "$inc": {"attempts": 1},
+        },
+    )
+    jobs = await db[OUTBOX_COLLECTION].find(
+        {"batch_id": batch_id, "status": PROCESSING}
+    ).sort("created_at", 1).to_list(max_items)
+    if jobs:
+        await _process(jobs)
+
+
+async def _digest_loop():
+    while True:
+        try:
+            await _flush_digest()
+        except PyMongoError as e:
+            logger.warning(f"Digest flush failed: {str(e)}")
+        await asyncio.sleep(get_settings().outbox_poll_interval)
+
+
+async def _run():
+    slots = asyncio.Semaphore(get_settings().outbox_concurrency)
+    while True:
+        await slots.acquire()
+        # Cleared before claiming so an enqueue racing with an empty claim still wakes us
+        _wakeup.clear()
+        try:
+            job = await _claim()
+        except PyMongoError as e:
+            logger.warning(f"Outbox claim failed: {str(e)}")
+            job = None
+
+        if job is None:
+            slots.release()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), get_settings().outbox_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        task = asyncio.create_task(_process([job]))
+        _in_flight.add(task)
+        task.add_done_callback(_in_flight.discard)
+        task.add_done_callback(lambda _: slots.release())
+
+
+async def start():
+    """Start the background worker"""
+    global _wakeup, _worker_task, _digest_task
+    _wakeup = asyncio.Event()
+    _worker_task = asyncio.create_task(_run())
+    # Also runs when digest mode is off, to drain digest jobs queued before it was switched off
+    _digest_task = asyncio.create_task(_digest_loop())
+
+
+async def stop(timeout: float = 10):
+    """Stop claiming jobs and give in-flight sends a moment to finish
+
+    Anything still running after `timeout` is retried by another worker once
+    its lease expires.
+    """
+    global _worker_task, _digest_task
+    for task in (_worker_task, _digest_task):
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    _worker_task = _digest_task = None
+    if _in_flight:
+        await asyncio.wait(list(_in_flight), timeout=timeout)
+
+
+async def stats(failure_limit: int = 20) -> dict:
+    """Queue depth per state and the most recent failures"""
+    counts = {PENDING: 0, PROCESSING: 0, SENT: 0, SKIPPED: 0, DEAD: 0}
+    async for row in db[OUTBOX_COLLECTION].aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+        counts[row["_id"]] = row["count"]
+
+    failures = await db[OUTBOX_COLLECTION].find(
+        {"last_error": {"$ne": None}, "status": {"$nin": [SENT, SKIPPED]}},
+        {"_id": 0, "payload": 0},
+    ).sort("updated_at", -1).limit(failure_limit).to_list(failure_limit)
+
+    return {
+        "depth": counts[PENDING] + counts[PROCESSING],
+        "counts": counts,
+        "failures": failures,
+    }
+
+
+async def retry(job_id: str) -> bool:
+    """Move a dead job back to pending; returns False if there is no such dead job"""
+    now = datetime.utcnow()
+    result = await db[OUTBOX_COLLECTION].update_one(
+        {"id": job_id, "status": DEAD},
+        {"$set": {"status": PENDING, "attempts": 0, "next_attempt_at": now, "updated_at": now}},
+    )
+    if result.modified_count and _wakeup is not None:
+        _wakeup.set()
+    return result.modified_count > 0
@@ -0,0 +1,70 @@
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+# Sort order shared by every paginated contact listing; (created_at, id) is unique
+CONTACT_SORT = [("created_at", -1), ("id", -1)]
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """Mongo stores naive UTC datetimes, so compare against the same"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def encode_cursor(created_at: datetime, doc_id: str) -> str:
+    """Encode the sort key of the last document of a page as an opaque cursor"""
+    raw = json.dumps([_naive_utc(created_at).isoformat(), doc_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decode a cursor produced by encode_cursor, raising ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), str(doc_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def after_cursor(cursor: str) -> dict:
+    """Filter selecting documents that sort after the cursor in CONTACT_SORT order"""
+    created_at, doc_id = decode_cursor(cursor)
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": doc_id}},
+    ]}
+
+
+def contact_filter(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    subject: Optional[str] = None,
+    postal_code: Optional[str] = None,
+) -> dict:
+    """Build the Mongo filter for the admin contact listing"""
+    query = {}
+    if date_from or date_to:
+        query["created_at"] = {}
+        if date_from:
+            query["created_at"]["$gte"] = _naive_utc(date_from)
+        if date_to:
+            query["created_at"]["$lt"] = _naive_utc(date_to)
+    if subject:
+        query["subject"] = subject
+    if postal_code:
+        query["postalCode"] = postal_code
+    return query
+
+
+def combine(*filters: dict) -> dict:
+    """AND together the non-empty filters"""
+    filters = [f for f in filters if f]
+    if not filters:
+        return {}
+    if len(filters) == 1:
+        return filters[0]
+    return {"$and": filters}
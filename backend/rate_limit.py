@@ -0,0 +1,177 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_COLLECTION = "rate_limits"
+FINGERPRINTS_COLLECTION = "contact_fingerprints"
+
+# These will be set by server.py
+db = None
+
+def set_db(database):
+    global db
+    db = database
+
+
+class MemoryBackend:
+    """Token buckets and fingerprints in bounded LRUs local to this worker"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._fingerprints: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    def _store(self, entries: OrderedDict, key: str, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    async def take(self, key: str, burst: int, per_second: float) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * per_second)
+        allowed = tokens >= 1
+        self._store(self._buckets, key, (tokens - 1 if allowed else tokens, now))
+        return 0.0 if allowed else (1 - tokens) / per_second
+
+    async def remember(self, fingerprint: str, contact_id: str, window: int) -> Optional[str]:
+        now = time.monotonic()
+        entry = self._fingerprints.get(fingerprint)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        self._store(self._fingerprints, fingerprint, (contact_id, now + window))
+        return None
+
+    async def forget(self, fingerprint: str, contact_id: str):
+        entry = self._fingerprints.get(fingerprint)
+        if entry is not None and entry[0] == contact_id:
+            del self._fingerprints[fingerprint]
+
+
+class MongoBackend:
+    """Token buckets and fingerprints in Mongo, shared by every worker
+
+    Each check is a single atomic update; expired documents are removed by TTL indexes.
+    """
+
+    async def take(self, key: str, burst: int, per_second: float) -> float:
+        now = datetime.utcnow()
+        # Refill from the elapsed time, then spend one token if there is one
+        pipeline = [
+            {"$set": {
+                "tokens": {"$min": [burst, {"$add": [
+                    {"$ifNull": ["$tokens", burst]},
+                    {"$multiply": [
+                        {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]},
+                        per_second,
+                    ]},
+                ]}]},
+                "updated_at": now,
+                "expires_at": now + timedelta(seconds=burst / per_second),
+            }},
+            {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+            {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+        ]
+        try:
+            doc = await db[BUCKETS_COLLECTION].find_one_and_update(
+                {"_id": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Lost a race creating the bucket; it exists now
+            doc = await db[BUCKETS_COLLECTION].find_one_and_update(
+                {"_id": key}, pipeline, return_document=ReturnDocument.AFTER
+            )
+        return 0.0 if doc["allowed"] else (1 - doc["tokens"]) / per_second
+
+    async def remember(self, fingerprint: str, contact_id: str, window: int) -> Optional[str]:
+        now = datetime.utcnow()
+        try:
+            # Matches only an expired fingerprint the TTL monitor has not removed yet
+            await db[FINGERPRINTS_COLLECTION].update_one(
+                {"_id": fingerprint, "expires_at": {"$lte": now}},
+                {"$set": {"contact_id": contact_id, "expires_at": now + timedelta(seconds=window)}},
+                upsert=True,
+            )
+            return None
+        except DuplicateKeyError:
+            doc = await db[FINGERPRINTS_COLLECTION].find_one({"_id": fingerprint}, {"contact_id": 1})
+            return doc["contact_id"] if doc else None
+
+    async def forget(self, fingerprint: str, contact_id: str):
+        await db[FINGERPRINTS_COLLECTION].delete_one({"_id": fingerprint, "contact_id": contact_id})
+
+
+BACKENDS = {"memory": lambda settings: MemoryBackend(settings.rate_limit_max_keys), "mongo": lambda _: MongoBackend()}
+
+_backend = None
+
+
+def get_backend():
+    """The backend selected by rate_limit_backend, created on first use"""
+    global _backend
+    if _backend is None:
+        settings = get_settings()
+        if settings.rate_limit_backend not in BACKENDS:
+            raise RuntimeError(f"Unknown RATE_LIMIT_BACKEND {settings.rate_limit_backend!r}")
+        _backend = BACKENDS[settings.rate_limit_backend](settings)
+    return _backend
+
+
+def set_backend(backend):
+    """Use an explicit backend instead of the configured one (tests, or None to re-read the settings)"""
+    global _backend
+    _backend = backend
+
+
+def client_ip(request: Request) -> str:
+    """Address of the client, looking through trusted_proxy_hops proxies"""
+    hops = get_settings().trusted_proxy_hops
+    if hops > 0:
+        forwarded = [part.strip() for part in request.headers.get('x-forwarded-for', '').split(',') if part.strip()]
+        if forwarded:
+            # Entries left of the ones added by our own proxies are set by the client and can be forged
+            return forwarded[-min(hops, len(forwarded))]
+    return request.client.host if request.client else "unknown"
+
+
+async def check_contact(ip: str, email: str) -> float:
+    """Spend one token from the IP and email buckets; returns seconds to wait, 0 if allowed"""
+    settings = get_settings()
+    backend = get_backend()
+    retry_after = await backend.take(f"contact:ip:{ip}", settings.contact_ip_burst, settings.contact_ip_per_hour / 3600)
+    if retry_after:
+        return retry_after
+    return await backend.take(f"contact:email:{email.strip().lower()}",
+                              settings.contact_email_burst, settings.contact_email_per_hour / 3600)
+
+
+def contact_fingerprint(contact: Dict) -> str:
+    """Hash of the fields that make two submissions the same message"""
+    parts = (
+        (contact.get('name') or '').strip().lower(),
+        (contact.get('email') or '').strip().lower(),
+        ' '.join((contact.get('message') or '').split()),
+    )
+    return hashlib.sha256('\x00'.join(parts).encode()).hexdigest()
+
+
+async def find_duplicate(contact: Dict, contact_id: str) -> Optional[str]:
+    """Id of an identical submission within duplicate_window_seconds, else record this one and return None"""
+    return await get_backend().remember(contact_fingerprint(contact), contact_id, get_settings().duplicate_window_seconds)
+
+
+async def forget_duplicate(contact: Dict, contact_id: str):
+    """Undo find_duplicate for a submission that was not stored after all, so a retry goes through"""
+    await get_backend().forget(contact_fingerprint(contact), contact_id)
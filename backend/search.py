@@ -0,0 +1,64 @@
+import re
+import unicodedata
+from typing import Dict, List, Tuple
+
+# Fields covered by the contacts text index, with their relative weights
+CONTACT_TEXT_FIELDS = {"name": 10, "email": 10, "subject": 5, "message": 1}
+# Most submissions are in French; sets the stemming and stop words of the index
+TEXT_LANGUAGE = "french"
+
+TOKEN = re.compile(r'"([^"]+)"|(\S+)')
+
+
+def query_terms(query: str) -> List[str]:
+    """Phrases and words of a $text search string, without negated ones"""
+    terms = []
+    for phrase, word in TOKEN.findall(query):
+        if phrase:
+            terms.append(phrase)
+        elif not word.startswith('-'):
+            terms.append(word)
+    return [term for term in terms if term.strip()]
+
+
+def _fold(text: str) -> str:
+    """Lowercase and strip accents character by character, so offsets stay aligned with `text`"""
+    folded = []
+    for char in text:
+        base = unicodedata.normalize('NFD', char)[0]
+        folded.append(base.lower() if len(base.lower()) == 1 else char)
+    return ''.join(folded)
+
+
+def _stem(term: str) -> str:
+    # The text index matches on stems; a prefix is close enough to mark "déménagement" for "déménagements"
+    return term[:max(4, len(term) - 3)] if len(term) > 5 else term
+
+
+def highlight_pattern(terms: List[str]):
+    """Regex matching the words a text search would have matched, or None"""
+    parts = []
+    for term in terms:
+        words = _fold(term).split()
+        if len(words) > 1:
+            parts.append(r'\s+'.join(re.escape(word) for word in words))
+        elif words:
+            parts.append(re.escape(_stem(words[0])) + r'\w*')
+    if not parts:
+        return None
+    return re.compile(r'(?<!\w)(?:' + '|'.join(sorted(parts, key=len, reverse=True)) + r')')
+
+
+def highlights(doc: dict, pattern) -> Dict[str, List[Tuple[int, int]]]:
+    """Character ranges [start, end) per field that matched the search"""
+    found = {}
+    if pattern is None:
+        return found
+    for field in CONTACT_TEXT_FIELDS:
+        value = doc.get(field)
+        if not value:
+            continue
+        spans = [match.span() for match in pattern.finditer(_fold(value))]
+        if spans:
+            found[field] = spans
+    return found
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+from pymongo import InsertOne, UpdateOne, DeleteOne
+
+logger = logging.getLogger(__name__)
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+# Collection -> fixture file; documents are matched on their `seed_key`
+FIXTURES = {
+    "services": "services.ndjson",
+    "gallery": "gallery.ndjson",
+}
+SEED_KEY = "seed_key"
+SEED_CHECKSUM = "seed_checksum"
+
+# Actions reported per document
+INSERT = "insert"
+UPDATE = "update"
+ADOPT = "adopt"
+UNCHANGED = "unchanged"
+EDITED = "edited"
+DELETE = "delete"
+
+
+def read_fixtures(path: Path, batch_size: int) -> Iterator[List[dict]]:
+    """Stream an NDJSON fixture file in batches, without loading it whole"""
+    batch = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            doc = json.loads(line)
+            if not doc.get(SEED_KEY):
+                raise ValueError(f"{path.name}:{line_number}: missing {SEED_KEY}")
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def checksum(fields: dict) -> str:
+    """Stable hash of the seeded fields of a document"""
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+def _seeded_fields(fixture: dict) -> dict:
+    return {k: v for k, v in fixture.items() if k != SEED_KEY}
+
+
+# Fields every document has that do not come from a fixture
+DOCUMENT_FIELDS = (SEED_KEY, SEED_CHECKSUM, "id", "created_at", "updated_at")
+
+
+def stored_fields(doc: dict) -> dict:
+    """The fields of a stored document that the seed checksum covers"""
+    return {k: v for k, v in doc.items() if k not in DOCUMENT_FIELDS and k != "_id"}
+
+
+def _diff(current: dict, fields: dict) -> Dict[str, tuple]:
+    return {k: (current.get(k), v) for k, v in fields.items() if current.get(k) != v}
+
+
+def _dropped(current: dict, fields: dict) -> List[str]:
+    """Stored fields the fixture no longer has"""
+    return [k for k in stored_fields(current) if k not in fields]
+
+
+def plan(fixture: dict, current: Optional[dict], force: bool = False) -> tuple:
+    """Decide what to do with one fixture given the stored document it maps to
+
+    Returns (action, changed fields). A document whose seeded fields were edited
+    since the last seed (e.g. in the admin dashboard) is left alone unless `force`.
+    """
+    fields = _seeded_fields(fixture)
+    if current is None:
+        return INSERT, _diff({}, fields)
+    changes = _diff(current, fields)
+    stored = current.get(SEED_CHECKSUM)
+    if stored is None:
+        # Seeded before seed keys existed and matched on its title
+        return (ADOPT, changes) if not changes or force else (EDITED, changes)
+    changes.update({k: (current[k], None) for k in _dropped(current, fields)})
+    if not changes:
+        return UNCHANGED, changes
+    # Over every stored field, as prune does, so adding or dropping a fixture field is not an edit
+    edited = checksum(stored_fields(current)) != stored
+    return (EDITED, changes) if edited and not force else (UPDATE, changes)
+
+
+def _write(action: str, fixture: dict, current: Optional[dict], now: datetime):
+    fields = _seeded_fields(fixture)
+    seed = {SEED_KEY: fixture[SEED_KEY], SEED_CHECKSUM: checksum(fields)}
+    if action == INSERT:
+        return InsertOne({"id": str(uuid.uuid4()), **fields, **seed, "created_at": now, "updated_at": now})
+    update = {"$set": {**fields, **seed, "updated_at": now}}
+    if action == UPDATE:
+        # Keeps the stored fields equal to what the checksum covers
+        dropped = _dropped(current, fields)
+        if dropped:
+            update["$unset"] = {k: "" for k in dropped}
+    return UpdateOne({"id": current["id"]}, update)
+
+
+async def seed_collection(db, collection: str, path: Path, batch_size: int = 500, dry_run: bool = False,
+                          force: bool = False, prune: bool = False, report=print,
+                          resolve_urls: Optional[Callable[[Iterable[str]], Awaitable[Dict[str, str]]]] = None
+                          ) -> Dict[str, int]:
+    """Bring a collection in line with its fixture file; returns counts per action
+
+    `resolve_urls` maps fixture URLs to the ones stored instead (local mirrors of
+    external images), so mirrored documents do not show up as changed.
+    """
+    counts: Dict[str, int] = {}
+    seen_keys = set()
+    now = datetime.utcnow()
+
+    for batch in read_fixtures(path, batch_size):
+        if resolve_urls is not None:
+            resolved = await resolve_urls(v for fixture in batch for v in fixture.values() if isinstance(v, str))
+            batch = [{k: resolved.get(v, v) if isinstance(v, str) else v for k, v in fixture.items()}
+                     for fixture in batch]
+        keys = [fixture[SEED_KEY] for fixture in batch]
+        seen_keys.update(keys)
+        existing = {doc[SEED_KEY]: doc async for doc in db[collection].find({SEED_KEY: {"$in": keys}}, {"_id": 0})}
+
+        # Documents from before seed keys existed are matched on their title
+        unmatched = {fixture["title"]: fixture[SEED_KEY] for fixture in batch
+                     if fixture[SEED_KEY] not in existing and fixture.get("title")}
+        if unmatched:
+            async for doc in db[collection].find({"title": {"$in": list(unmatched)}, SEED_KEY: {"$exists": False}},
+                                                 {"_id": 0}):
+                existing.setdefault(unmatched[doc["title"]], doc)
+
+        requests = []
+        for fixture in batch:
+            current = existing.get(fixture[SEED_KEY])
+            action, changes = plan(fixture, current, force)
+            counts[action] = counts.get(action, 0) + 1
+            if action != UNCHANGED:
+                report(f"  {collection}: {action} {fixture[SEED_KEY]}")
+                for field, (old, new) in changes.items():
+                    if action != INSERT:
+                        report(f"      {field}: {old!r} -> {new!r}")
+            if action in (INSERT, UPDATE, ADOPT):
+                requests.append(_write(action, fixture, current, now))
+
+        if requests and not dry_run:
+            await db[collection].bulk_write(requests, ordered=False)
+
+    if prune:
+        requests = []
+        stale = db[collection].find({SEED_KEY: {"$exists": True, "$nin": list(seen_keys)}}, {"_id": 0})
+        async for doc in stale:
+            if checksum(stored_fields(doc)) != doc.get(SEED_CHECKSUM) and not force:
+                counts[EDITED] = counts.get(EDITED, 0) + 1
+                report(f"  {collection}: kept {doc[SEED_KEY]} (removed from fixtures but edited since)")
+                continue
+            counts[DELETE] = counts.get(DELETE, 0) + 1
+            report(f"  {collection}: {DELETE} {doc[SEED_KEY]}")
+            requests.append(DeleteOne({"id": doc["id"]}))
+        if requests and not dry_run:
+            await db[collection].bulk_write(requests, ordered=False)
+
+    return counts
@@ -0,0 +1,36 @@
+from typing import Any, Iterable, Type
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+from models import Service, GalleryItem, ContactForm
+
+
+def projection(model: Type[BaseModel], computed: Iterable[str] = ()) -> dict:
+    """Mongo projection returning exactly the stored fields of a response model
+
+    Documents fetched with it can be serialized as they are, without building
+    the model again; validation happens when they are written.
+    """
+    fields = {name: 1 for name in model.model_fields if name not in computed}
+    return {"_id": 0, **fields}
+
+
+SERVICE_PROJECTION = projection(Service, computed=("image_variants",))
+GALLERY_PROJECTION = projection(GalleryItem, computed=("image_variants",))
+CONTACT_PROJECTION = projection(ContactForm)
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize plain documents (str keys, datetimes, lists) straight to JSON bytes"""
+    return orjson.dumps(content)
+
+
+def json_response(content: Any, **kwargs) -> ORJSONResponse:
+    """Response that skips FastAPI's response_model validation and jsonable_encoder
+
+    Only for content that is already in the response shape, e.g. documents read
+    with one of the projections above.
+    """
+    return ORJSONResponse(content, **kwargs)
@@ -1,101 +1,297 @@
-from fastapi import FastAPI, APIRouter
-from fastapi.staticfiles import StaticFiles
-from dotenv import load_dotenv
+import config
+from fastapi import FastAPI, APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse, Response
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-import os
+import asyncio
 import logging
-from pathlib import Path
+from contextlib import asynccontextmanager
+from typing import Optional
 from models import ContactFormCreate, ContactForm
-from email_service import send_contact_email
-import uuid
-from datetime import datetime
+import analytics
+import auth
+import cache
+import email_service
+import email_transport
+import outbox
+import rate_limit
+import image_variants
+import image_mirror
+import leases
+import upload_gc
+import metrics
+from serialization import SERVICE_PROJECTION, GALLERY_PROJECTION
+import storage
+from static_files import UploadsStaticFiles, RedirectUploads
+from indexes import ensure_indexes
+from pymongo.errors import PyMongoError
+import math
 
 # Import admin routes
-from admin_routes import router as admin_router, set_db
+import admin_routes
+from admin_routes import router as admin_router
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+ROOT_DIR = config.ROOT_DIR
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
 
-# Set database for admin routes
-set_db(db)
+# These will be set by the lifespan handler of create_app
+client: Optional[AsyncIOMotorClient] = None
+db = None
 
-# Create the main app without a prefix
-app = FastAPI()
+def set_db(database):
+    """Give every module that talks to Mongo the same database handle"""
+    global db
+    db = database
+    admin_routes.set_db(database)
+    analytics.set_db(database)
+    cache.set_db(database)
+    image_mirror.set_db(database)
+    image_variants.set_db(database)
+    leases.set_db(database)
+    upload_gc.set_db(database)
+    auth.set_db(database)
+    outbox.set_db(database)
+    rate_limit.set_db(database)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# Mount uploads directory for serving static files (under /api/uploads for proper routing)
-uploads_dir = ROOT_DIR / "uploads"
-uploads_dir.mkdir(exist_ok=True)
+# Probes and metrics live outside /api
+ops_router = APIRouter()
 
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
     return {"message": "Hello World"}
 
-# Health check endpoint for Kubernetes deployment
-@app.get("/health")
+# ==================== HEALTH ====================
+
+async def _mongo_ping(timeout: float) -> Optional[str]:
+    """None if Mongo answers in time, otherwise the reason it did not"""
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout)
+        return None
+    except asyncio.TimeoutError:
+        return f"no answer within {timeout}s"
+    except PyMongoError as e:
+        return str(e)
+
+@ops_router.get("/health")
+@ops_router.get("/health/live")
 async def health_check():
+    """Liveness: the process is up; never depends on Mongo, so an outage does not restart pods"""
     return {"status": "healthy"}
 
+@ops_router.get("/health/ready")
+async def readiness_check(request: Request):
+    """Readiness: startup warm-up finished and Mongo answers a ping"""
+    if not request.app.state.ready:
+        return ORJSONResponse({"status": "starting"}, status_code=503)
+    error = await _mongo_ping(config.get_settings().health_timeout_seconds)
+    if error:
+        return ORJSONResponse({"status": "unavailable", "mongo": error}, status_code=503)
+    return {"status": "ready"}
+
+@ops_router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus metrics of this worker"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# ==================== PUBLIC ROUTES ====================
+
 @api_router.post("/contact")
-async def create_contact(contact: ContactFormCreate):
-    """Create contact form submission, save to database and send email"""
+async def create_contact(contact: ContactFormCreate, request: Request):
+    """Create contact form submission, save to database and queue the email notification"""
     contact_dict = contact.dict()
+
+    # Rate limited per client IP and per email, checked before any write
+    retry_after = await rate_limit.check_contact(rate_limit.client_ip(request), contact.email)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Trop de messages envoyés, veuillez réessayer plus tard",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
     contact_obj = ContactForm(**contact_dict)
-    
+
+    # The same message sent again (double click, bot replay) is acknowledged without storing or emailing it
+    duplicate_of = await rate_limit.find_duplicate(contact_dict, contact_obj.id)
+    if duplicate_of:
+        logger.info(f"Duplicate contact form submission from {contact_dict.get('email')} ignored")
+        return {"message": "Contact form submitted successfully", "id": duplicate_of, "email_queued": False}
+
     # Save to database
-    await db.contacts.insert_one(contact_obj.dict())
-    
-    # Send email notification
-    email_sent = await send_contact_email(contact_dict)
-    
+    contact_doc = contact_obj.dict()
+    try:
+        await db.contacts.insert_one(contact_doc)
+    except Exception:
+        # Otherwise the user's retry would be acknowledged as a duplicate of a contact that was never stored
+        await rate_limit.forget_duplicate(contact_dict, contact_obj.id)
+        raise
+
+    # Dashboard counters; the submission is stored either way, and the backfill command can recount
+    try:
+        await analytics.record_contact(contact_doc)
+    except PyMongoError as e:
+        logger.error(f"Failed to update contact rollups: {str(e)}")
+
+    # Queue email notification; the outbox worker sends it and retries on failure
+    await outbox.enqueue_contact_email({**contact_dict, "id": contact_obj.id})
+
     # Log the contact submission
-    logger.info(f"New contact form submission from {contact_dict.get('name')} - {contact_dict.get('email')} - Email sent: {email_sent}")
-    
-    return {"message": "Contact form submitted successfully", "id": contact_obj.id, "email_sent": email_sent}
+    logger.info(f"New contact form submission from {contact_dict.get('name')} - {contact_dict.get('email')} - Email queued")
+
+    return {"message": "Contact form submitted successfully", "id": contact_obj.id, "email_queued": True}
+
+async def load_services():
+    services = await db.services.find({}, SERVICE_PROJECTION).sort("order", 1).to_list(100)
+    return await image_variants.attach_variants(services, "services")
+
+async def load_gallery():
+    items = await db.gallery.find({}, GALLERY_PROJECTION).to_list(100)
+    return await image_variants.attach_variants(items, "gallery")
+
+async def load_site():
+    services, gallery = await asyncio.gather(load_services(), load_gallery())
+    return {"services": services, "gallery": gallery}
+
+cache.register("services", load_services)
+cache.register("gallery", load_gallery)
+# Everything the homepage shows, rebuilt (and recompressed) only when services or gallery change
+cache.register("site", load_site, depends_on=("services", "gallery"), precompress=True)
+
+# Payloads built before the app reports ready, so the first visitor after a deploy hits a warm cache
+WARM_CACHES = ("services", "gallery", "site")
+
+@api_router.get("/site")
+async def get_site(request: Request):
+    """Services and gallery in one response, stored gzip- and brotli-encoded"""
+    entry = await cache.get("site")
+    return cache.cached_response(request, entry)
 
 @api_router.get("/services")
-async def get_services():
-    """Get all services for public"""
-    services = await db.services.find({}, {'_id': 0}).sort("order", 1).to_list(100)
-    return services
+async def get_services(request: Request):
+    """Get all services for public (cached, invalidated by admin writes)"""
+    entry = await cache.get("services")
+    return cache.cached_response(request, entry)
 
 @api_router.get("/gallery")
-async def get_gallery():
-    """Get all gallery items for public"""
-    items = await db.gallery.find({}, {'_id': 0}).to_list(100)
-    return items
-
-# Include the routers in the main app
-app.include_router(api_router)
-app.include_router(admin_router)
-
-# Mount uploads directory AFTER routers (under /api/uploads for proper Kubernetes routing)
-app.mount("/api/uploads", StaticFiles(directory=str(uploads_dir)), name="uploads")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def get_gallery(request: Request):
+    """Get all gallery items for public (cached, invalidated by admin writes)"""
+    entry = await cache.get("gallery")
+    return cache.cached_response(request, entry)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+# ==================== LIFESPAN ====================
+
+async def create_indexes():
+    """Ensure the declared indexes exist and report any drift"""
+    try:
+        report = await ensure_indexes(db)
+    except PyMongoError as e:
+        logger.error(f"Index check failed: {str(e)}")
+        return
+    # Missing indexes were just created; changed or undeclared ones need init_indexes.py
+    drift = {name: {"changed": e["changed"], "extra": e["extra"]} for name, e in report.items() if e["changed"] or e["extra"]}
+    if drift:
+        logger.warning(f"Index drift against declared set (run init_indexes.py to apply): {drift}")
+
+async def warm_up(settings: config.Settings):
+    """Open the pool's minimum connections and build the public payloads before taking traffic"""
+    try:
+        # Concurrent pings each need a connection of their own, so this opens minPoolSize of them now
+        await asyncio.gather(*(db.command("ping") for _ in range(max(settings.mongo_min_pool_size, 1))))
+    except PyMongoError as e:
+        logger.error(f"Mongo warm-up failed: {str(e)}")
+    await create_indexes()
+    await cache.start()
+    for name in WARM_CACHES:
+        try:
+            await cache.get(name)
+        except PyMongoError as e:
+            logger.warning(f"Could not warm the {name} cache: {str(e)}")
+    try:
+        await auth.load_revocations()
+    except PyMongoError as e:
+        logger.warning(f"Could not load token revocations: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client
+    settings = config.get_settings()
+    client = AsyncIOMotorClient(
+        settings.mongo_url,
+        event_listeners=[metrics.MongoCommandMetrics()],
+        **settings.mongo_client_options(),
+    )
+    set_db(client[settings.db_name])
+    email_service.configure(settings)
+
+    await warm_up(settings)
+    await outbox.start()
+    await image_mirror.start()
+    await upload_gc.start()
+    app.state.ready = True
+    logger.info("Startup complete, ready for traffic")
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        await outbox.stop()
+        await image_mirror.stop()
+        await upload_gc.stop()
+        await cache.stop()
+        await email_transport.close()
+        image_variants.shutdown()
+        client.close()
+
+# ==================== APP ====================
+
+def create_app(settings: Optional[config.Settings] = None) -> FastAPI:
+    """Build the application; Mongo and the background workers are owned by its lifespan"""
+    if settings is not None:
+        config.configure(settings)
+        # Backends created for earlier settings (e.g. by the module-level app) are rebuilt from these
+        storage.set_backend(None)
+        rate_limit.set_backend(None)
+        auth.set_token_cache(None)
+
+    # Create the main app without a prefix
+    app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+    app.state.ready = False
+
+    # Include the routers in the main app
+    app.include_router(ops_router)
+    app.include_router(api_router)
+    app.include_router(admin_router)
+
+    # Mount uploads AFTER routers (under /api/uploads for proper Kubernetes routing)
+    backend = storage.get_backend()
+    if backend.serves_locally:
+        # Served as immutable with strong ETags, byte ranges and pre-encoded variants
+        app.mount("/api/uploads", UploadsStaticFiles(directory=str(backend.root)), name="uploads")
+    else:
+        # Redirected to the bucket's CDN or presigned URLs
+        app.mount("/api/uploads", RedirectUploads(backend), name="uploads")
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Total-Count", "X-Next-Cursor", "Retry-After", "Content-Disposition"],
+    )
+
+    # Outermost, so the timing includes every other middleware
+    app.add_middleware(metrics.MetricsMiddleware)
+    return app
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+# `uvicorn server:app` keeps working
+app = create_app()
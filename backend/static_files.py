@@ -0,0 +1,253 @@
+import os
+import re
+import stat
+from email.utils import formatdate
+from hashlib import md5
+from mimetypes import guess_type
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, RedirectResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+import storage
+from cache import accepted_encodings
+from image_variants import ensure_variant, VARIANTS_PREFIX
+
+# Upload names are unique and never rewritten, so clients may keep them forever
+IMMUTABLE = storage.IMMUTABLE
+
+# Names derived from a sha256 of the content can use the name itself as ETag
+CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}[-.]')
+
+# Precompressed siblings (<file>.br, <file>.gz), best first
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+# Re-encoded full-size siblings of raster originals (variants/<stem>.<fmt>), best first
+PRE_ENCODED = (("image/avif", "avif"), ("image/webp", "webp"))
+RE_ENCODABLE = (".jpg", ".jpeg", ".png", ".gif")
+
+def accepted_types(header: str) -> Dict[str, float]:
+    """Media types an Accept header names explicitly, with their q-values (q=0 excluded)
+
+    Wildcards are left out: browsers send `*/*` and `image/*` whether or not they
+    can decode AVIF or WebP, so only an explicit type selects a re-encode.
+    """
+    accepted: Dict[str, float] = {}
+    for part in header.split(','):
+        media_type, *params = part.split(';')
+        media_type = media_type.strip().lower()
+        if not media_type or '*' in media_type:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted[media_type] = max(quality, accepted.get(media_type, 0.0))
+    return accepted
+
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=` range into inclusive (start, end)
+
+    Returns None for syntax this server ignores (e.g. multiple ranges), so the
+    whole file is sent; raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        start, end = max(size - length, 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start > end:
+            if last and int(last) < start:
+                return None
+            raise ValueError("Range not satisfiable")
+    return start, end
+
+
+class RangeFileResponse(FileResponse):
+    """FileResponse that sends only bytes start..end (inclusive) of the file"""
+
+    def __init__(self, path, start: int, end: int, size: int, headers: dict, media_type: str):
+        headers = dict(headers)
+        headers["content-length"] = str(end - start + 1)
+        headers["content-range"] = f"bytes {start}-{end}/{size}"
+        super().__init__(path, status_code=206, headers=headers, media_type=media_type)
+        self.start = start
+        self.end = end
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class UploadsStaticFiles(StaticFiles):
+    """StaticFiles for /api/uploads
+
+    Adds immutable caching, strong ETags, single byte ranges, precompressed and
+    re-encoded (AVIF/WebP) siblings chosen by content negotiation, and renders
+    missing image variants on first request.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+
+        try:
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+            if stat_result is None and path.startswith(VARIANTS_PREFIX):
+                # Images uploaded before variants existed are rendered on first request
+                try:
+                    await ensure_variant(path[len(VARIANTS_PREFIX):])
+                except FileNotFoundError:
+                    raise HTTPException(status_code=404)
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+        except PermissionError:
+            raise HTTPException(status_code=401)
+
+        if not stat_result or not stat.S_ISREG(stat_result.st_mode):
+            raise HTTPException(status_code=404)
+
+        request_headers = Headers(scope=scope)
+        selected = await anyio.to_thread.run_sync(self.select_representation, full_path, stat_result, request_headers)
+        return self.representation_response(*selected, request_headers)
+
+    def select_representation(self, full_path: str, stat_result: os.stat_result, request_headers: Headers):
+        """Pick the best stored representation of a file for this request
+
+        Returns (path, stat, media_type, extra_headers, vary).
+        """
+        media_type = guess_type(full_path)[0] or "application/octet-stream"
+        vary: List[str] = []
+
+        encodings = accepted_encodings(request_headers.get("accept-encoding", ""))
+        for encoding, suffix in PRECOMPRESSED:
+            candidate = full_path + suffix
+            if os.path.isfile(candidate):
+                if "Accept-Encoding" not in vary:
+                    vary.append("Accept-Encoding")
+                if encoding in encodings:
+                    return candidate, os.stat(candidate), media_type, {"content-encoding": encoding}, vary
+
+        stem, extension = os.path.splitext(os.path.basename(full_path))
+        if extension.lower() in RE_ENCODABLE:
+            # Always vary: the re-encodes may appear after the first response was cached
+            vary.append("Accept")
+            accepted = accepted_types(request_headers.get("accept", ""))
+            # Highest q-value first; ties keep PRE_ENCODED's order
+            preferred = sorted((item for item in PRE_ENCODED if item[0] in accepted),
+                               key=lambda item: -accepted[item[0]])
+            for encoded_type, fmt in preferred:
+                candidate = os.path.join(self.directory, VARIANTS_PREFIX, f"{stem}.{fmt}")
+                if os.path.isfile(candidate):
+                    return candidate, os.stat(candidate), encoded_type, {}, vary
+
+        return full_path, stat_result, media_type, {}, vary
+
+    def representation_response(self, path: str, stat_result: os.stat_result, media_type: str,
+                                extra_headers: dict, vary: List[str], request_headers: Headers) -> Response:
+        name = os.path.basename(path)
+        if CONTENT_ADDRESSED.match(name):
+            etag = f'"{name}"'
+        else:
+            etag = f'"{md5(f"{stat_result.st_mtime}-{stat_result.st_size}".encode()).hexdigest()}"'
+
+        headers = {
+            "cache-control": IMMUTABLE,
+            "etag": etag,
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "accept-ranges": "bytes",
+            **extra_headers,
+        }
+        if vary:
+            headers["vary"] = ", ".join(vary)
+
+        if self.is_not_modified(headers, request_headers):
+            return NotModifiedResponse(Headers(headers))
+
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and (if_range is None or if_range == etag):
+            size = stat_result.st_size
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                return Response(status_code=416, headers={"content-range": f"bytes */{size}", **headers})
+            if byte_range is not None:
+                return RangeFileResponse(path, *byte_range, size=size, headers=headers, media_type=media_type)
+
+        return FileResponse(path, stat_result=stat_result, headers=headers, media_type=media_type)
+
+
+class RedirectUploads:
+    """Serves /api/uploads from object storage by redirecting to its CDN or presigned URL
+
+    Stored URLs stay /api/uploads/<name> whichever backend holds the file. Missing
+    image variants are rendered before redirecting, as with local storage.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        # Variants known to exist, so each one is checked against the bucket once per worker
+        self.known_variants: set = set()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        response = await self.get_response(scope)
+        await response(scope, receive, send)
+
+    async def get_response(self, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            return Response(status_code=405)
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        name = path.lstrip("/")
+        if not name or ".." in name.split("/") or name.count("/") > 1:
+            return Response(status_code=404)
+
+        if name.startswith(VARIANTS_PREFIX):
+            variant = name[len(VARIANTS_PREFIX):]
+            if variant not in self.known_variants:
+                try:
+                    await ensure_variant(variant)
+                except FileNotFoundError:
+                    return Response(status_code=404)
+                self.known_variants.add(variant)
+        elif "/" in name:
+            return Response(status_code=404)
+
+        url = await anyio.to_thread.run_sync(self.backend.url, name)
+        # CDN URLs are as immutable as the names; presigned ones must not outlive their signature
+        cache_control = IMMUTABLE if self.backend.public_url else f"private, max-age={self.backend.presign_seconds // 2}"
+        return RedirectResponse(url, status_code=302, headers={"cache-control": cache_control})
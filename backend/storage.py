@@ -0,0 +1,357 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
+from mimetypes import guess_type
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Smallest part S3 accepts in a multipart upload (except the last one)
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+# Partially written uploads; local ones live next to the final files so the rename is atomic
+TEMP_PREFIX = ".upload-"
+
+# Upload names are unique and never rewritten, so clients may keep them forever
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# (name, size, mtime) of one stored file
+FileInfo = Tuple[str, int, float]
+
+
+def _content_type(name: str) -> str:
+    return guess_type(name)[0] or "application/octet-stream"
+
+
+class LocalWriter:
+    """Streams one upload to a temporary file, renamed to its final name on commit"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        fd, self.temp_path = tempfile.mkstemp(dir=root, prefix=TEMP_PREFIX)
+        self.file = os.fdopen(fd, "wb")
+        self.committed = False
+
+    async def write(self, chunk: bytes):
+        await asyncio.to_thread(self.file.write, chunk)
+
+    async def commit(self, name: str):
+        self.file.close()
+        path = self.root / name
+        if path.exists():
+            os.unlink(self.temp_path)
+            # Restarts the garbage collector's grace period for a file that is about to be referenced again
+            os.utime(path)
+        else:
+            os.replace(self.temp_path, path)
+        self.committed = True
+
+    async def abort(self):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.unlink(self.temp_path)
+
+
+class LocalStorage:
+    """Uploads on the local disk, served by the /api/uploads static mount"""
+
+    serves_locally = True
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root if root is not None else config.get_settings().uploads_dir)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, name: str) -> Path:
+        return self.root / name
+
+    def writer(self) -> LocalWriter:
+        return LocalWriter(self.root)
+
+    async def exists(self, name: str) -> bool:
+        return self._path(name).is_file()
+
+    async def list(self, prefix: str = "") -> AsyncIterator[List[FileInfo]]:
+        """Files directly under `prefix` (e.g. "variants/"), in one batch"""
+        directory = self._path(prefix)
+        if directory.is_dir():
+            yield await asyncio.to_thread(self._list, directory)
+
+    @staticmethod
+    def _list(directory: Path) -> List[FileInfo]:
+        files = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    files.append((entry.name, stat.st_size, stat.st_mtime))
+        return files
+
+    async def delete(self, prefix: str, files: List[FileInfo], min_age: float = 0) -> List[FileInfo]:
+        return await asyncio.to_thread(self._unlink, self._path(prefix), files, min_age)
+
+    @staticmethod
+    def _unlink(directory: Path, files: List[FileInfo], min_age: float) -> List[FileInfo]:
+        # Ages are re-checked here as an upload may have just touched the file
+        deleted = []
+        now = time.time()
+        for name, _, _ in files:
+            path = directory / name
+            try:
+                stat = path.stat()
+                if now - stat.st_mtime < min_age:
+                    continue
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            deleted.append((name, stat.st_size, stat.st_mtime))
+        return deleted
+
+    @asynccontextmanager
+    async def local_copy(self, name: str) -> AsyncIterator[Path]:
+        path = self._path(name)
+        if not path.is_file():
+            raise FileNotFoundError(name)
+        yield path
+
+    @asynccontextmanager
+    async def scratch_dir(self, prefix: str) -> AsyncIterator[Path]:
+        # Renders land in place, so existing ones are skipped
+        directory = self._path(prefix)
+        directory.mkdir(exist_ok=True)
+        yield directory
+
+    async def publish(self, path: Path, name: str):
+        target = self._path(name)
+        if path != target:
+            await asyncio.to_thread(os.replace, path, target)
+
+    def url(self, name: str) -> Optional[str]:
+        return None
+
+
+class S3Writer:
+    """Streams one upload to S3: a single PUT when it fits in one part, a multipart upload otherwise
+
+    Multipart uploads go to a temporary key, since the final (content-hash) name is
+    only known at the end, and are then copied server-side.
+    """
+
+    def __init__(self, storage: "S3Storage"):
+        self.storage = storage
+        self.client = storage.client
+        self.temp_key = storage.key(f"{TEMP_PREFIX}{uuid.uuid4().hex}")
+        self.buffer = bytearray()
+        self.upload_id: Optional[str] = None
+        self.parts: List[dict] = []
+        self.committed = False
+
+    async def write(self, chunk: bytes):
+        self.buffer += chunk
+        if len(self.buffer) >= self.storage.part_size:
+            await self._upload_part()
+
+    async def _upload_part(self):
+        if self.upload_id is None:
+            response = await asyncio.to_thread(
+                self.client.create_multipart_upload, Bucket=self.storage.bucket, Key=self.temp_key)
+            self.upload_id = response["UploadId"]
+        body, self.buffer = bytes(self.buffer), bytearray()
+        number = len(self.parts) + 1
+        response = await asyncio.to_thread(
+            self.client.upload_part, Bucket=self.storage.bucket, Key=self.temp_key, UploadId=self.upload_id,
+            PartNumber=number, Body=body)
+        self.parts.append({"ETag": response["ETag"], "PartNumber": number})
+
+    async def commit(self, name: str):
+        key = self.storage.key(name)
+        exists = await self.storage.exists(name)
+        if self.upload_id is None:
+            if exists:
+                await self.storage.touch(name)
+            else:
+                await asyncio.to_thread(
+                    self.client.put_object, Bucket=self.storage.bucket, Key=key, Body=bytes(self.buffer),
+                    ContentType=_content_type(name), CacheControl=IMMUTABLE)
+            self.committed = True
+            return
+
+        if self.buffer:
+            await self._upload_part()
+        await asyncio.to_thread(
+            self.client.complete_multipart_upload, Bucket=self.storage.bucket, Key=self.temp_key, UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts})
+        self.upload_id = None
+        try:
+            if exists:
+                await self.storage.touch(name)
+            else:
+                await asyncio.to_thread(
+                    self.client.copy_object, Bucket=self.storage.bucket, Key=key,
+                    CopySource={"Bucket": self.storage.bucket, "Key": self.temp_key}, MetadataDirective="REPLACE",
+                    ContentType=_content_type(name), CacheControl=IMMUTABLE)
+        finally:
+            await asyncio.to_thread(self.client.delete_object, Bucket=self.storage.bucket, Key=self.temp_key)
+        self.committed = True
+
+    async def abort(self):
+        if self.upload_id is not None:
+            await asyncio.to_thread(
+                self.client.abort_multipart_upload, Bucket=self.storage.bucket, Key=self.temp_key, UploadId=self.upload_id)
+            self.upload_id = None
+
+
+class S3Storage:
+    """Uploads in an S3-compatible bucket; /api/uploads redirects to a CDN or presigned URL"""
+
+    serves_locally = False
+
+    def __init__(self, client=None, settings: Optional[config.Settings] = None):
+        settings = settings or config.get_settings()
+        if not settings.s3_bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        if client is None:
+            import boto3
+
+            client = boto3.client("s3", endpoint_url=settings.s3_endpoint_url, region_name=settings.s3_region)
+        self.client = client
+        self.bucket = settings.s3_bucket
+        self.prefix = settings.s3_prefix
+        self.public_url = settings.s3_public_url.rstrip('/')
+        self.presign_seconds = settings.s3_presign_seconds
+        self.part_size = max(settings.s3_part_size, S3_MIN_PART_SIZE)
+
+    def key(self, name: str) -> str:
+        return f"{self.prefix}{name}"
+
+    def writer(self) -> S3Writer:
+        return S3Writer(self)
+
+    async def _last_modified(self, name: str) -> Optional[float]:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self.key(name))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head["LastModified"].timestamp()
+
+    async def exists(self, name: str) -> bool:
+        return await self._last_modified(name) is not None
+
+    async def touch(self, name: str):
+        """Bump LastModified, restarting the garbage collector's grace period"""
+        key = self.key(name)
+        await asyncio.to_thread(
+            self.client.copy_object, Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": key},
+            MetadataDirective="REPLACE", ContentType=_content_type(name), CacheControl=IMMUTABLE)
+
+    async def list(self, prefix: str = "") -> AsyncIterator[List[FileInfo]]:
+        """Objects directly under `prefix`, one batch per listing page"""
+        paginator = self.client.get_paginator("list_objects_v2")
+        pages = iter(paginator.paginate(Bucket=self.bucket, Prefix=self.key(prefix), Delimiter="/"))
+        start = len(self.key(prefix))
+        while True:
+            page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                return
+            batch = [(obj["Key"][start:], obj["Size"], obj["LastModified"].timestamp())
+                     for obj in page.get("Contents", [])]
+            if batch:
+                yield batch
+
+    async def delete(self, prefix: str, files: List[FileInfo], min_age: float = 0) -> List[FileInfo]:
+        if min_age > 0:
+            # Ages are re-checked here as an upload may have just touched the object
+            mtimes = await asyncio.gather(*(self._last_modified(prefix + name) for name, _, _ in files))
+            now = time.time()
+            files = [(name, size, mtime) for (name, size, _), mtime in zip(files, mtimes)
+                     if mtime is not None and now - mtime >= min_age]
+        deleted = []
+        # DeleteObjects takes at most 1000 keys
+        for start in range(0, len(files), 1000):
+            batch = files[start:start + 1000]
+            response = await asyncio.to_thread(
+                self.client.delete_objects, Bucket=self.bucket,
+                Delete={"Objects": [{"Key": self.key(prefix + name)} for name, _, _ in batch], "Quiet": True})
+            failed = {error["Key"] for error in response.get("Errors", [])}
+            deleted.extend(info for info in batch if self.key(prefix + info[0]) not in failed)
+        return deleted
+
+    @asynccontextmanager
+    async def local_copy(self, name: str) -> AsyncIterator[Path]:
+        from botocore.exceptions import ClientError
+
+        with tempfile.TemporaryDirectory(prefix=TEMP_PREFIX) as directory:
+            path = Path(directory) / name
+            try:
+                await asyncio.to_thread(self.client.download_file, self.bucket, self.key(name), str(path))
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                    raise FileNotFoundError(name)
+                raise
+            yield path
+
+    @asynccontextmanager
+    async def scratch_dir(self, prefix: str) -> AsyncIterator[Path]:
+        directory = tempfile.mkdtemp(prefix=TEMP_PREFIX)
+        try:
+            yield Path(directory)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    async def publish(self, path: Path, name: str):
+        # upload_file switches to a multipart upload for large files by itself
+        await asyncio.to_thread(
+            self.client.upload_file, str(path), self.bucket, self.key(name),
+            ExtraArgs={"ContentType": _content_type(name), "CacheControl": IMMUTABLE})
+
+    def url(self, name: str) -> Optional[str]:
+        if self.public_url:
+            return f"{self.public_url}/{self.key(name)}"
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self.key(name)}, ExpiresIn=self.presign_seconds)
+
+
+BACKENDS = {"local": LocalStorage, "s3": S3Storage}
+
+_backend = None
+
+
+def get_backend():
+    """The storage backend selected by storage_backend, created on first use"""
+    global _backend
+    if _backend is None:
+        name = config.get_settings().storage_backend
+        if name not in BACKENDS:
+            raise RuntimeError(f"Unknown STORAGE_BACKEND {name!r}")
+        _backend = BACKENDS[name]()
+    return _backend
+
+
+def set_backend(backend):
+    """Use an explicit backend instead of the configured one (tests, local stand-ins)"""
+    global _backend
+    _backend = backend
+
+
+@asynccontextmanager
+async def open_writer() -> AsyncIterator:
+    """Writer of one new upload; discarded unless committed before the block ends"""
+    writer = get_backend().writer()
+    try:
+        yield writer
+    except BaseException:
+        await writer.abort()
+        raise
+    if not writer.committed:
+        await writer.abort()
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import leases
+import metrics
+import storage
+from config import get_settings
+from file_upload import STATIC_URL
+from image_mirror import MIRRORS_COLLECTION
+from image_variants import IMAGE_FIELDS, IMAGES_COLLECTION, VARIANTS_PREFIX, VARIANT_NAME, local_filename
+from static_files import PRECOMPRESSED
+from storage import FileInfo, TEMP_PREFIX
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "upload_gc"
+
+# Kinds of deleted files
+ORIGINAL = "original"
+VARIANT = "variant"
+COMPRESSED = "compressed"
+TEMPORARY = "temporary"
+
+# These will be set by server.py
+db = None
+
+def set_db(database):
+    global db
+    db = database
+
+
+_task: Optional[asyncio.Task] = None
+
+
+def _projection() -> Dict[str, Dict[str, int]]:
+    return {collection: {"_id": 0, **{field: 1 for field in fields}} for collection, fields in IMAGE_FIELDS.items()}
+
+
+async def referenced_files() -> Set[str]:
+    """Names of every upload a service or gallery document points at, in one pass per collection"""
+    names = set()
+    for collection, projection in _projection().items():
+        async for doc in db[collection].find({}, projection):
+            names.update(filter(None, (local_filename(doc.get(field)) for field in IMAGE_FIELDS[collection])))
+    return names
+
+
+async def _still_referenced(names: Iterable[str]) -> Set[str]:
+    """Which of `names` gained a reference since the sweep read the collections"""
+    urls = [prefix + name for name in names for prefix in (STATIC_URL + "/", "/uploads/")]
+    found = set()
+    for collection, projection in _projection().items():
+        query = {"$or": [{field: {"$in": urls}} for field in IMAGE_FIELDS[collection]]}
+        async for doc in db[collection].find(query, projection):
+            found.update(filter(None, (local_filename(doc.get(field)) for field in IMAGE_FIELDS[collection])))
+    return found
+
+
+def _batches(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _compressed_original(name: str) -> Optional[str]:
+    """Name of the upload a precompressed sibling (<file>.br, <file>.gz) was made from"""
+    for _, suffix in PRECOMPRESSED:
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)]
+    return None
+
+
+def _variant_stems(name: str) -> Tuple[str, ...]:
+    # Either <stem>-<width>.<fmt> or the full-size <stem>.<fmt>; a stem may itself end in -<digits>
+    match = VARIANT_NAME.match(name)
+    stem = Path(name).stem
+    return (match["stem"], stem) if match else (stem,)
+
+
+async def collect(grace_seconds: Optional[float] = None, batch_size: Optional[int] = None,
+                  dry_run: bool = False) -> Dict[str, int]:
+    """Delete uploads no document references, with their variants; returns what was reclaimed
+
+    Files younger than `grace_seconds` are kept. Candidates are re-checked against
+    the collections batch by batch before deletion. Both default to the settings.
+    """
+    settings = get_settings()
+    if grace_seconds is None:
+        grace_seconds = settings.upload_gc_grace_seconds
+    if batch_size is None:
+        batch_size = settings.upload_gc_batch_size
+    report = {"referenced": 0, "kept_recent": 0, ORIGINAL: 0, VARIANT: 0, COMPRESSED: 0, TEMPORARY: 0, "bytes": 0}
+    referenced = await referenced_files()
+    report["referenced"] = len(referenced)
+    now = time.time()
+
+    backend = storage.get_backend()
+    originals, compressed, temporary = [], [], []
+    live_names = set()
+    async for batch in backend.list(""):
+        for name, size, mtime in batch:
+            if name.startswith(TEMP_PREFIX):
+                # Left behind by an upload that crashed mid-write
+                if now - mtime >= grace_seconds:
+                    temporary.append((name, size, mtime))
+            elif _compressed_original(name):
+                # Decided once the fate of the original is known
+                compressed.append((name, size, mtime))
+            elif name in referenced:
+                live_names.add(name)
+            elif now - mtime < grace_seconds:
+                report["kept_recent"] += 1
+                live_names.add(name)
+            else:
+                originals.append((name, size, mtime))
+
+    async def sweep(prefix: str, kind: str, files: List[FileInfo], min_age: float) -> List[str]:
+        deleted = []
+        for batch in _batches(files, batch_size):
+            if kind == ORIGINAL:
+                keep = await _still_referenced([name for name, _, _ in batch])
+                candidates = [info for info in batch if info[0] not in keep]
+            else:
+                candidates = batch
+            done = candidates if dry_run else await backend.delete(prefix, candidates, min_age)
+            for name, size, _ in done:
+                report[kind] += 1
+                report["bytes"] += size
+                if not dry_run:
+                    metrics.upload_gc_deleted_files.inc(kind)
+                    metrics.upload_gc_reclaimed_bytes.inc(amount=size)
+            removed = {name for name, _, _ in done}
+            deleted.extend(removed)
+            if kind == ORIGINAL:
+                # Kept after all (referenced again, or touched by a new upload of the same image)
+                live_names.update(name for name, _, _ in batch if name not in removed)
+        return deleted
+
+    await sweep("", TEMPORARY, temporary, grace_seconds)
+    deleted_originals = await sweep("", ORIGINAL, originals, grace_seconds)
+    # Precompressed siblings live and die with their original
+    await sweep("", COMPRESSED, [info for info in compressed if _compressed_original(info[0]) not in live_names],
+                grace_seconds)
+    live_stems = {Path(name).stem for name in live_names}
+
+    # Variants of deleted originals (or of ones removed by hand) and renders that crashed mid-write
+    orphans, crashed = [], []
+    async for batch in backend.list(VARIANTS_PREFIX):
+        for name, size, mtime in batch:
+            if name.endswith(".tmp"):
+                if now - mtime >= grace_seconds:
+                    crashed.append((name, size, mtime))
+            elif not any(stem in live_stems for stem in _variant_stems(name)):
+                orphans.append((name, size, mtime))
+    await sweep(VARIANTS_PREFIX, TEMPORARY, crashed, grace_seconds)
+    await sweep(VARIANTS_PREFIX, VARIANT, orphans, 0)
+
+    if deleted_originals and not dry_run:
+        # The mirror fetches these sources again instead of trusting a copy that is gone,
+        # and the recorded widths of the deleted images go with them
+        await db[MIRRORS_COLLECTION].update_many(
+            {"local_url": {"$in": [f"{STATIC_URL}/{name}" for name in deleted_originals]}},
+            {"$set": {"local_url": None, "etag": None, "last_modified": None, "next_check_at": datetime.utcnow()}},
+        )
+        await db[IMAGES_COLLECTION].delete_many({"_id": {"$in": deleted_originals}})
+    return report
+
+
+async def _run():
+    while True:
+        await asyncio.sleep(get_settings().upload_gc_interval)
+        try:
+            # Only one worker of the deployment sweeps at a time
+            holder = await leases.acquire(LEASE_NAME, get_settings().upload_gc_lease_seconds)
+            if holder is None:
+                continue
+            try:
+                report = await collect()
+            finally:
+                await leases.release(LEASE_NAME, holder)
+            if report["bytes"]:
+                logger.info(f"Upload GC reclaimed {report['bytes']} bytes: {report}")
+        except Exception as e:
+            # Mongo, disk or bucket errors; the next sweep tries again
+            logger.warning(f"Upload GC failed: {str(e)}")
+
+
+async def start():
+    """Start the periodic sweep"""
+    global _task
+    if get_settings().upload_gc_interval <= 0:
+        return
+    _task = asyncio.create_task(_run())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -7,7 +7,7 @@ import { Card, CardContent } from '../components/ui/card';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '../components/ui/tabs';
 import { 
   LogOut, Plus, Edit2, Trash2, Save, X, Upload,
-  LayoutDashboard, Briefcase, Image as ImageIcon, MessageSquare
+  LayoutDashboard, Briefcase, Image as ImageIcon, MessageSquare, BarChart3, Download
 } from 'lucide-react';
 import axios from 'axios';
 import { toast } from '../hooks/use-toast';
@@ -19,6 +19,12 @@ const AdminDashboard = () => {
   const [services, setServices] = useState([]);
   const [gallery, setGallery] = useState([]);
   const [contacts, setContacts] = useState([]);
+  const [contactsTotal, setContactsTotal] = useState(0);
+  const [contactsCursor, setContactsCursor] = useState(null);
+  const [contactQuery, setContactQuery] = useState('');
+  const [searchResults, setSearchResults] = useState(null);
+  const [analyticsPeriod, setAnalyticsPeriod] = useState('day');
+  const [analytics, setAnalytics] = useState(null);
   const [loading, setLoading] = useState(true);
   const [editingService, setEditingService] = useState(null);
   const [editingGallery, setEditingGallery] = useState(null);
@@ -64,6 +70,8 @@ const AdminDashboard = () => {
       setServices(servicesRes.data);
       setGallery(galleryRes.data);
       setContacts(contactsRes.data);
+      setContactsTotal(Number(contactsRes.headers['x-total-count'] ?? contactsRes.data.length));
+      setContactsCursor(contactsRes.headers['x-next-cursor'] || null);
     } catch (error) {
       toast({
         title: "Erreur",
@@ -75,7 +83,74 @@ const AdminDashboard = () => {
     }
   };
 
-  const handleLogout = () => {
+  const loadMoreContacts = async () => {
+    try {
+      const res = await axios.get(`${API}/admin/contacts`, {
+        ...getAuthHeader(),
+        params: { cursor: contactsCursor }
+      });
+      setContacts((prev) => [...prev, ...res.data]);
+      setContactsCursor(res.headers['x-next-cursor'] || null);
+    } catch (error) {
+      toast({
+        title: "Erreur",
+        description: "Impossible de charger les messages",
+        variant: "destructive"
+      });
+    }
+  };
+
+  const fetchAnalytics = async (period) => {
+    try {
+      const res = await axios.get(`${API}/admin/analytics`, {
+        ...getAuthHeader(),
+        params: { period }
+      });
+      setAnalyticsPeriod(period);
+      setAnalytics(res.data);
+    } catch (error) {
+      toast({
+        title: "Erreur",
+        description: "Impossible de charger les statistiques",
+        variant: "destructive"
+      });
+    }
+  };
+
+  const handleSearchContacts = async (e) => {
+    e.preventDefault();
+    const q = contactQuery.trim();
+    if (!q) {
+      setSearchResults(null);
+      return;
+    }
+    try {
+      const res = await axios.get(`${API}/admin/contacts/search`, {
+        ...getAuthHeader(),
+        params: { q }
+      });
+      setSearchResults(res.data);
+    } catch (error) {
+      toast({
+        title: "Erreur",
+        description: "La recherche a échoué",
+        variant: "destructive"
+      });
+    }
+  };
+
+  const clearSearch = () => {
+    setContactQuery('');
+    setSearchResults(null);
+  };
+
+  const handleLogout = async () => {
+    try {
+      // Revoke the token server-side so it stops working everywhere
+      await axios.post(`${API}/admin/logout`, null, getAuthHeader());
+    } catch (error) {
+      // Token already invalid; clearing it locally is enough
+    }
     localStorage.removeItem('adminToken');
     localStorage.removeItem('adminEmail');
     navigate('/admin/login');
@@ -169,12 +244,32 @@ const AdminDashboard = () => {
     }
   };
 
+  const handleExportContacts = async (format) => {
+    try {
+      const res = await axios.get(`${API}/admin/contacts/export`, {
+        ...getAuthHeader(),
+        params: { format },
+        responseType: 'blob'
+      });
+      const filename = /filename="([^"]+)"/.exec(res.headers['content-disposition'] || '')?.[1] || `contacts.${format}`;
+      const url = URL.createObjectURL(res.data);
+      const link = document.createElement('a');
+      link.href = url;
+      link.download = filename;
+      link.click();
+      URL.revokeObjectURL(url);
+    } catch (error) {
+      toast({ title: "Erreur", description: "L'export a échoué", variant: "destructive" });
+    }
+  };
+
   const handleDeleteContact = async (id) => {
     if (!window.confirm('Êtes-vous sûr de vouloir supprimer ce message ?')) return;
     
     try {
       await axios.delete(`${API}/admin/contacts/${id}`, getAuthHeader());
       toast({ title: "Message supprimé" });
+      setSearchResults((prev) => prev && prev.filter((contact) => contact.id !== id));
       fetchData();
     } catch (error) {
       toast({ title: "Erreur", description: "Erreur lors de la suppression", variant: "destructive" });
@@ -228,7 +323,7 @@ const AdminDashboard = () => {
       {/* Main Content */}
       <main className="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8 py-8">
         <Tabs defaultValue="services" className="space-y-6">
-          <TabsList className="grid grid-cols-3 w-full max-w-md">
+          <TabsList className="grid grid-cols-4 w-full max-w-xl">
             <TabsTrigger value="services" className="gap-2">
               <Briefcase className="w-4 h-4" />
               Services
@@ -239,7 +334,11 @@ const AdminDashboard = () => {
             </TabsTrigger>
             <TabsTrigger value="contacts" className="gap-2">
               <MessageSquare className="w-4 h-4" />
-              Messages ({contacts.length})
+              Messages ({contactsTotal})
+            </TabsTrigger>
+            <TabsTrigger value="analytics" className="gap-2" onClick={() => !analytics && fetchAnalytics(analyticsPeriod)}>
+              <BarChart3 className="w-4 h-4" />
+              Statistiques
             </TabsTrigger>
           </TabsList>
 
@@ -332,19 +431,71 @@ const AdminDashboard = () => {
           {/* Contacts Tab */}
           <TabsContent value="contacts">
             <div className="space-y-4">
-              <h2 className="text-2xl font-bold">Messages de contact</h2>
+              <div className="flex justify-between items-center">
+                <h2 className="text-2xl font-bold">Messages de contact</h2>
+                <div className="flex gap-2">
+                  {['csv', 'ndjson'].map((format) => (
+                    <Button key={format} variant="outline" className="gap-2" onClick={() => handleExportContacts(format)}>
+                      <Download className="w-4 h-4" />
+                      Export {format.toUpperCase()}
+                    </Button>
+                  ))}
+                </div>
+              </div>
+              <form onSubmit={handleSearchContacts} className="flex gap-2">
+                <Input
+                  value={contactQuery}
+                  onChange={(e) => setContactQuery(e.target.value)}
+                  placeholder='Rechercher (nom, email, sujet, message, "phrase exacte")'
+                />
+                <Button type="submit">Rechercher</Button>
+                {searchResults && (
+                  <Button type="button" variant="outline" onClick={clearSearch}>
+                    <X className="w-4 h-4" />
+                  </Button>
+                )}
+              </form>
               <div className="grid gap-4">
-                {contacts.map((contact) => (
+                {(searchResults ?? contacts).map((contact) => (
                   <ContactCard
                     key={contact.id}
                     contact={contact}
                     onDelete={() => handleDeleteContact(contact.id)}
                   />
                 ))}
-                {contacts.length === 0 && (
+                {searchResults && searchResults.length === 0 && (
+                  <p className="text-center text-gray-500 py-8">Aucun message ne correspond à la recherche</p>
+                )}
+                {!searchResults && contacts.length === 0 && (
                   <p className="text-center text-gray-500 py-8">Aucun message pour le moment</p>
                 )}
+                {!searchResults && contactsCursor && (
+                  <Button variant="outline" onClick={loadMoreContacts}>
+                    Charger plus de messages
+                  </Button>
+                )}
+              </div>
+            </div>
+          </TabsContent>
+
+          {/* Analytics Tab */}
+          <TabsContent value="analytics">
+            <div className="space-y-4">
+              <div className="flex justify-between items-center">
+                <h2 className="text-2xl font-bold">Statistiques des demandes</h2>
+                <div className="flex gap-2">
+                  {[['day', 'Jours'], ['week', 'Semaines'], ['month', 'Mois']].map(([period, label]) => (
+                    <Button
+                      key={period}
+                      variant={analyticsPeriod === period ? 'default' : 'outline'}
+                      onClick={() => fetchAnalytics(period)}
+                    >
+                      {label}
+                    </Button>
+                  ))}
+                </div>
               </div>
+              {analytics && <AnalyticsView analytics={analytics} />}
             </div>
           </TabsContent>
         </Tabs>
@@ -676,6 +827,62 @@ const GalleryCard = ({ item, onEdit, onDelete }) => {
   );
 };
 
+// Leads per period as bars, with region and subject totals over the same range
+const AnalyticsView = ({ analytics }) => {
+  const max = Math.max(1, ...analytics.series.map((bucket) => bucket.total));
+  const Breakdown = ({ title, counts }) => (
+    <Card>
+      <CardContent className="p-6">
+        <h3 className="font-bold mb-3">{title}</h3>
+        {Object.entries(counts).map(([name, count]) => (
+          <div key={name} className="flex justify-between text-sm py-1 border-b last:border-0">
+            <span className="capitalize">{name}</span>
+            <span className="font-semibold">{count}</span>
+          </div>
+        ))}
+        {Object.keys(counts).length === 0 && <p className="text-sm text-gray-500">Aucune donnée</p>}
+      </CardContent>
+    </Card>
+  );
+  return (
+    <div className="space-y-4">
+      <Card>
+        <CardContent className="p-6">
+          <p className="mb-4"><strong>{analytics.total}</strong> demandes sur la période</p>
+          <div className="flex items-end gap-1 h-40">
+            {analytics.series.map((bucket) => (
+              <div
+                key={bucket.key}
+                title={`${bucket.key} : ${bucket.total}`}
+                className="flex-1 bg-cyan-500 rounded-t"
+                style={{ height: `${(bucket.total / max) * 100}%` }}
+              />
+            ))}
+          </div>
+        </CardContent>
+      </Card>
+      <div className="grid md:grid-cols-2 gap-4">
+        <Breakdown title="Par région" counts={analytics.by_region} />
+        <Breakdown title="Par sujet" counts={analytics.by_subject} />
+      </div>
+    </div>
+  );
+};
+
+// Wraps the [start, end) ranges found by the contact search in <mark>
+const Highlighted = ({ text, ranges }) => {
+  if (!text || !ranges || ranges.length === 0) return text ?? null;
+  const parts = [];
+  let position = 0;
+  ranges.forEach(([start, end]) => {
+    if (start > position) parts.push(text.slice(position, start));
+    parts.push(<mark key={start} className="bg-yellow-200">{text.slice(start, end)}</mark>);
+    position = end;
+  });
+  parts.push(text.slice(position));
+  return <>{parts}</>;
+};
+
 // Contact Card Component
 const ContactCard = ({ contact, onDelete }) => (
   <Card>
@@ -683,17 +890,21 @@ const ContactCard = ({ contact, onDelete }) => (
       <div className="flex justify-between items-start">
         <div className="flex-1">
           <div className="flex items-center gap-3 mb-3">
-            <h3 className="text-lg font-bold">{contact.name}</h3>
+            <h3 className="text-lg font-bold">
+              <Highlighted text={contact.name} ranges={contact.highlights?.name} />
+            </h3>
             <span className="text-xs text-gray-500">
               {new Date(contact.created_at).toLocaleDateString('fr-FR')}
             </span>
           </div>
           <div className="space-y-2 text-sm">
-            <p><strong>Email:</strong> {contact.email}</p>
+            <p><strong>Email:</strong> <Highlighted text={contact.email} ranges={contact.highlights?.email} /></p>
             {contact.phone && <p><strong>Téléphone:</strong> {contact.phone}</p>}
             {contact.postalCode && <p><strong>Code postal:</strong> {contact.postalCode}</p>}
-            <p><strong>Sujet:</strong> {contact.subject}</p>
-            <p className="text-gray-600 mt-3">{contact.message}</p>
+            <p><strong>Sujet:</strong> <Highlighted text={contact.subject} ranges={contact.highlights?.subject} /></p>
+            <p className="text-gray-600 mt-3">
+              <Highlighted text={contact.message} ranges={contact.highlights?.message} />
+            </p>
           </div>
         </div>
         <Button onClick={onDelete} variant="destructive" size="sm" className="gap-2">
@@ -10,6 +10,20 @@ import axios from 'axios';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Build a srcSet from the backend's width -> URL variant map
+const srcSetFor = (widths) =>
+  Object.entries(widths || {})
+    .map(([width, url]) => `${BACKEND_URL}${url} ${width}w`)
+    .join(', ');
+
+// <source> elements for each resized format (AVIF, WebP) of an uploaded image
+const ImageSources = ({ variants, sizes }) =>
+  Object.entries(variants || {}).map(([format, widths]) => (
+    <source key={format} type={`image/${format}`} srcSet={srcSetFor(widths)} sizes={sizes} />
+  ));
+
+const galleryImageField = (img) => (img.image ? 'image' : img.image_after ? 'image_after' : 'image_before');
+
 const Home = () => {
   const [formData, setFormData] = useState({
     name: '',
@@ -60,16 +74,14 @@ const Home = () => {
 
   const loadData = async () => {
     try {
-      const [servicesRes, galleryRes] = await Promise.all([
-        axios.get(`${API}/services`),
-        axios.get(`${API}/gallery`)
-      ]);
+      // One precompressed snapshot; the browser revalidates it with its ETag on every refresh
+      const { data } = await axios.get(`${API}/site`);
 
       // Set services from database only
-      setServices(servicesRes.data || []);
+      setServices(data?.services || []);
 
       // Set gallery items from database only
-      setGalleryItems(galleryRes.data || []);
+      setGalleryItems(data?.gallery || []);
 
       setLoading(false);
     } catch (error) {
@@ -111,7 +123,9 @@ const Home = () => {
       console.error('Error submitting form:', error);
       toast({
         title: "Erreur",
-        description: "Une erreur est survenue. Veuillez réessayer.",
+        description: error.response?.status === 429
+          ? "Trop de messages envoyés. Veuillez réessayer plus tard."
+          : "Une erreur est survenue. Veuillez réessayer.",
         variant: "destructive"
       });
     }
@@ -545,14 +559,18 @@ const Home = () => {
                   }}
                 >
                   <div className="relative h-64 overflow-hidden">
-                    <img 
-                      src={service.image?.startsWith('http') ? service.image : `${BACKEND_URL}${service.image?.startsWith('/uploads/') ? service.image.replace('/uploads/', '/api/uploads/') : service.image}`} 
-                      alt={service.title}
-                      className="w-full h-full object-cover group-hover:scale-125 group-hover:rotate-3 transition-all duration-1000"
-                      onError={(e) => {
-                        e.target.src = 'https://placehold.co/800x400?text=Service+Image';
-                      }}
-                    />
+                    <picture>
+                      <ImageSources variants={service.image_variants?.image} sizes="(min-width: 768px) 33vw, 100vw" />
+                      <img 
+                        src={service.image?.startsWith('http') ? service.image : `${BACKEND_URL}${service.image?.startsWith('/uploads/') ? service.image.replace('/uploads/', '/api/uploads/') : service.image}`} 
+                        alt={service.title}
+                        loading="lazy"
+                        className="w-full h-full object-cover group-hover:scale-125 group-hover:rotate-3 transition-all duration-1000"
+                        onError={(e) => {
+                          e.target.src = 'https://placehold.co/800x400?text=Service+Image';
+                        }}
+                      />
+                    </picture>
                     <div className="absolute inset-0 bg-gradient-to-t from-black/90 via-black/50 to-transparent group-hover:from-cyan-900/90 transition-all duration-700"></div>
                     <div className="absolute inset-0 bg-cyan-500/0 group-hover:bg-cyan-500/10 transition-colors duration-700"></div>
                     <div className="absolute bottom-4 left-4 right-4 transform translate-y-0 group-hover:-translate-y-2 transition-transform duration-500">
@@ -610,15 +628,18 @@ const Home = () => {
                           : 'opacity-0 invisible z-0'
                       }`}
                     >
-                      <img 
-                        src={fullImageUrl}
-                        alt={img.title || `Réalisation ${idx + 1}`}
-                        className="w-full h-full object-cover cursor-pointer hover:scale-105 transition-transform duration-700"
-                        onClick={() => openZoom(fullImageUrl)}
-                        onError={(e) => {
-                          e.target.src = 'https://placehold.co/800x600?text=Image';
-                        }}
-                      />
+                      <picture>
+                        <ImageSources variants={img.image_variants?.[galleryImageField(img)]} sizes="(min-width: 1280px) 1280px, 100vw" />
+                        <img 
+                          src={fullImageUrl}
+                          alt={img.title || `Réalisation ${idx + 1}`}
+                          className="w-full h-full object-cover cursor-pointer hover:scale-105 transition-transform duration-700"
+                          onClick={() => openZoom(fullImageUrl)}
+                          onError={(e) => {
+                            e.target.src = 'https://placehold.co/800x600?text=Image';
+                          }}
+                        />
+                      </picture>
                       {/* Gradient overlay */}
                       <div className="absolute inset-0 bg-gradient-to-t from-black/60 via-transparent to-transparent"></div>
                       
@@ -674,14 +695,18 @@ const Home = () => {
                           : 'opacity-60 hover:opacity-100 hover:scale-105'
                       }`}
                     >
-                      <img 
-                        src={fullImageUrl}
-                        alt={`Thumbnail ${idx + 1}`}
-                        className="w-full h-full object-cover"
-                        onError={(e) => {
-                          e.target.src = 'https://placehold.co/100x100?text=...';
-                        }}
-                      />
+                      <picture>
+                        <ImageSources variants={img.image_variants?.[galleryImageField(img)]} sizes="96px" />
+                        <img 
+                          src={fullImageUrl}
+                          alt={`Thumbnail ${idx + 1}`}
+                          loading="lazy"
+                          className="w-full h-full object-cover"
+                          onError={(e) => {
+                            e.target.src = 'https://placehold.co/100x100?text=...';
+                          }}
+                        />
+                      </picture>
                     </button>
                   );
                 })}
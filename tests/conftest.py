@@ -0,0 +1,72 @@
+import dataclasses
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import config  # noqa: E402
+from auth import hash_password  # noqa: E402
+
+# Explicit settings rather than the environment, as create_app(settings) does
+config.configure(config.Settings(
+    mongo_url="mongodb://localhost:27017",
+    db_name="belkgroup_test",
+    admin_email="admin@example.com",
+    admin_password_hash=hash_password("secret"),
+    jwt_secret_key="test-secret",
+    # Never touch the tracked backend/uploads directory
+    uploads_dir=Path(tempfile.mkdtemp(prefix="belkgroup-uploads-")),
+))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    """A fresh in-memory database per test"""
+    client = AsyncMongoMockClient()
+    yield client["belkgroup_test"]
+    client.close()
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    """Override settings fields for one test, e.g. settings(trusted_proxy_hops=1)"""
+    def override(**fields):
+        monkeypatch.setattr(config, "_settings", dataclasses.replace(config.get_settings(), **fields))
+    return override
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    """A TestClient of create_app() over the `db` database, background jobs off"""
+    from fastapi.testclient import TestClient
+
+    import auth
+    import rate_limit
+    import server
+    import storage
+
+    # create_app(settings) replaces these; put the test-wide ones back afterwards
+    monkeypatch.setattr(config, "_settings", config.get_settings())
+    for module, name in ((storage, "_backend"), (rate_limit, "_backend"), (auth, "_token_cache")):
+        monkeypatch.setattr(module, name, getattr(module, name))
+    monkeypatch.setattr(server, "AsyncIOMotorClient", lambda *args, **kwargs: db.client)
+
+    app = server.create_app(dataclasses.replace(
+        config.get_settings(), image_mirror_poll_interval=0, upload_gc_interval=0))
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def admin_headers(client):
+    response = client.post("/api/admin/login", json={"email": "admin@example.com", "password": "secret"})
+    return {"Authorization": f"Bearer {response.json()['token']}"}
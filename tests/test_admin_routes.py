@@ -0,0 +1,110 @@
+import io
+
+import pytest
+from PIL import Image
+
+from file_upload import STATIC_URL
+
+
+@pytest.fixture
+def services(client, admin_headers):
+    """Ids of three services, created in order"""
+    return [
+        client.post("/api/admin/services", headers=admin_headers,
+                    json={"title": f"S{i}", "description": "d", "image": "x", "order": i}).json()["id"]
+        for i in range(3)
+    ]
+
+
+def test_reorder_applies_positions_and_refreshes_public_list(client, admin_headers, services):
+    assert [s["title"] for s in client.get("/api/services").json()] == ["S0", "S1", "S2"]
+
+    response = client.put("/api/admin/services/reorder", json={"ids": services[::-1]}, headers=admin_headers)
+
+    assert response.json() == {"matched": 3, "modified": 3}
+    assert [s["title"] for s in client.get("/api/services").json()] == ["S2", "S1", "S0"]
+
+
+def test_reorder_rejects_duplicate_ids(client, admin_headers, services):
+    response = client.put("/api/admin/services/reorder", json={"ids": [services[0], services[0]]},
+                          headers=admin_headers)
+
+    assert response.status_code == 400
+
+
+def test_reorder_counts_only_known_ids(client, admin_headers, services):
+    response = client.put("/api/admin/services/reorder", json={"ids": ["missing", services[0]]},
+                          headers=admin_headers)
+
+    assert response.json()["matched"] == 1
+
+
+def test_update_returns_the_updated_document(client, admin_headers, services):
+    response = client.put(f"/api/admin/services/{services[0]}", json={"title": "New"}, headers=admin_headers)
+
+    assert response.status_code == 200
+    assert (response.json()["title"], response.json()["description"]) == ("New", "d")
+    assert client.get("/api/services").json()[0]["title"] == "New"
+
+
+@pytest.mark.parametrize("path", ["/api/admin/services/missing", "/api/admin/gallery/missing"])
+def test_update_of_unknown_id_is_404(client, admin_headers, path):
+    response = client.put(path, json={"title": "New"}, headers=admin_headers)
+
+    assert response.status_code == 404
+
+
+def test_admin_routes_need_a_token(client):
+    assert client.put("/api/admin/services/reorder", json={"ids": []}).status_code == 401
+
+
+def _png(color) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_gallery_batch_create_returns_a_result_per_item(client, admin_headers):
+    response = client.post("/api/admin/gallery/batch", json=[{"title": "A"}, {"title": "B"}], headers=admin_headers)
+
+    body = response.json()
+    assert body["created"] == 2
+    assert [(r["index"], r["ok"], r["item"]["title"]) for r in body["results"]] == [(0, True, "A"), (1, True, "B")]
+    assert sorted(item["title"] for item in client.get("/api/gallery").json()) == ["A", "B"]
+
+
+def test_gallery_batch_delete_reports_unknown_ids(client, admin_headers):
+    created = client.post("/api/admin/gallery/batch", json=[{"title": "A"}, {"title": "B"}], headers=admin_headers)
+    ids = [result["item"]["id"] for result in created.json()["results"]]
+
+    response = client.post("/api/admin/gallery/batch-delete", json={"ids": [ids[0], "missing"]}, headers=admin_headers)
+
+    assert response.json() == {"deleted": 1, "results": [{"id": ids[0], "deleted": True}, {"id": "missing", "deleted": False}]}
+    assert [item["title"] for item in client.get("/api/gallery").json()] == ["B"]
+
+
+def test_batches_over_the_limit_are_413(client, admin_headers, settings):
+    settings(max_batch_size=2)
+
+    items = client.post("/api/admin/gallery/batch", json=[{"title": "A"}] * 3, headers=admin_headers)
+    ids = client.post("/api/admin/gallery/batch-delete", json={"ids": ["a", "b", "c"]}, headers=admin_headers)
+
+    assert (items.status_code, ids.status_code) == (413, 413)
+
+
+def test_upload_images_returns_a_result_per_file(client, admin_headers):
+    files = [
+        ("files", ("red.png", _png("red"), "image/png")),
+        ("files", ("notes.txt", b"not an image", "text/plain")),
+        ("files", ("blue.png", _png("blue"), "image/png")),
+    ]
+
+    response = client.post("/api/admin/upload-images", files=files, headers=admin_headers)
+
+    body = response.json()
+    assert body["uploaded"] == 2
+    ok = [result for result in body["results"] if result["ok"]]
+    assert [result["filename"] for result in ok] == ["red.png", "blue.png"]
+    assert all(result["url"].startswith(STATIC_URL + "/") for result in ok)
+    assert body["results"][1]["status"] == 415
+    assert client.get(ok[0]["url"]).content == _png("red")
@@ -0,0 +1,135 @@
+import importlib
+import sys
+from argparse import Namespace
+from datetime import date, datetime
+
+import motor.motor_asyncio
+import pytest
+from pymongo.errors import PyMongoError
+
+import analytics
+
+pytestmark = pytest.mark.anyio
+
+CONTACT = {"name": "Jo", "email": "jo@example.com", "phone": "0470", "postalCode": "1050",
+           "subject": "Rénovation", "message": "Bonjour"}
+
+
+@pytest.fixture
+def rollups(db):
+    analytics.set_db(db)
+    return db[analytics.ROLLUPS_COLLECTION]
+
+
+async def _buckets(rollups):
+    return {doc["_id"]: doc async for doc in rollups.find({})}
+
+
+def test_postal_region_and_subject_key():
+    assert analytics.postal_region("B-1050") == "bruxelles"
+    assert analytics.postal_region("4000") == "liege"
+    assert analytics.postal_region("75001") == analytics.UNKNOWN
+    assert analytics.postal_region(None) == analytics.UNKNOWN
+    assert analytics.subject_key("Rénovation  Salle-de-bain!") == "renovation salle de bain"
+    assert analytics.subject_key("$.") == analytics.UNKNOWN
+
+
+def test_buckets_follow_the_brussels_calendar_day():
+    # 23:30 UTC on New Year's Eve is already the next year in Brussels
+    assert analytics.local_day(datetime(2025, 12, 31, 23, 30)) == date(2026, 1, 1)
+    assert analytics.bucket_key("week", date(2026, 1, 1)) == "2026-W01"
+    assert analytics.bucket_key("month", date(2026, 1, 1)) == "2026-01"
+
+
+async def test_record_contact_counts_every_period(rollups):
+    contact = {**CONTACT, "created_at": datetime(2026, 3, 4, 10)}
+
+    await analytics.record_contact(contact)
+    await analytics.record_contact(contact)
+
+    buckets = await _buckets(rollups)
+    assert set(buckets) == {"day:2026-03-04", "week:2026-W10", "month:2026-03"}
+    assert buckets["day:2026-03-04"]["total"] == 2
+    assert buckets["month:2026-03"]["by_region"] == {"bruxelles": 2}
+    assert buckets["month:2026-03"]["by_subject"] == {"renovation": 2}
+
+    await analytics.record_contact(contact, amount=-1)
+    assert (await _buckets(rollups))["week:2026-W10"]["total"] == 1
+
+
+async def test_rebuild_matches_incremental_counts(db, rollups):
+    contacts = [{**CONTACT, "id": f"c{i}", "created_at": datetime(2026, 3, 1 + i % 3, 9),
+                 "postalCode": ["1050", "4000", None][i % 3]} for i in range(7)]
+    await db.contacts.insert_many([dict(contact) for contact in contacts])
+    for contact in contacts:
+        await analytics.record_contact(contact)
+    incremental = await _buckets(rollups)
+    await rollups.insert_one({"_id": "day:2020-01-01", "period": "day", "key": "2020-01-01", "total": 5})
+
+    await analytics.rebuild(batch_size=2)
+
+    rebuilt = await _buckets(rollups)
+    assert set(rebuilt) == set(incremental)
+    for bucket_id, bucket in rebuilt.items():
+        assert bucket["total"] == incremental[bucket_id]["total"]
+        assert bucket["by_region"] == incremental[bucket_id]["by_region"]
+
+
+async def test_rebuild_dry_run_writes_nothing(db, rollups):
+    await db.contacts.insert_one({**CONTACT, "id": "c", "created_at": datetime(2026, 3, 4, 10)})
+
+    buckets = await analytics.rebuild(dry_run=True)
+
+    assert buckets["month:2026-03"]["total"] == 1
+    assert await rollups.count_documents({}) == 0
+
+
+async def test_summarize_drops_zero_counters():
+    summary = analytics.summarize("day", [
+        {"key": "2026-03-04", "total": 1, "by_region": {"bruxelles": 1, "liege": 0}, "by_subject": {"devis": 1}},
+        {"key": "2026-03-05", "total": 2, "by_region": {"liege": 2}, "by_subject": {}},
+    ])
+
+    assert summary["total"] == 3
+    assert summary["series"][0]["by_region"] == {"bruxelles": 1}
+    assert summary["by_region"] == {"liege": 2, "bruxelles": 1}
+
+
+async def test_backfill_command_rebuilds_the_rollups(db, rollups, monkeypatch, capsys):
+    monkeypatch.setattr(motor.motor_asyncio, "AsyncIOMotorClient", lambda *args, **kwargs: db.client)
+    monkeypatch.delitem(sys.modules, "backfill_analytics", raising=False)
+    backfill_analytics = importlib.import_module("backfill_analytics")
+    analytics.set_db(db)
+    await db.contacts.insert_many([{**CONTACT, "id": f"c{i}", "created_at": datetime(2026, 3, 4, 10)} for i in range(3)])
+
+    assert await backfill_analytics.main(Namespace(batch_size=2, dry_run=False)) == 0
+
+    assert "Rebuilt 3 buckets from 3 contacts" in capsys.readouterr().out
+    assert (await rollups.find_one({"_id": "month:2026-03"}))["total"] == 3
+
+
+def test_contact_form_and_delete_keep_rollups_in_step(client, admin_headers):
+    contact_id = client.post("/api/contact", json=CONTACT).json()["id"]
+    day = analytics.bucket_key("day", analytics.local_day(datetime.utcnow()))
+
+    response = client.get("/api/admin/analytics", params={"period": "day"}, headers=admin_headers)
+    assert response.json()["total"] == 1
+    assert response.json()["by_region"] == {"bruxelles": 1}
+
+    assert client.delete(f"/api/admin/contacts/{contact_id}", headers=admin_headers).status_code == 200
+    response = client.get("/api/admin/analytics", params={"period": "day"}, headers=admin_headers)
+    assert response.json()["total"] == 0
+    assert response.json()["series"][0]["key"] == day
+
+
+def test_contact_delete_stands_when_the_rollup_update_fails(client, admin_headers, monkeypatch):
+    contact_id = client.post("/api/contact", json=CONTACT).json()["id"]
+
+    async def failing(*args, **kwargs):
+        raise PyMongoError("rollups unavailable")
+    monkeypatch.setattr(analytics, "record_contact", failing)
+
+    response = client.delete(f"/api/admin/contacts/{contact_id}", headers=admin_headers)
+
+    assert response.status_code == 200
+    assert client.delete(f"/api/admin/contacts/{contact_id}", headers=admin_headers).status_code == 404
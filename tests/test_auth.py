@@ -0,0 +1,93 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import auth
+import cache
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def auth_db(db, monkeypatch):
+    auth.set_db(db)
+    cache.set_db(db)
+    auth.set_token_cache(None)
+    monkeypatch.setattr(auth, "_revoked", set())
+    monkeypatch.setattr(auth, "_revoked_loaded", False)
+    cache._versions.pop(auth.REVOKED_COLLECTION, None)
+    yield
+    auth.set_token_cache(None)
+
+
+def test_token_cache_evicts_least_recently_used():
+    token_cache = auth.VerifiedTokenCache(2)
+    exp = time.time() + 60
+    token_cache.put("a", {"exp": exp})
+    token_cache.put("b", {"exp": exp})
+    token_cache.get("a")
+    token_cache.put("c", {"exp": exp})
+
+    assert len(token_cache) == 2
+    assert token_cache.get("b") is None
+    assert token_cache.get("a") == {"exp": exp}
+
+
+def test_token_cache_drops_expired_entries():
+    token_cache = auth.VerifiedTokenCache(2)
+    token_cache.put("a", {"exp": time.time() - 1})
+
+    assert token_cache.get("a") is None
+    assert len(token_cache) == 0
+
+
+def test_cached_token_skips_signature_check(monkeypatch):
+    token = auth.create_access_token({"sub": "admin"})
+    calls = []
+    verify = auth.verify_token
+    monkeypatch.setattr(auth, "verify_token", lambda token: calls.append(token) or verify(token))
+
+    first = auth.verify_token_cached(token)
+    second = auth.verify_token_cached(token)
+
+    assert first == second and first["sub"] == "admin"
+    assert len(calls) == 1
+
+
+def test_invalid_token_is_not_cached():
+    assert auth.verify_token_cached("not-a-token") is None
+    assert len(auth.get_token_cache()) == 0
+
+
+async def test_revoked_token_is_rejected():
+    token = auth.create_access_token({"sub": "admin"})
+    payload = await auth.authenticate(token)
+    assert payload["sub"] == "admin"
+
+    await auth.revoke_token(payload)
+
+    assert await auth.authenticate(token) is None
+
+
+async def test_revocation_by_another_worker_is_picked_up(db):
+    token = auth.create_access_token({"sub": "admin"})
+    payload = await auth.authenticate(token)
+
+    # Another worker writes the revocation and bumps the shared version
+    await db[auth.REVOKED_COLLECTION].insert_one(
+        {"jti": payload["jti"], "exp": datetime.utcnow() + timedelta(hours=1)})
+    await cache.invalidate(auth.REVOKED_COLLECTION)
+
+    assert await auth.authenticate(token) is None
+
+
+async def test_expired_revocations_are_not_loaded(db):
+    await db[auth.REVOKED_COLLECTION].insert_many([
+        {"jti": "old", "exp": datetime.utcnow() - timedelta(minutes=1)},
+        {"jti": "live", "exp": datetime.utcnow() + timedelta(minutes=1)},
+    ])
+
+    await auth.load_revocations()
+
+    assert auth._revoked == {"live"}
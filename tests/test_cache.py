@@ -0,0 +1,101 @@
+import gzip
+
+import pytest
+from starlette.requests import Request
+
+import cache
+
+pytestmark = pytest.mark.anyio
+
+
+def _request(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+@pytest.fixture
+def loads(db):
+    """Register a test payload whose loader counts its calls"""
+    cache.set_db(db)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return {"items": list(range(200)), "build": len(calls)}
+
+    cache.register("test_items", load)
+    cache.register("test_page", load, depends_on=("test_items",), precompress=True)
+    yield calls
+    for name in ("test_items", "test_page"):
+        for registry in (cache._loaders, cache._sources, cache._entries, cache._versions, cache._locks):
+            registry.pop(name, None)
+    cache._precompressed.discard("test_page")
+
+
+async def test_entry_is_reused_until_invalidated(loads):
+    first = await cache.get("test_items")
+    assert await cache.get("test_items") is first
+    assert len(loads) == 1
+
+    await cache.invalidate("test_items")
+
+    second = await cache.get("test_items")
+    assert second is not first
+    assert second.etag != first.etag
+    assert len(loads) == 2
+
+
+async def test_dependency_invalidation_rebuilds_dependent(loads):
+    page = await cache.get("test_page")
+
+    await cache.invalidate("test_items")
+
+    assert (await cache.get("test_page")).version != page.version
+
+
+async def test_versions_sync_from_other_workers(db, loads):
+    entry = await cache.get("test_items")
+    # Another worker bumps the shared counter
+    await db[cache.VERSIONS_COLLECTION].update_one({"_id": "test_items"}, {"$inc": {"version": 1}}, upsert=True)
+
+    await cache.sync_versions()
+
+    assert await cache.get("test_items") is not entry
+
+
+async def test_matching_etag_answers_304(loads):
+    entry = await cache.get("test_items")
+
+    response = cache.cached_response(_request(if_none_match=entry.etag), entry)
+    assert response.status_code == 304
+    assert response.body == b""
+
+    response = cache.cached_response(_request(if_none_match='"stale"'), entry)
+    assert response.status_code == 200
+    assert response.body == entry.body
+    assert response.headers["etag"] == entry.etag
+
+
+async def test_precompressed_entry_negotiates_encoding(loads):
+    entry = await cache.get("test_page")
+
+    response = cache.cached_response(_request(accept_encoding="gzip"), entry)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert gzip.decompress(response.body) == entry.body
+    etag = response.headers["etag"]
+    assert etag == entry.encoded_etag("gzip")
+
+    revalidated = cache.cached_response(_request(accept_encoding="gzip", if_none_match=etag), entry)
+    assert revalidated.status_code == 304
+
+    plain = cache.cached_response(_request(accept_encoding="identity"), entry)
+    assert "content-encoding" not in plain.headers
+    assert plain.body == entry.body
+
+
+def test_accepted_encodings_drops_q0():
+    assert cache.accepted_encodings("br;q=0, gzip;q=0.8, deflate") == {"gzip", "deflate"}
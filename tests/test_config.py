@@ -0,0 +1,45 @@
+import dataclasses
+from pathlib import Path
+
+import pytest
+
+import config
+from auth import hash_password
+
+REQUIRED = {
+    "MONGO_URL": "mongodb://db:27017",
+    "DB_NAME": "belkgroup",
+    "ADMIN_EMAIL": "admin@example.com",
+    "ADMIN_PASSWORD": "secret",
+    "JWT_SECRET_KEY": "k",
+}
+
+
+@pytest.fixture
+def env(monkeypatch):
+    for field in dataclasses.fields(config.Settings):
+        monkeypatch.delenv(field.name.upper(), raising=False)
+    for name, value in REQUIRED.items():
+        monkeypatch.setenv(name, value)
+    return monkeypatch
+
+
+def test_from_env_defaults_match_the_dataclass(env):
+    assert config.Settings.from_env() == config.Settings(
+        mongo_url="mongodb://db:27017", db_name="belkgroup", admin_email="admin@example.com",
+        admin_password_hash=hash_password("secret"), jwt_secret_key="k",
+    )
+
+
+def test_from_env_reads_tuning_variables(env, tmp_path):
+    env.setenv("OUTBOX_MAX_ATTEMPTS", "3")
+    env.setenv("IMAGE_MIRROR_HOSTS", " Images.Example.com, cdn.example.com ,")
+    env.setenv("UPLOADS_DIR", str(tmp_path))
+    env.setenv("EMAIL_DIGEST_MODE", "yes")
+
+    settings = config.Settings.from_env()
+
+    assert settings.outbox_max_attempts == 3
+    assert settings.image_mirror_hosts == ("images.example.com", "cdn.example.com")
+    assert settings.uploads_dir == Path(tmp_path)
+    assert settings.email_digest_mode is True
@@ -0,0 +1,85 @@
+import pytest
+
+import email_service
+import email_transport
+from email_transport import EmailError
+
+pytestmark = pytest.mark.anyio
+
+CONTACT = {"name": "Jo", "email": "jo@example.com", "subject": "Devis", "message": "Bonjour"}
+
+
+class RecordingTransport(email_transport.Transport):
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, params):
+        self.sent.append(params)
+        return f"id-{len(self.sent)}"
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    transport = RecordingTransport()
+    monkeypatch.setattr(email_transport, "_transport", transport)
+    return transport
+
+
+def test_submitted_values_are_html_escaped():
+    rendered = email_service.render_contact_email({
+        **CONTACT,
+        "name": "<script>alert(1)</script>",
+        "email": 'jo@example.com"><img src=x>',
+        "message": "a & b",
+    })
+
+    assert "<script>" not in rendered and "<img" not in rendered
+    assert "&lt;script&gt;alert(1)&lt;/script&gt;" in rendered
+    assert "jo@example.com&quot;&gt;&lt;img src=x&gt;" in rendered
+    assert "a &amp; b" in rendered
+
+
+def test_missing_optional_fields_get_placeholders():
+    rendered = email_service.render_contact_email({"name": "Jo", "email": "jo@example.com", "subject": "", "message": "Hi"})
+
+    assert "Non fourni" in rendered
+    assert "N/A" in rendered
+
+
+def test_digest_lists_every_contact():
+    rendered = email_service.render_digest_email([CONTACT, {**CONTACT, "name": "Al <b>"}])
+
+    assert "2 nouveaux messages de contact" in rendered
+    assert "Message 1 / 2" in rendered and "Message 2 / 2" in rendered
+    assert "Al &lt;b&gt;" in rendered
+
+
+def test_is_urgent_matches_configured_keywords(settings):
+    assert email_service.is_urgent({"subject": "Fuite URGENTE"})
+    assert not email_service.is_urgent({"subject": "Devis"})
+    assert not email_service.is_urgent({"subject": None})
+
+    settings(urgent_keywords=("asap",))
+    assert email_service.is_urgent({"subject": "Reply ASAP"})
+
+
+async def test_digest_of_several_contacts_is_one_email(transport):
+    await email_service.deliver_digest_email([CONTACT, CONTACT, CONTACT])
+
+    assert len(transport.sent) == 1
+    assert transport.sent[0]["subject"] == "3 nouveaux contacts - BelkGroup"
+    assert "reply_to" not in transport.sent[0]
+
+
+async def test_digest_of_one_contact_is_a_plain_contact_email(transport):
+    await email_service.deliver_digest_email([CONTACT])
+
+    assert transport.sent[0]["subject"] == "Nouveau contact - Devis"
+    assert transport.sent[0]["reply_to"] == "jo@example.com"
+
+
+async def test_sending_without_transport_fails(monkeypatch):
+    monkeypatch.setattr(email_transport, "_transport", None)
+
+    with pytest.raises(EmailError):
+        await email_service.deliver_contact_email(CONTACT)
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import email_transport
+from email_transport import EmailError, ResendTransport
+
+pytestmark = pytest.mark.anyio
+
+
+class StubResend(BaseHTTPRequestHandler):
+    """Local stand-in for the Resend API; answers with the class-level `status` and `body`"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers["content-length"])))
+        with server.lock:
+            server.received.append((self.path, self.headers["authorization"], payload))
+            email_id = f"email-{len(server.received)}"
+            server.connections.add(self.client_address)
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+        time.sleep(server.latency)
+        with server.lock:
+            server.in_flight -= 1
+        body = server.body if server.body is not None else json.dumps({"id": email_id}).encode()
+        self.send_response(server.status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubResend)
+    server.lock = threading.Lock()
+    server.received, server.connections = [], set()
+    server.in_flight = server.peak = 0
+    server.status, server.body, server.latency = 200, None, 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+async def test_send_posts_to_emails_with_bearer_key(stub):
+    transport = ResendTransport("re_test", stub.url)
+    try:
+        email_id = await transport.send({"to": ["info@example.com"], "subject": "Hi"})
+    finally:
+        await transport.aclose()
+
+    assert email_id == "email-1"
+    assert stub.received == [("/emails", "Bearer re_test", {"to": ["info@example.com"], "subject": "Hi"})]
+
+
+async def test_error_response_raises_email_error_with_message(stub):
+    stub.status, stub.body = 422, b'{"name": "validation_error", "message": "Invalid `to` field"}'
+    transport = ResendTransport("re_test", stub.url)
+    try:
+        with pytest.raises(EmailError, match="HTTP 422: Invalid `to` field"):
+            await transport.send({})
+    finally:
+        await transport.aclose()
+
+
+@pytest.mark.parametrize("body", [b"<html>OK</html>", b'["queued"]'])
+async def test_success_without_json_object_raises_email_error(stub, body):
+    stub.body = body
+    transport = ResendTransport("re_test", stub.url)
+    try:
+        with pytest.raises(EmailError, match="HTTP 200"):
+            await transport.send({})
+    finally:
+        await transport.aclose()
+
+
+async def test_unreachable_api_raises_email_error():
+    transport = ResendTransport("re_test", "http://127.0.0.1:1")
+    try:
+        with pytest.raises(EmailError):
+            await transport.send({})
+    finally:
+        await transport.aclose()
+
+
+async def test_burst_shares_bounded_keepalive_connections(stub):
+    stub.latency = 0.02
+    transport = ResendTransport("re_test", stub.url, concurrency=3)
+    try:
+        ids = await asyncio.gather(*(transport.send({"n": n}) for n in range(30)))
+    finally:
+        await transport.aclose()
+
+    assert len(set(ids)) == 30
+    assert stub.peak <= 3
+    assert len(stub.connections) <= 3
+
+
+async def test_close_clears_configured_transport(stub):
+    email_transport.set_transport(ResendTransport("re_test", stub.url))
+    await email_transport.get_transport().send({})
+
+    await email_transport.close()
+
+    assert email_transport.get_transport() is None
+
+
+def test_transport_requires_send():
+    with pytest.raises(TypeError):
+        email_transport.Transport()
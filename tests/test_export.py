@@ -0,0 +1,62 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+import export
+
+pytestmark = pytest.mark.anyio
+
+FIELDS = ["id", "name", "message", "created_at"]
+
+
+async def _cursor(docs):
+    for doc in docs:
+        yield doc
+
+
+async def _export(docs, fmt, batch_size=2):
+    return [chunk async for chunk in export.stream(_cursor(docs), FIELDS, fmt, batch_size)]
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("=HYPERLINK(\"http://x\")", "'=HYPERLINK(\"http://x\")"),
+    ("@SUM(A1)", "'@SUM(A1)"),
+    ("+32 470 00 00 00", "+32 470 00 00 00"),
+    ("-12.5", "-12.5"),
+    ("-2+3", "'-2+3"),
+    ("+cmd|' /C calc'!A0", "'+cmd|' /C calc'!A0"),
+    ("Bonjour", "Bonjour"),
+    (None, ""),
+    (datetime(2024, 5, 1, 12, 0), "2024-05-01T12:00:00"),
+])
+def test_cell_escapes_formulas(value, expected):
+    assert export._cell(value) == expected
+
+
+async def test_csv_streams_header_once_and_one_chunk_per_batch():
+    docs = [{"id": str(i), "name": f"N{i}", "message": "a, \"b\"\nc", "created_at": datetime(2024, 1, 1)}
+            for i in range(5)]
+
+    chunks = await _export(docs, export.CSV)
+
+    assert len(chunks) == 3
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+    assert rows[0] == FIELDS
+    assert [row[0] for row in rows[1:]] == ["0", "1", "2", "3", "4"]
+    assert rows[1][2] == "a, \"b\"\nc"
+
+
+async def test_empty_csv_export_still_has_header():
+    assert b"".join(await _export([], export.CSV)).decode().splitlines() == [",".join(FIELDS)]
+
+
+async def test_ndjson_keeps_raw_values():
+    docs = [{"id": "1", "name": "=x", "message": None, "created_at": datetime(2024, 1, 1), "extra": 1}]
+
+    lines = b"".join(await _export(docs, export.NDJSON)).decode().splitlines()
+
+    assert [json.loads(line) for line in lines] == [
+        {"id": "1", "name": "=x", "message": None, "created_at": "2024-01-01T00:00:00"}]
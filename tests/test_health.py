@@ -0,0 +1,44 @@
+import asyncio
+
+from pymongo.errors import ServerSelectionTimeoutError
+
+import server
+
+
+def test_ready_once_started(client):
+    response = client.get("/health/ready")
+
+    assert (response.status_code, response.json()) == (200, {"status": "ready"})
+
+
+def test_not_ready_before_startup_finished(client):
+    client.app.state.ready = False
+
+    response = client.get("/health/ready")
+
+    assert (response.status_code, response.json()) == (503, {"status": "starting"})
+
+
+def test_not_ready_when_mongo_fails(client, monkeypatch):
+    async def ping(*args):
+        raise ServerSelectionTimeoutError("no servers")
+    monkeypatch.setattr(server.db, "command", ping)
+
+    response = client.get("/health/ready")
+
+    assert (response.status_code, response.json()) == (503, {"status": "unavailable", "mongo": "no servers"})
+    # Liveness never depends on Mongo
+    assert client.get("/health/live").status_code == 200
+
+
+def test_not_ready_when_mongo_is_slow(client, monkeypatch, settings):
+    settings(health_timeout_seconds=0.01)
+
+    async def ping(*args):
+        await asyncio.sleep(1)
+    monkeypatch.setattr(server.db, "command", ping)
+
+    response = client.get("/health/ready")
+
+    assert response.status_code == 503
+    assert response.json()["mongo"] == "no answer within 0.01s"
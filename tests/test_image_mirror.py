@@ -0,0 +1,171 @@
+import ipaddress
+
+import httpx
+import pytest
+
+import cache
+import image_mirror
+import storage
+from file_upload import STATIC_URL
+
+pytestmark = pytest.mark.anyio
+
+SOURCE = "https://cdn.example.com/photo.png"
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+# Stand-in DNS; other names resolve to a public address
+ADDRESSES = {"intranet.example.com": "10.0.0.5", "localhost": "127.0.0.1"}
+
+
+class Origin:
+    """Serves SOURCE with an ETag, answering 304 to a matching If-None-Match"""
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=PNG, headers={"etag": '"v1"'})
+
+
+@pytest.fixture
+def origin(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_backend", storage.LocalStorage(tmp_path))
+    monkeypatch.setattr(image_mirror, "_resolve", _resolve)
+    image_mirror.set_db(db)
+    cache.set_db(db)
+    return Origin()
+
+
+async def _resolve(host, port):
+    try:
+        return {str(ipaddress.ip_address(host))}
+    except ValueError:
+        return {ADDRESSES.get(host, "93.184.216.34")}
+
+
+async def _mirror(origin, **kwargs):
+    async with httpx.AsyncClient(transport=httpx.MockTransport(origin)) as client:
+        return await image_mirror.mirror_once(client=client, **kwargs)
+
+
+async def test_external_image_is_copied_and_document_rewritten(db, origin):
+    await db.services.insert_one({"id": "s", "title": "A", "image": SOURCE})
+
+    counts = await _mirror(origin)
+
+    assert counts[image_mirror.FETCHED] == 1
+    assert counts["rewritten"] == 1
+    image = (await db.services.find_one({"id": "s"}))["image"]
+    assert image.startswith(STATIC_URL + "/") and image.endswith(".png")
+    assert await image_mirror.local_urls([SOURCE]) == {SOURCE: image}
+
+
+async def test_recheck_is_conditional(db, origin):
+    await db.services.insert_one({"id": "s", "title": "A", "image": SOURCE})
+    await _mirror(origin)
+
+    counts = await _mirror(origin, force=True)
+
+    assert counts[image_mirror.NOT_MODIFIED] == 1
+    assert origin.requests[-1].headers["if-none-match"] == '"v1"'
+
+
+async def test_unused_source_is_pruned_instead_of_rechecked(db, origin):
+    await db.services.insert_one({"id": "s", "title": "A", "image": SOURCE})
+    await _mirror(origin)
+    await db.services.delete_one({"id": "s"})
+
+    counts = await _mirror(origin, force=True)
+
+    assert counts["pruned"] == 1
+    assert len(origin.requests) == 1
+    assert await db[image_mirror.MIRRORS_COLLECTION].count_documents({}) == 0
+
+
+async def test_failed_source_backs_off(db, origin):
+    await db.gallery.insert_one({"id": "g", "title": "G", "image": "https://cdn.example.com/missing.png"})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(404))) as client:
+        counts = await image_mirror.mirror_once(client=client)
+
+    assert counts[image_mirror.FAILED] == 1
+    record = await db[image_mirror.MIRRORS_COLLECTION].find_one({})
+    assert (record["failures"], record["error"]) == (1, "HTTP 404")
+    assert (await db.gallery.find_one({"id": "g"}))["image"] == "https://cdn.example.com/missing.png"
+
+
+class Redirector(Origin):
+    """Redirects SOURCE to `target`, serving everything else like Origin"""
+
+    def __init__(self, target):
+        super().__init__()
+        self.target = target
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if str(request.url) == SOURCE:
+            self.requests.append(request)
+            return httpx.Response(302, headers={"location": self.target})
+        return super().__call__(request)
+
+
+@pytest.mark.parametrize("target", [
+    "http://169.254.169.254/latest/meta-data/",
+    "http://localhost:8001/api/uploads/secret.png",
+    "https://intranet.example.com/photo.png",
+    "ftp://cdn.example.com/photo.png",
+])
+async def test_redirect_to_internal_address_is_refused(db, origin, target):
+    await db.services.insert_one({"id": "s", "title": "A", "image": SOURCE})
+    redirector = Redirector(target)
+
+    counts = await _mirror(redirector)
+
+    assert counts[image_mirror.FAILED] == 1
+    assert [str(request.url) for request in redirector.requests] == [SOURCE]
+    assert (await db.services.find_one({"id": "s"}))["image"] == SOURCE
+
+
+async def test_redirect_to_public_host_is_followed(db, origin):
+    await db.services.insert_one({"id": "s", "title": "A", "image": SOURCE})
+    redirector = Redirector("https://images.example.org/photo.png")
+
+    counts = await _mirror(redirector)
+
+    assert counts[image_mirror.FETCHED] == 1
+    assert len(redirector.requests) == 2
+
+
+async def test_redirect_outside_allowed_hosts_is_refused(db, origin, settings):
+    settings(image_mirror_hosts=("cdn.example.com",))
+    await db.services.insert_one({"id": "s", "title": "A", "image": SOURCE})
+    redirector = Redirector("https://images.example.org/photo.png")
+
+    counts = await _mirror(redirector)
+
+    assert counts[image_mirror.FAILED] == 1
+    assert len(redirector.requests) == 1
+
+
+async def test_source_on_private_address_needs_opt_in(db, origin, settings):
+    source = "https://intranet.example.com/photo.png"
+    await db.services.insert_one({"id": "s", "title": "A", "image": source})
+
+    counts = await _mirror(origin)
+    assert counts[image_mirror.FAILED] == 1
+    assert origin.requests == []
+
+    settings(image_mirror_allow_private=True)
+    counts = await _mirror(origin, force=True)
+    assert counts[image_mirror.FETCHED] == 1
+
+
+async def test_redirect_loop_gives_up(db, origin):
+    await db.services.insert_one({"id": "s", "title": "A", "image": SOURCE})
+
+    counts = await _mirror(Redirector(SOURCE))
+
+    record = await db[image_mirror.MIRRORS_COLLECTION].find_one({})
+    assert counts[image_mirror.FAILED] == 1
+    assert record["error"].startswith("Too many redirects")
@@ -0,0 +1,167 @@
+import pytest
+from PIL import Image
+
+import cache
+import image_variants
+import storage
+from file_upload import STATIC_URL
+from image_variants import VARIANT_FORMATS, attach_variants, variant_map, widths_for
+
+pytestmark = [
+    pytest.mark.anyio,
+    pytest.mark.skipif(not VARIANT_FORMATS, reason="Pillow build encodes neither AVIF nor WebP"),
+]
+
+
+@pytest.fixture(autouse=True)
+def variants_db(db):
+    image_variants.set_db(db)
+    cache.set_db(db)
+
+
+def _image(path, size, orientation=None):
+    image = Image.new("RGB", size, "white")
+    exif = image.getexif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(path, format="JPEG", exif=exif)
+    return str(path)
+
+
+def test_widths_never_exceed_the_source():
+    assert widths_for(None) == image_variants.VARIANT_WIDTHS
+    assert widths_for(800) == (320, 640)
+    assert widths_for(640) == (320, 640)
+    assert widths_for(200) == ()
+
+
+def test_variant_map_lists_only_rendered_widths():
+    mapping = variant_map(f"{STATIC_URL}/abc.jpg", 800)
+
+    assert set(mapping) == set(VARIANT_FORMATS)
+    assert all(list(widths) == ["320", "640"] for widths in mapping.values())
+    assert variant_map(f"{STATIC_URL}/abc.jpg", 200) is None
+    assert variant_map("https://cdn.example.com/abc.jpg", 800) is None
+
+
+def test_render_all_skips_upscaled_widths(tmp_path):
+    source = _image(tmp_path / "src.jpg", (800, 600))
+
+    rendered, width = image_variants._render_all(source, str(tmp_path), "src", full_size=False)
+
+    assert width == 800
+    assert sorted(rendered) == sorted(f"src-{w}.{fmt}" for w in (320, 640) for fmt in VARIANT_FORMATS)
+
+
+def test_full_size_re_encode_keeps_the_rotated_width(tmp_path):
+    # Stored portrait, displayed landscape 800 wide; noise so the re-encode is smaller than the JPEG
+    image = Image.effect_noise((600, 800), 64).convert("RGB")
+    exif = image.getexif()
+    exif[0x0112] = 6
+    image.save(tmp_path / "src.jpg", format="JPEG", quality=95, exif=exif)
+
+    rendered, width = image_variants._render_all(str(tmp_path / "src.jpg"), str(tmp_path), "src")
+
+    fmt = VARIANT_FORMATS[0]
+    assert width == 800 and f"src.{fmt}" in rendered
+    with Image.open(tmp_path / f"src.{fmt}") as full:
+        assert full.size == (800, 600)
+
+
+def test_source_width_follows_exif_rotation(tmp_path):
+    # Stored landscape, displayed portrait
+    assert image_variants._source_width(_image(tmp_path / "rotated.jpg", (800, 600), orientation=6)) == 600
+
+
+async def test_attach_variants_uses_recorded_widths(db):
+    await image_variants._record_width("narrow.jpg", 500)
+    await image_variants._record_width("tiny.jpg", 100)
+    docs = [
+        {"image": f"{STATIC_URL}/narrow.jpg", "image_before": "/uploads/unknown.jpg", "image_after": None},
+        {"image": f"{STATIC_URL}/tiny.jpg"},
+    ]
+
+    docs = await attach_variants(docs, "gallery")
+
+    fmt = VARIANT_FORMATS[0]
+    assert list(docs[0]["image_variants"]["image"][fmt]) == ["320"]
+    # Not rendered yet: every width is advertised and rendered on first request
+    assert list(docs[0]["image_variants"]["image_before"][fmt]) == ["320", "640", "1280"]
+    assert docs[1]["image_variants"] == {}
+
+
+async def test_recording_a_width_invalidates_payloads_using_the_image(db):
+    await db.services.insert_one({"id": "s", "image": f"{STATIC_URL}/new.jpg"})
+
+    await image_variants._record_width("new.jpg", 900)
+
+    assert (await db[cache.VERSIONS_COLLECTION].find_one({"_id": "services"}))["version"] == 1
+    assert await db[cache.VERSIONS_COLLECTION].find_one({"_id": "gallery"}) is None
+    # Same width again: nothing to invalidate
+    await image_variants._record_width("new.jpg", 900)
+    assert (await db[cache.VERSIONS_COLLECTION].find_one({"_id": "services"}))["version"] == 1
+
+
+class CountingStorage(storage.LocalStorage):
+    """Local storage counting existence checks"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.checks = 0
+
+    async def exists(self, name):
+        self.checks += 1
+        return await super().exists(name)
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    backend = CountingStorage(tmp_path)
+    monkeypatch.setattr(storage, "_backend", backend)
+    monkeypatch.setattr(image_variants, "_missing_originals", image_variants.OrderedDict())
+    yield backend
+    image_variants.shutdown()
+
+
+async def test_ensure_variant_refuses_widths_above_the_recorded_source(uploads):
+    _image(uploads.root / "narrow.jpg", (500, 400))
+    await image_variants._record_width("narrow.jpg", 500)
+    fmt = VARIANT_FORMATS[0]
+
+    with pytest.raises(FileNotFoundError):
+        await image_variants.ensure_variant(f"narrow-640.{fmt}")
+    await image_variants.ensure_variant(f"narrow-320.{fmt}")
+
+    assert (uploads.root / "variants" / f"narrow-320.{fmt}").is_file()
+    assert not (uploads.root / "variants" / f"narrow-640.{fmt}").exists()
+
+
+async def test_ensure_variant_of_unrendered_upload_checks_the_source_width(uploads, db):
+    _image(uploads.root / "legacy.png", (500, 400))
+    fmt = VARIANT_FORMATS[0]
+
+    with pytest.raises(FileNotFoundError):
+        await image_variants.ensure_variant(f"legacy-1280.{fmt}")
+
+    assert not (uploads.root / "variants" / f"legacy-1280.{fmt}").exists()
+    # The width was recorded on the way, so the next request is refused without rendering
+    assert (await db[image_variants.IMAGES_COLLECTION].find_one({"_id": "legacy.png"}))["width"] == 500
+
+
+async def test_unknown_originals_are_probed_once(uploads):
+    fmt = VARIANT_FORMATS[0]
+    for _ in range(3):
+        with pytest.raises(FileNotFoundError):
+            await image_variants.ensure_variant(f"nothing-320.{fmt}")
+
+    assert uploads.checks == len(image_variants.ORIGINAL_EXTENSIONS)
+
+
+async def test_recorded_original_needs_no_probing(uploads):
+    _image(uploads.root / "known.jpg", (800, 600))
+    await image_variants._record_width("known.jpg", 800)
+
+    await image_variants.ensure_variant(f"known-320.{VARIANT_FORMATS[0]}")
+
+    # Only the variant itself was looked up
+    assert uploads.checks == 1
@@ -0,0 +1,52 @@
+import pytest
+from pymongo import ASCENDING
+
+import indexes
+
+pytestmark = pytest.mark.anyio
+
+# mongomock reports text indexes in its own shape, so drift is checked elsewhere
+COMPARABLE = [name for name in indexes.INDEXES if name != "contacts"]
+
+
+def _drift(report):
+    return {name: entry for name, entry in report.items() if name in COMPARABLE and any(entry.values())}
+
+
+async def test_fresh_database_reports_every_index_missing(db):
+    report = await indexes.index_drift(db)
+
+    assert indexes.has_drift(report)
+    for collection, declared in indexes.INDEXES.items():
+        assert report[collection] == {"missing": list(declared), "changed": [], "extra": []}
+
+
+async def test_ensure_indexes_creates_missing_ones(db):
+    await indexes.ensure_indexes(db)
+
+    assert _drift(await indexes.index_drift(db)) == {}
+
+
+async def test_changed_and_extra_indexes_are_reported_not_dropped(db):
+    await db.services.create_index([("order", ASCENDING)], name="order", unique=True)
+    await db.services.create_index([("title", ASCENDING)], name="title")
+
+    report = await indexes.ensure_indexes(db)
+
+    assert report["services"]["changed"] == ["order"]
+    assert report["services"]["extra"] == ["title"]
+    assert _drift(await indexes.index_drift(db)) == {"services": {"missing": [], "changed": ["order"], "extra": ["title"]}}
+
+
+async def test_rebuild_and_drop_extra_clear_the_drift(db):
+    await db.services.create_index([("order", ASCENDING)], name="order", unique=True)
+    await db.services.create_index([("title", ASCENDING)], name="title")
+
+    await indexes.ensure_indexes(db, rebuild_changed=True, drop_extra=True)
+
+    assert _drift(await indexes.index_drift(db)) == {}
+    assert "unique" not in (await db.services.index_information())["order"]
+
+
+def test_has_drift_is_false_for_a_clean_report():
+    assert not indexes.has_drift({"services": {"missing": [], "changed": [], "extra": []}})
@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import leases
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def leases_db(db):
+    leases.set_db(db)
+
+
+async def test_held_lease_cannot_be_taken(db):
+    holder = await leases.acquire("job", 60)
+
+    assert holder
+    assert await leases.acquire("job", 60) is None
+
+
+async def test_released_lease_can_be_taken_again(db):
+    holder = await leases.acquire("job", 60)
+
+    await leases.release("job", holder)
+
+    assert await leases.acquire("job", 60)
+
+
+async def test_lapsed_lease_is_taken_over_and_old_holder_cannot_release_it(db):
+    stale = await leases.acquire("job", 60)
+    await db[leases.LEASES_COLLECTION].update_one(
+        {"_id": "job"}, {"$set": {"until": datetime.utcnow() - timedelta(seconds=1)}})
+
+    current = await leases.acquire("job", 60)
+    assert current and current != stale
+
+    # The crashed worker finally gets to its finally block
+    await leases.release("job", stale)
+    assert await leases.acquire("job", 60) is None
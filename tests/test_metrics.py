@@ -0,0 +1,59 @@
+import metrics
+
+
+def _count(method, route, status):
+    return metrics.http_requests._values.get((method, route, status), 0)
+
+
+def test_counter_and_histogram_render_in_prometheus_format():
+    counter = metrics.Counter("test_events_total", "Events", ("kind",))
+    histogram = metrics.Histogram("test_latency_seconds", "Latency", buckets=(0.1, 1.0))
+    try:
+        counter.inc('say "hi"')
+        counter.inc('say "hi"', amount=2)
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        lines = metrics.render().decode().splitlines()
+    finally:
+        metrics._registry.remove(counter)
+        metrics._registry.remove(histogram)
+
+    assert "# TYPE test_events_total counter" in lines
+    assert 'test_events_total{kind="say \\"hi\\""} 3' in lines
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert "test_latency_seconds_count 3" in lines
+
+
+def test_requests_are_labelled_by_route_template(client, admin_headers):
+    route = "/api/admin/services/{service_id}"
+    before = _count("PUT", route, 404)
+
+    for service_id in ("a", "b", "c"):
+        client.put(f"/api/admin/services/{service_id}", json={"title": "x"}, headers=admin_headers)
+
+    assert _count("PUT", route, 404) == before + 3
+    assert not any("/api/admin/services/a" in labels for labels in metrics.http_requests._values)
+
+
+def test_unmatched_paths_and_uploads_share_one_label_each(client):
+    unmatched, uploads = _count("GET", "unmatched", 404), _count("GET", "/api/uploads", 404)
+
+    client.get("/wp-login.php")
+    client.get("/.env")
+    client.get("/api/uploads/missing.png")
+
+    assert _count("GET", "unmatched", 404) == unmatched + 2
+    assert _count("GET", "/api/uploads", 404) == uploads + 1
+
+
+def test_metrics_endpoint_serves_the_registry(client):
+    client.get("/health")
+
+    response = client.get("/metrics")
+
+    assert response.headers["content-type"] == metrics.CONTENT_TYPE
+    assert 'http_requests_total{method="GET",route="/health",status="200"}' in response.text
@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import config
+import email_transport
+import outbox
+from email_service import EmailError
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeMailer(email_transport.Transport):
+    """Records delivered payloads, or fails with `error` when it is set"""
+
+    def __init__(self):
+        self.delivered = []
+        self.sent = []
+        self.error = None
+
+    async def send(self, params):
+        if self.error:
+            raise EmailError(self.error)
+        self.sent.append(params)
+        return f"fake-{len(self.sent)}"
+
+    async def deliver(self, payload):
+        if self.error:
+            raise EmailError(self.error)
+        self.delivered.append(payload)
+
+
+@pytest.fixture
+def mailer(db, monkeypatch):
+    outbox.set_db(db)
+    mailer = FakeMailer()
+    monkeypatch.setattr(outbox, "deliver_contact_email", mailer.deliver)
+    monkeypatch.setattr(email_transport, "_transport", mailer)
+    return mailer
+
+
+async def _job(db, **fields):
+    job_id = await outbox.enqueue_contact_email({"name": "Jo", "email": "jo@example.com", "subject": "Devis"})
+    if fields:
+        await db[outbox.OUTBOX_COLLECTION].update_one({"id": job_id}, {"$set": fields})
+    return job_id
+
+
+async def _get(db, job_id):
+    return await db[outbox.OUTBOX_COLLECTION].find_one({"id": job_id})
+
+
+async def test_claim_takes_due_job_and_leases_it(db, mailer):
+    job_id = await _job(db)
+
+    job = await outbox._claim()
+
+    assert job["id"] == job_id
+    assert job["status"] == outbox.PROCESSING
+    assert job["attempts"] == 1
+    assert job["lease_until"] > datetime.utcnow()
+    # Leased, so nobody else gets it
+    assert await outbox._claim() is None
+
+
+async def test_claim_skips_future_and_digest_jobs(db, mailer):
+    await _job(db, next_attempt_at=datetime.utcnow() + timedelta(minutes=5))
+    await _job(db, digest=True)
+
+    assert await outbox._claim() is None
+
+
+async def test_claim_takes_over_expired_lease(db, mailer):
+    job_id = await _job(db, status=outbox.PROCESSING, attempts=1,
+                        lease_until=datetime.utcnow() - timedelta(seconds=1))
+
+    job = await outbox._claim()
+
+    assert job["id"] == job_id
+    assert job["attempts"] == 2
+
+
+async def test_successful_send_marks_job_sent(db, mailer):
+    job_id = await _job(db)
+
+    await outbox._process([await outbox._claim()])
+
+    job = await _get(db, job_id)
+    assert job["status"] == outbox.SENT
+    assert "lease_until" not in job
+    assert [payload["email"] for payload in mailer.delivered] == ["jo@example.com"]
+
+
+async def test_missing_transport_skips_job_without_failing(db, mailer, monkeypatch):
+    monkeypatch.setattr(email_transport, "_transport", None)
+    job_id = await _job(db)
+
+    await outbox._process([await outbox._claim()])
+
+    job = await _get(db, job_id)
+    assert (job["status"], job["last_error"]) == (outbox.SKIPPED, None)
+    assert mailer.delivered == []
+    assert await outbox._claim() is None
+    stats = await outbox.stats()
+    assert stats["counts"][outbox.SKIPPED] == 1
+    assert stats["depth"] == 0
+    assert stats["failures"] == []
+
+
+async def test_failed_send_backs_off(db, mailer):
+    job_id = await _job(db)
+    mailer.error = "HTTP 500: boom"
+
+    # Mongo keeps milliseconds
+    before = datetime.utcnow().replace(microsecond=0)
+    await outbox._process([await outbox._claim()])
+
+    job = await _get(db, job_id)
+    assert job["status"] == outbox.PENDING
+    assert job["last_error"] == "HTTP 500: boom"
+    assert job["next_attempt_at"] >= before + timedelta(seconds=outbox.backoff_delay(1))
+    assert await outbox._claim() is None
+
+
+def test_backoff_doubles_up_to_the_cap():
+    delays = [outbox.backoff_delay(attempts) for attempts in range(1, 20)]
+
+    assert delays[1] == 2 * delays[0]
+    assert delays == sorted(delays)
+    assert delays[-1] == config.get_settings().outbox_backoff_max_seconds
+
+
+async def test_last_attempt_dead_letters_and_retry_revives(db, mailer):
+    job_id = await _job(db, attempts=config.get_settings().outbox_max_attempts - 1)
+    mailer.error = "HTTP 500: boom"
+
+    await outbox._process([await outbox._claim()])
+
+    assert (await _get(db, job_id))["status"] == outbox.DEAD
+    stats = await outbox.stats()
+    assert stats["counts"][outbox.DEAD] == 1
+    assert stats["failures"][0]["id"] == job_id
+
+    assert await outbox.retry(job_id)
+    job = await _get(db, job_id)
+    assert (job["status"], job["attempts"]) == (outbox.PENDING, 0)
+    assert not await outbox.retry(job_id)
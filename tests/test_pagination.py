@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from pagination import CONTACT_SORT, after_cursor, combine, contact_filter, decode_cursor, encode_cursor
+
+pytestmark = pytest.mark.anyio
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123000)
+
+    assert decode_cursor(encode_cursor(created_at, "abc")) == (created_at, "abc")
+
+
+def test_cursor_is_stored_as_naive_utc():
+    aware = datetime(2024, 5, 1, 14, 0, tzinfo=timezone(timedelta(hours=2)))
+
+    assert decode_cursor(encode_cursor(aware, "abc"))[0] == datetime(2024, 5, 1, 12, 0)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-base64!", encode_cursor(datetime(2024, 1, 1), "x")[:-3]])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+async def test_pages_cover_every_document_once(db):
+    start = datetime(2024, 1, 1)
+    # Pairs of documents share a timestamp, so the id breaks the tie
+    docs = [{"id": f"{i:03d}", "created_at": start + timedelta(minutes=i // 2), "subject": "Devis"} for i in range(25)]
+    await db.contacts.insert_many(docs)
+
+    seen, cursor = [], None
+    while True:
+        query = combine(contact_filter(subject="Devis"), after_cursor(cursor) if cursor else {})
+        page = await db.contacts.find(query, {"_id": 0}).sort(CONTACT_SORT).limit(10).to_list(10)
+        seen.extend(doc["id"] for doc in page)
+        if len(page) < 10:
+            break
+        cursor = encode_cursor(page[-1]["created_at"], page[-1]["id"])
+
+    assert seen == sorted((doc["id"] for doc in docs), reverse=True)
@@ -0,0 +1,126 @@
+import pytest
+from starlette.requests import Request
+
+import rate_limit
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+async def test_bucket_allows_burst_then_refills(clock):
+    backend = rate_limit.MemoryBackend(maxsize=100)
+    per_second = 1 / 60
+
+    assert [await backend.take("k", 3, per_second) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert await backend.take("k", 3, per_second) == pytest.approx(60)
+
+    clock.now += 30
+    assert await backend.take("k", 3, per_second) == pytest.approx(30)
+    clock.now += 30
+    assert await backend.take("k", 3, per_second) == 0.0
+
+
+async def test_buckets_are_per_key(clock):
+    backend = rate_limit.MemoryBackend(maxsize=100)
+
+    assert await backend.take("a", 1, 1) == 0.0
+    assert await backend.take("a", 1, 1) > 0
+    assert await backend.take("b", 1, 1) == 0.0
+
+
+async def test_memory_backend_is_bounded(clock):
+    backend = rate_limit.MemoryBackend(maxsize=2)
+
+    for key in ("a", "b", "c"):
+        await backend.take(key, 1, 1)
+
+    assert list(backend._buckets) == ["b", "c"]
+
+
+async def test_check_contact_limits_ip_then_email(clock, monkeypatch, settings):
+    monkeypatch.setattr(rate_limit, "_backend", rate_limit.MemoryBackend(maxsize=100))
+    settings(contact_ip_burst=10, contact_email_burst=2)
+
+    results = [await rate_limit.check_contact("1.2.3.4", " Jo@Example.com") for _ in range(2)]
+    assert results == [0.0, 0.0]
+    # Same address, different case: same bucket
+    assert await rate_limit.check_contact("5.6.7.8", "jo@example.com") > 0
+
+
+def test_fingerprint_ignores_case_and_whitespace():
+    a = {"name": "Jo", "email": "JO@example.com", "message": "Bonjour,\n  un devis svp"}
+    b = {"name": " jo ", "email": "jo@example.com", "message": "Bonjour, un devis   svp"}
+
+    assert rate_limit.contact_fingerprint(a) == rate_limit.contact_fingerprint(b)
+    assert rate_limit.contact_fingerprint(a) != rate_limit.contact_fingerprint({**a, "message": "Autre"})
+
+
+async def test_memory_dedupe_within_window(clock):
+    backend = rate_limit.MemoryBackend(maxsize=100)
+
+    assert await backend.remember("fp", "first", 60) is None
+    assert await backend.remember("fp", "second", 60) == "first"
+    clock.now += 61
+    assert await backend.remember("fp", "third", 60) is None
+
+
+async def test_mongo_dedupe_returns_first_id(db, monkeypatch):
+    monkeypatch.setattr(rate_limit, "db", db)
+    backend = rate_limit.MongoBackend()
+
+    assert await backend.remember("fp", "first", 60) is None
+    assert await backend.remember("fp", "second", 60) == "first"
+
+
+@pytest.mark.parametrize("make_backend", [lambda: rate_limit.MemoryBackend(maxsize=100), rate_limit.MongoBackend])
+async def test_forgotten_submission_can_be_sent_again(db, clock, monkeypatch, make_backend):
+    monkeypatch.setattr(rate_limit, "db", db)
+    monkeypatch.setattr(rate_limit, "_backend", make_backend())
+    contact = {"name": "Jo", "email": "jo@example.com", "message": "Bonjour"}
+    assert await rate_limit.find_duplicate(contact, "lost") is None
+
+    # Only the submission that recorded the fingerprint may remove it
+    await rate_limit.forget_duplicate(contact, "other")
+    assert await rate_limit.find_duplicate(contact, "retry") == "lost"
+
+    await rate_limit.forget_duplicate(contact, "lost")
+    assert await rate_limit.find_duplicate(contact, "retry") is None
+
+
+@pytest.mark.parametrize("hops, forwarded, expected", [
+    (0, "9.9.9.9", "10.0.0.1"),
+    (1, "9.9.9.9, 8.8.8.8", "8.8.8.8"),
+    (2, "9.9.9.9, 8.8.8.8", "9.9.9.9"),
+    (3, "8.8.8.8", "8.8.8.8"),
+])
+def test_client_ip_trusts_only_configured_hops(settings, hops, forwarded, expected):
+    settings(trusted_proxy_hops=hops)
+    request = Request({"type": "http", "headers": [(b"x-forwarded-for", forwarded.encode())],
+                       "client": ("10.0.0.1", 1234)})
+
+    assert rate_limit.client_ip(request) == expected
+
+
+@pytest.mark.parametrize("name, backend_type", [("memory", rate_limit.MemoryBackend), ("mongo", rate_limit.MongoBackend)])
+def test_backend_is_created_from_settings(monkeypatch, settings, name, backend_type):
+    monkeypatch.setattr(rate_limit, "_backend", None)
+    settings(rate_limit_backend=name)
+
+    backend = rate_limit.get_backend()
+
+    assert type(backend) is backend_type
+    assert rate_limit.get_backend() is backend
@@ -0,0 +1,46 @@
+from search import highlight_pattern, highlights, query_terms
+
+
+def _marked(doc, query):
+    """The highlighted substrings per field"""
+    spans = highlights(doc, highlight_pattern(query_terms(query)))
+    return {field: [doc[field][start:end] for start, end in ranges] for field, ranges in spans.items()}
+
+
+def test_query_terms_keeps_phrases_and_drops_negations():
+    assert query_terms('devis "salle de bain" -spam  ') == ["devis", "salle de bain"]
+    assert query_terms("-spam") == []
+    assert highlight_pattern([]) is None
+
+
+def test_highlights_ignore_case_and_accents():
+    doc = {"name": "Jo", "message": "Un DÉMÉNAGEMENT puis un demenagement."}
+
+    assert _marked(doc, "déménagement") == {"message": ["DÉMÉNAGEMENT", "demenagement"]}
+
+
+def test_highlights_cover_other_forms_of_a_word():
+    doc = {"subject": "Déménagements urgents"}
+
+    assert _marked(doc, "déménagement") == {"subject": ["Déménagements"]}
+
+
+def test_highlights_match_whole_phrases_only():
+    doc = {"message": "Rénover la salle  de bain, pas la salle à manger"}
+
+    assert _marked(doc, '"salle de bain"') == {"message": ["salle  de bain"]}
+
+
+def test_highlights_start_at_word_boundaries():
+    doc = {"name": "Devisme", "message": "Un devis, pas un prédevis"}
+
+    assert _marked(doc, "devis") == {"name": ["Devisme"], "message": ["devis"]}
+
+
+def test_offsets_stay_aligned_with_the_original_text():
+    doc = {"message": "Œuvre ﬁne: réparation"}
+
+    spans = highlights(doc, highlight_pattern(["réparation"]))
+
+    start, end = spans["message"][0]
+    assert doc["message"][start:end] == "réparation"
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+import seeding
+from seeding import ADOPT, DELETE, EDITED, INSERT, UNCHANGED, UPDATE, checksum, plan, seed_collection
+
+pytestmark = pytest.mark.anyio
+
+
+def _seeded(fields: dict, **overrides) -> dict:
+    """A stored document as the seeder wrote it from `fields`, then changed by `overrides`"""
+    return {"id": "1", "seed_key": "k", seeding.SEED_CHECKSUM: checksum(fields), **fields, **overrides}
+
+
+def test_plan_inserts_new_fixture():
+    assert plan({"seed_key": "k", "title": "A"}, None)[0] == INSERT
+
+
+def test_plan_leaves_identical_document():
+    assert plan({"seed_key": "k", "title": "A"}, _seeded({"title": "A"})) == (UNCHANGED, {})
+
+
+def test_plan_updates_unedited_document():
+    action, changes = plan({"seed_key": "k", "title": "B"}, _seeded({"title": "A"}))
+
+    assert action == UPDATE
+    assert changes == {"title": ("A", "B")}
+
+
+def test_plan_keeps_edited_document_unless_forced():
+    fixture = {"seed_key": "k", "title": "B"}
+    current = _seeded({"title": "A"}, title="Edited")
+
+    assert plan(fixture, current)[0] == EDITED
+    assert plan(fixture, current, force=True)[0] == UPDATE
+
+
+@pytest.mark.parametrize("fixture", [
+    {"seed_key": "k", "title": "A", "order": 1, "description": "New field"},
+    {"seed_key": "k", "title": "B"},
+])
+def test_plan_updates_unedited_document_when_fields_are_added_or_dropped(fixture):
+    current = _seeded({"title": "A", "order": 1})
+
+    assert plan(fixture, current)[0] == UPDATE
+
+
+def test_plan_adopts_matching_legacy_document():
+    legacy = {"id": "1", "title": "A"}
+
+    assert plan({"seed_key": "k", "title": "A"}, legacy)[0] == ADOPT
+    assert plan({"seed_key": "k", "title": "A", "order": 2}, legacy)[0] == EDITED
+
+
+def _write(path, fixtures):
+    path.write_text("".join(json.dumps(fixture) + "\n" for fixture in fixtures), encoding="utf-8")
+
+
+async def test_seed_collection_is_idempotent(db, tmp_path):
+    path = tmp_path / "services.ndjson"
+    _write(path, [{"seed_key": f"s{i}", "title": f"Service {i}", "order": i} for i in range(5)])
+
+    first = await seed_collection(db, "services", path, batch_size=2, report=lambda line: None)
+    second = await seed_collection(db, "services", path, batch_size=2, report=lambda line: None)
+
+    assert first == {INSERT: 5}
+    assert second == {UNCHANGED: 5}
+    assert await db.services.count_documents({}) == 5
+
+
+async def test_seed_collection_prunes_only_unedited(db, tmp_path):
+    path = tmp_path / "services.ndjson"
+    _write(path, [{"seed_key": "a", "title": "A"}, {"seed_key": "b", "title": "B"}, {"seed_key": "c", "title": "C"}])
+    await seed_collection(db, "services", path, report=lambda line: None)
+    await db.services.update_one({"seed_key": "b"}, {"$set": {"title": "Edited"}})
+
+    _write(path, [{"seed_key": "a", "title": "A"}])
+    counts = await seed_collection(db, "services", path, prune=True, report=lambda line: None)
+
+    assert counts == {UNCHANGED: 1, EDITED: 1, DELETE: 1}
+    assert sorted([doc["seed_key"] async for doc in db.services.find({})]) == ["a", "b"]
+
+
+async def test_dropped_fixture_field_is_removed(db, tmp_path):
+    path = tmp_path / "services.ndjson"
+    _write(path, [{"seed_key": "a", "title": "A", "icon": "truck"}])
+    await seed_collection(db, "services", path, report=lambda line: None)
+
+    _write(path, [{"seed_key": "a", "title": "A", "order": 1}])
+    counts = await seed_collection(db, "services", path, report=lambda line: None)
+
+    assert counts == {UPDATE: 1}
+    doc = await db.services.find_one({"seed_key": "a"}, {"_id": 0})
+    assert "icon" not in doc and doc["order"] == 1
+    assert await seed_collection(db, "services", path, report=lambda line: None) == {UNCHANGED: 1}
+
+
+async def test_dry_run_writes_nothing(db, tmp_path):
+    path = tmp_path / "gallery.ndjson"
+    _write(path, [{"seed_key": "g", "title": "G"}])
+
+    counts = await seed_collection(db, "gallery", path, dry_run=True, report=lambda line: None)
+
+    assert counts == {INSERT: 1}
+    assert await db.gallery.count_documents({}) == 0
+
+
+def test_fixture_without_seed_key_is_rejected(tmp_path):
+    path = tmp_path / "services.ndjson"
+    _write(path, [{"title": "A"}])
+
+    with pytest.raises(ValueError, match="services.ndjson:1"):
+        list(seeding.read_fixtures(path, 10))
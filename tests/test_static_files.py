@@ -0,0 +1,108 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+from image_variants import VARIANTS_PREFIX
+from static_files import UploadsStaticFiles, accepted_types, parse_range
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    (tmp_path / "photo.jpg").write_bytes(b"jpeg")
+    (tmp_path / VARIANTS_PREFIX).mkdir()
+    (tmp_path / VARIANTS_PREFIX / "photo.avif").write_bytes(b"avif")
+    (tmp_path / VARIANTS_PREFIX / "photo.webp").write_bytes(b"webp")
+    return tmp_path
+
+
+@pytest.fixture
+def client(uploads):
+    app = Starlette()
+    app.mount("/api/uploads", UploadsStaticFiles(directory=str(uploads)), name="uploads")
+    return TestClient(app)
+
+
+def test_accepted_types_reads_q_values():
+    assert accepted_types("image/avif;q=0, image/webp;q=0.8, image/*, */*;q=0.1") == {"image/webp": 0.8}
+    assert accepted_types("IMAGE/WebP ; q=1.0") == {"image/webp": 1.0}
+    assert accepted_types("image/avif;q=bogus") == {}
+
+
+@pytest.mark.parametrize("accept, body, media_type", [
+    ("image/avif,image/webp,*/*", b"avif", "image/avif"),
+    ("image/avif;q=0, image/webp", b"webp", "image/webp"),
+    ("image/avif;q=0.5, image/webp;q=0.9", b"webp", "image/webp"),
+    ("image/avifx, image/webpish", b"jpeg", "image/jpeg"),
+    ("image/*, */*", b"jpeg", "image/jpeg"),
+    ("", b"jpeg", "image/jpeg"),
+])
+def test_re_encoded_sibling_follows_accept(client, accept, body, media_type):
+    response = client.get("/api/uploads/photo.jpg", headers={"accept": accept})
+    assert response.status_code == 200
+    assert response.content == body
+    assert response.headers["content-type"] == media_type
+    assert "Accept" in response.headers["vary"]
+
+
+def test_missing_re_encode_falls_back_to_the_next_type(client, uploads):
+    (uploads / VARIANTS_PREFIX / "photo.avif").unlink()
+    response = client.get("/api/uploads/photo.jpg", headers={"accept": "image/avif,image/webp"})
+    assert response.content == b"webp"
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-3", (0, 3)),
+    ("bytes=6-", (6, 9)),
+    ("bytes=-4", (6, 9)),
+    ("bytes=8-100", (8, 9)),
+    ("bytes=0-1,4-5", None),
+    ("items=0-1", None),
+    ("bytes=5-2", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 10) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=10-", "bytes=-0"])
+def test_parse_range_rejects_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 10)
+
+
+def test_range_request_gets_partial_content(client, uploads):
+    (uploads / "notes.txt").write_bytes(b"0123456789")
+
+    response = client.get("/api/uploads/notes.txt", headers={"range": "bytes=2-5"})
+
+    assert response.status_code == 206
+    assert response.content == b"2345"
+    assert response.headers["content-range"] == "bytes 2-5/10"
+    assert response.headers["content-length"] == "4"
+
+
+def test_unsatisfiable_range_gets_416(client, uploads):
+    (uploads / "notes.txt").write_bytes(b"0123456789")
+
+    response = client.get("/api/uploads/notes.txt", headers={"range": "bytes=20-"})
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */10"
+
+
+def test_stale_if_range_gets_the_whole_file(client, uploads):
+    (uploads / "notes.txt").write_bytes(b"0123456789")
+    etag = client.get("/api/uploads/notes.txt").headers["etag"]
+
+    fresh = client.get("/api/uploads/notes.txt", headers={"range": "bytes=0-1", "if-range": etag})
+    stale = client.get("/api/uploads/notes.txt", headers={"range": "bytes=0-1", "if-range": '"other"'})
+
+    assert (fresh.status_code, fresh.content) == (206, b"01")
+    assert (stale.status_code, stale.content) == (200, b"0123456789")
+
+
+def test_matching_etag_gets_304(client):
+    etag = client.get("/api/uploads/photo.jpg").headers["etag"]
+
+    response = client.get("/api/uploads/photo.jpg", headers={"if-none-match": etag})
+
+    assert response.status_code == 304
@@ -0,0 +1,184 @@
+import os
+import time
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import storage
+from file_upload import STATIC_URL, UnsupportedFileTypeError, UploadTooLargeError, store_chunks
+
+pytestmark = pytest.mark.anyio
+
+BUCKET = "belkgroup-test"
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+
+
+async def _chunks(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+# ==================== LOCAL ====================
+
+@pytest.fixture
+def local(tmp_path, monkeypatch):
+    backend = storage.LocalStorage(tmp_path)
+    monkeypatch.setattr(storage, "_backend", backend)
+    return backend
+
+
+def _files(root):
+    return sorted(p.name for p in root.iterdir())
+
+
+async def test_local_writer_stores_under_content_hash(local):
+    url, size = await store_chunks(_chunks(PNG[:50], PNG[50:]))
+
+    name = url[len(STATIC_URL) + 1:]
+    assert name.endswith(".png")
+    assert size == len(PNG)
+    assert _files(local.root) == [name]
+    assert (local.root / name).read_bytes() == PNG
+
+
+async def test_local_duplicate_upload_touches_existing_file(local):
+    url, _ = await store_chunks(_chunks(PNG))
+    path = local.root / url.rsplit("/", 1)[1]
+    os.utime(path, (0, 0))
+
+    assert (await store_chunks(_chunks(PNG)))[0] == url
+    assert time.time() - path.stat().st_mtime < 60
+    assert _files(local.root) == [path.name]
+
+
+@pytest.mark.parametrize("chunks, error", [
+    ((b"not an image",), UnsupportedFileTypeError),
+    ((), UnsupportedFileTypeError),
+])
+async def test_local_rejected_upload_leaves_nothing(local, chunks, error):
+    with pytest.raises(error):
+        await store_chunks(_chunks(*chunks))
+
+    assert _files(local.root) == []
+
+
+async def test_local_oversized_upload_is_discarded(local, settings):
+    settings(max_upload_bytes=150)
+
+    with pytest.raises(UploadTooLargeError):
+        await store_chunks(_chunks(PNG, PNG))
+
+    assert _files(local.root) == []
+
+
+async def test_local_delete_respects_min_age(local):
+    (local.root / "old.jpg").write_bytes(b"x")
+    os.utime(local.root / "old.jpg", (0, 0))
+    (local.root / "new.jpg").write_bytes(b"x")
+    files = [(name, 1, 0.0) for name in ("old.jpg", "new.jpg", "missing.jpg")]
+
+    deleted = await local.delete("", files, min_age=3600)
+
+    assert [name for name, _, _ in deleted] == ["old.jpg"]
+    assert _files(local.root) == ["new.jpg"]
+
+
+# ==================== S3 ====================
+
+@pytest.fixture
+def s3(monkeypatch, settings):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    # The smallest part size S3 accepts, so a 9 MiB upload takes two parts
+    settings(s3_bucket=BUCKET, s3_public_url="", s3_part_size=storage.S3_MIN_PART_SIZE)
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        backend = storage.S3Storage(client)
+        monkeypatch.setattr(storage, "_backend", backend)
+        yield backend
+
+
+def _keys(client):
+    return sorted(obj["Key"] for obj in client.list_objects_v2(Bucket=BUCKET).get("Contents", []))
+
+
+async def test_s3_small_upload_is_a_single_put(s3):
+    url, _ = await store_chunks(_chunks(PNG))
+
+    name = url.rsplit("/", 1)[1]
+    assert _keys(s3.client) == [s3.key(name)]
+    head = s3.client.head_object(Bucket=BUCKET, Key=s3.key(name))
+    assert head["ContentType"] == "image/png"
+    assert head["CacheControl"] == storage.IMMUTABLE
+
+
+async def test_s3_large_upload_goes_multipart_and_lands_under_final_name(s3):
+    body = PNG + os.urandom(9 * 1024 * 1024)
+    chunks = [body[i:i + 1024 * 1024] for i in range(0, len(body), 1024 * 1024)]
+
+    url, size = await store_chunks(_chunks(*chunks))
+
+    name = url.rsplit("/", 1)[1]
+    assert size == len(body)
+    # The temporary multipart key is gone
+    assert _keys(s3.client) == [s3.key(name)]
+    assert s3.client.get_object(Bucket=BUCKET, Key=s3.key(name))["Body"].read() == body
+    assert not s3.client.list_multipart_uploads(Bucket=BUCKET).get("Uploads")
+
+
+async def test_s3_aborted_multipart_leaves_nothing(s3, settings):
+    settings(max_upload_bytes=7 * 1024 * 1024)
+    chunks = [PNG] + [b"\x00" * 1024 * 1024] * 8
+
+    with pytest.raises(UploadTooLargeError):
+        await store_chunks(_chunks(*chunks))
+
+    assert _keys(s3.client) == []
+    assert not s3.client.list_multipart_uploads(Bucket=BUCKET).get("Uploads")
+
+
+async def test_s3_list_and_delete(s3):
+    for key in ("a.jpg", "b.jpg", "variants/a-320.webp"):
+        s3.client.put_object(Bucket=BUCKET, Key=s3.key(key), Body=b"xy")
+
+    top = [info async for batch in s3.list("") for info in batch]
+    assert sorted(name for name, _, _ in top) == ["a.jpg", "b.jpg"]
+    assert all(size == 2 for _, size, _ in top)
+
+    deleted = await s3.delete("variants/", [("a-320.webp", 2, 0.0)])
+    assert [name for name, _, _ in deleted] == ["a-320.webp"]
+    assert _keys(s3.client) == [s3.key("a.jpg"), s3.key("b.jpg")]
+
+
+async def test_s3_url_prefers_public_base(s3, monkeypatch):
+    assert BUCKET in s3.url("a.jpg") and "Signature" in s3.url("a.jpg")
+
+    monkeypatch.setattr(s3, "public_url", "https://cdn.example.com")
+    assert s3.url("a.jpg") == f"https://cdn.example.com/{s3.key('a.jpg')}"
+
+
+def test_s3_settings_are_read_when_the_backend_is_created(settings):
+    settings(s3_bucket="", s3_prefix="site/", s3_part_size=1024)
+    with pytest.raises(RuntimeError, match="S3_BUCKET"):
+        storage.S3Storage(client=object())
+
+    settings(s3_bucket=BUCKET)
+    backend = storage.S3Storage(client=object())
+    assert backend.key("a.jpg") == "site/a.jpg"
+    # Raised to what S3 accepts
+    assert backend.part_size == storage.S3_MIN_PART_SIZE
+
+
+async def test_s3_delete_keeps_objects_touched_since_listing(s3):
+    url, _ = await store_chunks(_chunks(PNG))
+    name = url.rsplit("/", 1)[1]
+    # The GC listed it as an old orphan just before an upload of the same bytes touched it
+    listed = [(name, len(PNG), 0.0), ("gone.png", 1, 0.0)]
+
+    assert await s3.delete("", listed, min_age=3600) == []
+    assert _keys(s3.client) == [s3.key(name)]
+
+    assert [info[0] for info in await s3.delete("", listed[:1])] == [name]
+    assert _keys(s3.client) == []
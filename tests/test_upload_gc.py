@@ -0,0 +1,118 @@
+import os
+import time
+
+import pytest
+
+import storage
+import upload_gc
+from file_upload import STATIC_URL
+from image_mirror import MIRRORS_COLLECTION
+from image_variants import VARIANTS_PREFIX
+
+pytestmark = pytest.mark.anyio
+
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def uploads(db, tmp_path, monkeypatch):
+    """Local storage in a temporary directory, with a helper creating files of a given age"""
+    (tmp_path / VARIANTS_PREFIX).mkdir()
+    monkeypatch.setattr(storage, "_backend", storage.LocalStorage(tmp_path))
+    upload_gc.set_db(db)
+
+    def create(name: str, age: float = 2 * DAY, size: int = 10):
+        path = tmp_path / name
+        path.write_bytes(b"x" * size)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    create.root = tmp_path
+    return create
+
+
+async def test_deletes_old_unreferenced_files_and_their_variants(db, uploads):
+    await db.services.insert_one({"id": "s", "image": f"{STATIC_URL}/kept.jpg"})
+    await db.gallery.insert_one({"id": "g", "image": "/uploads/legacy.png", "image_before": "https://cdn/x.jpg"})
+    for name in ("kept.jpg", "legacy.png", "orphan.jpg"):
+        uploads(name)
+    for name in ("kept-320.webp", "kept.webp", "orphan-320.webp", "orphan-640.avif", "gone-320.webp"):
+        uploads(VARIANTS_PREFIX + name)
+
+    report = await upload_gc.collect(grace_seconds=DAY)
+
+    remaining = sorted(str(p.relative_to(uploads.root)) for p in uploads.root.rglob("*") if p.is_file())
+    assert remaining == ["kept.jpg", "legacy.png", "variants/kept-320.webp", "variants/kept.webp"]
+    assert report["referenced"] == 2
+    assert report[upload_gc.ORIGINAL] == 1
+    assert report[upload_gc.VARIANT] == 3
+    assert report["bytes"] == 40
+
+
+async def test_precompressed_siblings_follow_their_original(db, uploads):
+    await db.services.insert_one({"id": "s", "image": f"{STATIC_URL}/logo.svg"})
+    for name in ("logo.svg", "logo.svg.br", "logo.svg.gz", "old.svg", "old.svg.br", "stray.svg.gz"):
+        uploads(name)
+    uploads("fresh.svg", age=60)
+    uploads("fresh.svg.gz")
+
+    report = await upload_gc.collect(grace_seconds=DAY)
+
+    remaining = sorted(p.name for p in uploads.root.iterdir() if p.is_file())
+    assert remaining == ["fresh.svg", "fresh.svg.gz", "logo.svg", "logo.svg.br", "logo.svg.gz"]
+    assert report[upload_gc.ORIGINAL] == 1
+    assert report[upload_gc.COMPRESSED] == 2
+
+
+async def test_grace_period_keeps_recent_files_and_their_variants(db, uploads):
+    uploads("fresh.jpg", age=60)
+    uploads(VARIANTS_PREFIX + "fresh-320.webp")
+    uploads(".upload-crashed", age=60)
+    uploads(".upload-old")
+
+    report = await upload_gc.collect(grace_seconds=DAY)
+
+    assert (uploads.root / "fresh.jpg").exists()
+    assert (uploads.root / VARIANTS_PREFIX / "fresh-320.webp").exists()
+    assert (uploads.root / ".upload-crashed").exists()
+    assert not (uploads.root / ".upload-old").exists()
+    assert report["kept_recent"] == 1
+    assert report[upload_gc.TEMPORARY] == 1
+
+
+async def test_file_referenced_during_sweep_is_kept(db, uploads, monkeypatch):
+    uploads("late.jpg")
+
+    async def referenced_before_save():
+        # The sweep read the collections just before an admin saved a form using late.jpg
+        await db.services.insert_one({"id": "s", "image": f"{STATIC_URL}/late.jpg"})
+        return set()
+
+    monkeypatch.setattr(upload_gc, "referenced_files", referenced_before_save)
+
+    report = await upload_gc.collect(grace_seconds=DAY)
+
+    assert (uploads.root / "late.jpg").exists()
+    assert report[upload_gc.ORIGINAL] == 0
+
+
+async def test_dry_run_deletes_nothing(db, uploads):
+    uploads("orphan.jpg")
+
+    report = await upload_gc.collect(grace_seconds=DAY, dry_run=True)
+
+    assert report[upload_gc.ORIGINAL] == 1
+    assert (uploads.root / "orphan.jpg").exists()
+
+
+async def test_deleted_mirror_copies_are_fetched_again(db, uploads):
+    uploads("mirrored.jpg")
+    await db[MIRRORS_COLLECTION].insert_one(
+        {"_id": "https://cdn/a.jpg", "local_url": f"{STATIC_URL}/mirrored.jpg", "etag": '"v1"'})
+
+    await upload_gc.collect(grace_seconds=DAY)
+
+    record = await db[MIRRORS_COLLECTION].find_one({"_id": "https://cdn/a.jpg"})
+    assert record["local_url"] is None
+    assert record["etag"] is None